@@ -1,13 +1,37 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, g, request, jsonify, send_file
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 import os
+import json
+import shutil
+import tempfile
+import zipfile
 from datetime import datetime
+import threading
+import time
 import uuid
-from segmentation_module import SegmentationModel
-from iot_module import BlueGuardIoT
+from startup_module import StartupReport, ModelLoader, ModelNotReadyError
 from dotenv import load_dotenv
 import logging
+
+# Time each startup phase; reported by /startup
+startup_report = StartupReport()
+
+with startup_report.phase("import_app_modules"):
+    from jobs_module import JobQueue, QueueFullError
+    from batch_module import BatchPredictor
+    from encoding_module import OutputOptions, InvalidOutputOptions, FORMATS, MIME_TYPES
+    from storage_module import OutputStore
+    from metrics_module import REGISTRY, StageTimer
+    from client_module import InferenceUnavailableError
+    from cache_module import InferenceCache
+    from singleflight_module import SingleFlight
+    from timeseries_module import TimeSeriesStore, InvalidRangeQuery
+    from devices_module import DeviceRegistry, UnknownDeviceError, InvalidDeviceConfig
+    from history_module import to_epoch
+    from tiling_module import ImageTooLargeError
+
 # Load environment variables
 load_dotenv()
 
@@ -51,6 +75,7 @@ CORS(app,
     origins=allowed_origins,
     methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
     allow_headers=['Content-Type', 'Authorization'],
+    expose_headers=['X-Prediction-Result'],  # metadata of response_format=image
     supports_credentials=True  # If you need cookies/auth
 )
 # File storage configuration for Render
@@ -72,15 +97,188 @@ app.config['OUTPUT_FOLDER'] = OUTPUT_DIR
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
 
+# Uploads up to this size are processed in memory; larger ones are spooled
+# to UPLOAD_FOLDER
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD_MB', '32')) * 1024 * 1024
+
+
+class UploadRequest(Request):
+    """
+    Request whose uploaded files stay in memory up to UPLOAD_SPOOL_THRESHOLD
+    while the form is parsed; Werkzeug's default spools every part over
+    500 KB to a temporary file.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD, mode='rb+')
+
+
+app.request_class = UploadRequest
+
+# Default for the 'tiled' form field of the predict endpoints: true, false
+# or auto (tile images whose long side is at least TILE_AUTO_MIN_SIDE)
+TILED_DEFAULT = os.getenv('TILED_DEFAULT', 'false').lower()
+
+# Default encoding of annotated images (OUTPUT_FORMAT, OUTPUT_QUALITY,
+# OUTPUT_MAX_DIMENSION, OUTPUT_PROGRESSIVE, OUTPUT_THUMBNAIL_SIZE); each
+# request may override it with form fields
+OUTPUT_DEFAULTS = OutputOptions.from_env()
+
+# How /predict returns the annotated image: json (a download URL), image
+# (the image as the body, metadata in the X-Prediction-Result header) or
+# multipart (a form-data body with the JSON result and the image parts)
+RESPONSE_FORMATS = ('json', 'image', 'multipart')
+
+# Maximum number of images accepted by one /predict/batch request
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '500'))
+
+# Run one prediction on a sample image once the model is loaded, so the
+# first real requests do not pay for lazy initialization
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', 'false').lower() == 'true'
+MODEL_WARMUP_IMAGE = os.getenv(
+    'MODEL_WARMUP_IMAGE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'assets', 'images', 'img1.png')
+)
+
 # Ensure upload and output directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
-# Initialize segmentation model
-segmentation_model = SegmentationModel()
+# Annotated images expire after OUTPUT_TTL_SECONDS and the folder is kept
+# under OUTPUT_MAX_MB by a background eviction thread
+output_store = OutputStore.from_env(app.config['OUTPUT_FOLDER'])
+output_store.start()
+
+def load_segmentation_model(report):
+    """
+    Build the segmentation model. The heavy imports (OpenCV, supervision,
+    the inference SDK) happen here rather than at app import.
+    """
+    with report.phase("import_segmentation"):
+        from segmentation_module import SegmentationModel
+    with report.phase("model_init"):
+        model = SegmentationModel()
+    if MODEL_WARMUP:
+        if os.path.exists(MODEL_WARMUP_IMAGE):
+            with report.phase("warm_up"):
+                model.warm_up(MODEL_WARMUP_IMAGE)
+        else:
+            logger.warning(f"Warm-up image not found: {MODEL_WARMUP_IMAGE}")
+    return model
+
+# Load the segmentation model off the request path (MODEL_LOADING:
+# background, lazy or eager) so IoT and health routes are served immediately
+model_loader = ModelLoader.from_env(load_segmentation_model, report=startup_report)
+model_loader.start()
+
+# Initialize background job queue for /predict/jobs
+job_queue = JobQueue.from_env()
+
+# Coalesce identical predictions in flight (SINGLEFLIGHT_ENABLED), across
+# gunicorn workers too when SINGLEFLIGHT_LOCK_DIR is set
+prediction_flights = SingleFlight.from_env()
+
+# Concurrent batch predictor for /predict/batch, created once the model is loaded
+batch_predictor = None
+batch_predictor_lock = threading.Lock()
 
 # Initialize IoT controller
-iot_controller = BlueGuardIoT()
+# Readings collected by the monitoring loop are also kept on disk
+# (IOT_DB_ENABLED, IOT_DB_PATH), with 1m/1h/1d rollups for /iot/data/range.
+# Stations are registered by id (IOT_DEVICES) and served under
+# /iot/devices/<id>/...; the unscoped /iot/* routes serve the default one.
+with startup_report.phase("iot_init"):
+    iot_store = TimeSeriesStore.from_env(os.path.join(BASE_DIR, "iot_data", "readings.db"))
+    if iot_store is not None:
+        iot_store.start()
+    iot_devices = DeviceRegistry.from_env(store=iot_store)
+    iot_controller = iot_devices.get(iot_devices.default_id)
+
+# Request metrics, exposed with the model stage timings on /metrics
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by endpoint and status",
+    labelnames=("method", "endpoint", "status"),
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint",
+    labelnames=("method", "endpoint"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests being processed"
+)
+UPLOAD_BYTES = REGISTRY.histogram(
+    "upload_bytes", "Size of images uploaded to /predict",
+    buckets=(64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6, 64e6, 128e6),
+)
+REGISTRY.gauge("output_store_files", "Files in the output store",
+               fn=lambda: output_store.stats()["files"])
+REGISTRY.gauge("output_store_bytes", "Bytes in the output store",
+               fn=lambda: output_store.stats()["bytes"])
+REGISTRY.counter("output_store_expired_evictions_total", "Output files deleted after their TTL",
+                 fn=lambda: output_store.stats()["expired_evictions"])
+REGISTRY.counter("output_store_size_evictions_total", "Output files deleted to fit the size cap",
+                 fn=lambda: output_store.stats()["size_evictions"])
+REGISTRY.gauge("job_queue_depth", "Prediction jobs waiting in the queue",
+               fn=lambda: job_queue.stats()["queue_depth"])
+REGISTRY.counter("prediction_executions_total", "Predictions run by this worker",
+                 fn=lambda: prediction_flights.stats()["executions"])
+REGISTRY.counter("prediction_coalesced_total",
+                 "Predictions answered from an identical request in flight",
+                 fn=lambda: sum(prediction_flights.stats()[name]
+                                for name in ("coalesced", "cross_process_shared")))
+
+logger.info(f"App ready in {startup_report.mark('app_ready')} ms "
+            f"(model: {model_loader.state})")
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - g.request_start, method=request.method, endpoint=endpoint
+    )
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    HTTP_IN_FLIGHT.dec()
+
+def get_segmentation_model():
+    """Return the loaded model or raise ModelNotReadyError."""
+    return model_loader.get()
+
+def get_batch_predictor():
+    """Return the batch predictor, creating it once the model is loaded."""
+    global batch_predictor
+    segmentation_model = get_segmentation_model()
+    with batch_predictor_lock:
+        if batch_predictor is None:
+            batch_predictor = BatchPredictor.from_env(segmentation_model)
+        return batch_predictor
+
+def model_not_ready(e):
+    """503 response for requests that arrive before the model is loaded."""
+    response = jsonify({
+        "error": str(e),
+        "model": model_loader.status()
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def inference_unavailable(e):
+    """503 response when the remote model is failing or the circuit is open."""
+    response = jsonify({
+        "error": str(e),
+        "status": "degraded"
+    })
+    response.headers['Retry-After'] = str(e.retry_after or 5)
+    return response, 503
 
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension."""
@@ -94,6 +292,30 @@ def generate_unique_filename(original_filename):
     ext = original_filename.rsplit('.', 1)[1].lower()
     return f"{timestamp}_{unique_id}.{ext}"
 
+def read_upload(file, unique_filename):
+    """
+    Read an uploaded file into memory, spooling it to UPLOAD_FOLDER only
+    when it exceeds UPLOAD_SPOOL_THRESHOLD.
+    Returns (image, input_path): image is the bytes or the spooled path, and
+    input_path is the spooled file to clean up (None when held in memory).
+    """
+    data = file.stream.read(UPLOAD_SPOOL_THRESHOLD + 1)
+    if len(data) <= UPLOAD_SPOOL_THRESHOLD:
+        UPLOAD_BYTES.observe(len(data))
+        return data, None
+
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    with open(input_path, 'wb') as f:
+        f.write(data)
+        shutil.copyfileobj(file.stream, f)
+    UPLOAD_BYTES.observe(os.path.getsize(input_path))
+    return input_path, input_path
+
+def remove_upload(input_path):
+    """Remove an upload spooled by read_upload, if any."""
+    if input_path and os.path.exists(input_path):
+        os.remove(input_path)
+
 @app.route('/', methods=['GET'])
 def health_check():
     """Health check endpoint."""
@@ -101,9 +323,200 @@ def health_check():
         "status": "healthy",
         "service": "Image Segmentation API",
         "version": "1.0.0",
+        "model": model_loader.state,
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once the segmentation model is loaded, else 503."""
+    status = model_loader.status()
+    return jsonify({
+        "ready": status["ready"],
+        "model": status,
+        "timestamp": datetime.now().isoformat()
+    }), 200 if status["ready"] else 503
+
+@app.route('/startup', methods=['GET'])
+def startup_info():
+    """Get the startup time report, broken down by phase."""
+    return jsonify({
+        "success": True,
+        "startup": startup_report.to_dict(),
+        "model": model_loader.status(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+def validate_upload():
+    """
+    Validate the 'file' field of the current multipart request.
+    Returns (file, None) on success or (None, error_response).
+    """
+    # Check if file is in request
+    if 'file' not in request.files:
+        return None, (jsonify({"error": "No file provided"}), 400)
+    
+    file = request.files['file']
+    
+    # Check if file is selected
+    if file.filename == '':
+        return None, (jsonify({"error": "No file selected"}), 400)
+    
+    # Check file extension
+    if not allowed_file(file.filename):
+        return None, (jsonify({"error": f"File type not allowed. Supported types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400)
+    
+    return file, None
+
+def parse_tiled():
+    """
+    Read the 'tiled' form field: "true", "false" or "auto" (tile only large
+    images). Defaults to TILED_DEFAULT.
+    """
+    value = request.form.get('tiled', TILED_DEFAULT).lower()
+    if value == 'auto':
+        return 'auto'
+    return value == 'true'
+
+def parse_output_options():
+    """
+    Read the annotated image encoding from the form fields output_format,
+    quality, max_dimension, progressive and thumbnail_size, defaulting to
+    OUTPUT_DEFAULTS. Raises InvalidOutputOptions on bad values.
+    """
+    return OutputOptions.from_form(request.form, OUTPUT_DEFAULTS)
+
+def publish_outputs(result):
+    """
+    Record the annotated image and its thumbnail in the output store and
+    add their download URLs.
+    """
+    if 'annotated_image_path' in result:
+        output_store.add(result['annotated_image_path'])
+        result['annotated_image_url'] = f"/download/{os.path.basename(result['annotated_image_path'])}"
+    if 'thumbnail' in result:
+        output_store.add(result['thumbnail']['path'])
+        result['thumbnail_url'] = f"/download/{os.path.basename(result['thumbnail']['path'])}"
+    return result
+
+def prediction_key(segmentation_model, image, confidence, return_annotated, tiled,
+                   output_options, inline):
+    """Key identical predictions: same image content, model and parameters."""
+    options = sorted(vars(output_options).items()) if output_options else None
+    params = f"{segmentation_model.model_version}|{return_annotated}|{tiled}|{options}|{inline}"
+    return InferenceCache.make_key(image, confidence, params)
+
+def predict_once(segmentation_model, image, unique_filename, confidence, return_annotated,
+                 tiled, output_options, inline, timer):
+    """Run one prediction for run_prediction, possibly on behalf of identical requests."""
+    if inline:
+        return segmentation_model.predict_and_render(
+            image=image,
+            confidence=confidence,
+            image_name=unique_filename,
+            tiled=tiled,
+            output_options=output_options,
+            timer=timer
+        )
+    elif return_annotated:
+        result = segmentation_model.predict_and_annotate(
+            image=image,
+            confidence=confidence,
+            output_folder=app.config['OUTPUT_FOLDER'],
+            image_name=unique_filename,
+            tiled=tiled,
+            output_options=output_options,
+            timer=timer
+        )
+    else:
+        result = segmentation_model.predict_only(
+            image=image,
+            confidence=confidence,
+            image_name=unique_filename,
+            tiled=tiled,
+            timer=timer
+        )
+    
+    if return_annotated:
+        publish_outputs(result)
+    
+    return result
+
+def run_prediction(image, input_path, unique_filename, confidence, return_annotated,
+                   tiled=False, output_options=None, inline=False, timer=None):
+    """
+    Run the segmentation model on an upload read by read_upload and remove
+    the spooled input file afterwards, if there was one.
+    With `inline`, the annotated image is kept in memory and (result, images)
+    is returned instead of writing it to OUTPUT_FOLDER.
+    `timer` (StageTimer) collects per-stage timings.
+    Identical requests in flight at the same time (e.g. a double-tapped
+    submit or a client retry) share one prediction; their results are marked
+    "coalesced".
+    """
+    try:
+        segmentation_model = get_segmentation_model()
+        logger.info(f"Processing image: {unique_filename} with confidence: {confidence}")
+        
+        # Process image through segmentation model
+        key = prediction_key(segmentation_model, image, confidence, return_annotated,
+                             tiled, output_options, inline)
+        result, shared = prediction_flights.do(
+            key, predict_once, segmentation_model, image, unique_filename, confidence,
+            return_annotated, tiled, output_options, inline, timer
+        )
+        if shared:
+            logger.info(f"Reusing the in-flight prediction of an identical request for {unique_filename}")
+            (result[0] if inline else result)['coalesced'] = True
+        
+        return result
+    finally:
+        # Clean up spooled input file
+        remove_upload(input_path)
+
+def inline_image_response(result, images, response_format, unique_filename):
+    """
+    Build a /predict response carrying the annotated image itself.
+    
+    - image: the annotated image as the body; the result, without the
+      polygons of raw_predictions, as JSON in the X-Prediction-Result header
+    - multipart: a multipart/form-data body (readable with
+      Response.formData() in the browser) with the parts "result" (the
+      full JSON result), "annotated_image" and, if requested, "thumbnail"
+    """
+    extension = FORMATS[result['output']['format']]
+    mimetype = MIME_TYPES[extension]
+    base_name = os.path.splitext(unique_filename)[0]
+    
+    if response_format == 'image':
+        metadata = {k: v for k, v in result.items() if k != 'raw_predictions'}
+        metadata['predictions'] = len(result['raw_predictions'])
+        metadata.pop('thumbnail', None)
+        response = Response(images['annotated'], mimetype=mimetype)
+        response.headers['X-Prediction-Result'] = json.dumps(metadata, separators=(',', ':'))
+        response.headers['Content-Disposition'] = f'inline; filename="{base_name}_annotated{extension}"'
+        return response
+    
+    boundary = uuid.uuid4().hex
+    parts = [('result', None, 'application/json', json.dumps(result).encode())]
+    parts.append(('annotated_image', f"{base_name}_annotated{extension}", mimetype, images['annotated']))
+    if 'thumbnail' in images:
+        parts.append(('thumbnail', f"{base_name}_annotated_thumb{extension}", mimetype, images['thumbnail']))
+    
+    body = []
+    for name, filename, content_type, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        body.append(
+            f"--{boundary}\r\nContent-Disposition: {disposition}\r\n"
+            f"Content-Type: {content_type}\r\n\r\n".encode()
+        )
+        body.append(data)
+        body.append(b"\r\n")
+    body.append(f"--{boundary}--\r\n".encode())
+    return Response(b"".join(body), mimetype=f"multipart/form-data; boundary={boundary}")
+
 @app.route('/predict', methods=['POST'])
 def predict_image():
     """
@@ -113,82 +526,319 @@ def predict_image():
     - file: image file
     - confidence: confidence threshold (optional, default: 50)
     - return_annotated: whether to return annotated image (optional, default: true)
+    - tiled: run overlapping tiles for large orthomosaics: true, false or
+      auto (optional, default: TILED_DEFAULT)
+    - output_format: jpeg or webp (optional, default: OUTPUT_FORMAT)
+    - quality: encoding quality 1-100 (optional, default: OUTPUT_QUALITY)
+    - max_dimension: downscale the annotated image to this long side, 0 for
+      full resolution (optional, default: OUTPUT_MAX_DIMENSION)
+    - progressive: progressive JPEG (optional, default: OUTPUT_PROGRESSIVE)
+    - thumbnail_size: also write a thumbnail with this long side, returned
+      as thumbnail_url (optional, default: OUTPUT_THUMBNAIL_SIZE)
+    - response_format: json, image or multipart (optional, default: json).
+      image and multipart return the annotated image in this response
+      instead of a download URL, and never write it to disk
+    - timings: include the per-stage timing breakdown (optional, default: false)
     """
     try:
-        # Check if file is in request
-        if 'file' not in request.files:
-            return jsonify({"error": "No file provided"}), 400
+        file, error = validate_upload()
+        if error:
+            return error
+        
+        # Get optional parameters
+        confidence = int(request.form.get('confidence', 50))
+        return_annotated = request.form.get('return_annotated', 'true').lower() == 'true'
+        tiled = parse_tiled()
+        output_options = parse_output_options()
+        response_format = request.form.get('response_format', 'json').lower()
+        if response_format not in RESPONSE_FORMATS:
+            return jsonify({"error": f"Unsupported response format. Supported: {', '.join(RESPONSE_FORMATS)}"}), 400
+        inline = response_format != 'json'
+        if inline and not return_annotated:
+            return jsonify({"error": f"response_format={response_format} requires return_annotated=true"}), 400
+        
+        include_timings = request.form.get('timings', 'false').lower() == 'true'
+        timer = StageTimer()
         
-        file = request.files['file']
+        # Read uploaded file (in memory unless it is very large)
+        filename = secure_filename(file.filename)
+        unique_filename = generate_unique_filename(filename)
+        with timer.stage("upload"):
+            image, input_path = read_upload(file, unique_filename)
         
-        # Check if file is selected
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
+        result = run_prediction(image, input_path, unique_filename, confidence, return_annotated,
+                                tiled, output_options, inline, timer)
+        if inline:
+            result, images = result
+        if include_timings:
+            result['timings'] = timer.summary()
+        if inline:
+            return inline_image_response(result, images, response_format, unique_filename)
+        return jsonify(result)
         
-        # Check file extension
-        if not allowed_file(file.filename):
-            return jsonify({"error": f"File type not allowed. Supported types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
+    except InvalidOutputOptions as e:
+        return jsonify({"error": str(e)}), 400
+    except ImageTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except ModelNotReadyError as e:
+        return model_not_ready(e)
+    except InferenceUnavailableError as e:
+        return inference_unavailable(e)
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}")
+        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+
+@app.route('/predict/jobs', methods=['POST'])
+def submit_prediction_job():
+    """
+    Queue segmentation of an uploaded image and return a job id immediately.
+    
+    Accepts the same form data as /predict. Poll /predict/jobs/<job_id> for
+    the result. Returns 429 when the job queue is full.
+    """
+    try:
+        file, error = validate_upload()
+        if error:
+            return error
         
-        # Get optional parameters
         confidence = int(request.form.get('confidence', 50))
         return_annotated = request.form.get('return_annotated', 'true').lower() == 'true'
+        tiled = parse_tiled()
+        output_options = parse_output_options()
         
-        # Save uploaded file
         filename = secure_filename(file.filename)
         unique_filename = generate_unique_filename(filename)
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(input_path)
-        
-        logger.info(f"Processing image: {unique_filename} with confidence: {confidence}")
+        image, input_path = read_upload(file, unique_filename)
         
-        # Process image through segmentation model
-        if return_annotated:
-            result = segmentation_model.predict_and_annotate(
-                image_path=input_path,
-                confidence=confidence,
-                output_folder=app.config['OUTPUT_FOLDER']
-            )
-        else:
-            result = segmentation_model.predict_only(
-                image_path=input_path,
-                confidence=confidence
+        try:
+            # A job that times out while queued never runs run_prediction,
+            # which would have removed the spooled upload
+            job_id = job_queue.submit(
+                run_prediction, image, input_path, unique_filename,
+                confidence, return_annotated, tiled, output_options,
+                on_skip=lambda: remove_upload(input_path)
             )
+        except QueueFullError as e:
+            remove_upload(input_path)
+            response = jsonify({"error": str(e), "queue": job_queue.stats()})
+            response.headers['Retry-After'] = '5'
+            return response, 429
         
-        # Clean up input file
-        os.remove(input_path)
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/predict/jobs/{job_id}",
+            "timestamp": datetime.now().isoformat()
+        }), 202
+        
+    except InvalidOutputOptions as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error queueing image: {str(e)}")
+        return jsonify({"error": f"Failed to queue job: {str(e)}"}), 500
+
+@app.route('/predict/jobs', methods=['GET'])
+def prediction_jobs_stats():
+    """Get job queue depth and outcome counters."""
+    return jsonify({
+        "success": True,
+        "queue": job_queue.stats(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/predict/jobs/<job_id>', methods=['GET'])
+def prediction_job_status(job_id):
+    """Get the status and, once finished, the result of a queued job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+def spool_to_tempfile(stream):
+    """Copy an upload stream into a temporary file in UPLOAD_FOLDER."""
+    spooled = tempfile.TemporaryFile(dir=app.config['UPLOAD_FOLDER'])
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled
+
+def collect_batch_items():
+    """
+    Gather the images of a /predict/batch request from the 'files' fields
+    and/or a zip 'archive'.
+    Uploads are copied to temporary files owned by the batch, since the
+    request's own file objects may be closed once streaming starts, and
+    each image is only read into memory when a worker picks it up.
+    Returns (items, spooled): a list of (unique_filename, read) pairs and the
+    temporary files to close when the batch is done.
+    """
+    items = []
+    spooled = []
+    
+    for file in request.files.getlist('files'):
+        if file.filename and allowed_file(file.filename):
+            unique_filename = generate_unique_filename(secure_filename(file.filename))
+            spooled.append(spool_to_tempfile(file.stream))
+            
+            def read(f=spooled[-1]):
+                data = f.read()
+                f.close()
+                return data
+            
+            items.append((unique_filename, read))
+    
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        spooled.append(spool_to_tempfile(archive.stream))
+        try:
+            zf = zipfile.ZipFile(spooled[-1])
+        except zipfile.BadZipFile:
+            for f in spooled:
+                f.close()
+            raise
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or not allowed_file(name):
+                continue
+            
+            def read(info=info):
+                if info.file_size > UPLOAD_SPOOL_THRESHOLD:
+                    raise ValueError(f"Image is larger than {UPLOAD_SPOOL_THRESHOLD} bytes")
+                return zf.read(info)
+            
+            items.append((generate_unique_filename(secure_filename(name)), read))
+    
+    return items, spooled
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict segmentation on many images, streaming results as NDJSON.
+    
+    Expected form data:
+    - files: one or more image files, and/or
+    - archive: a zip of images
+    - confidence: confidence threshold (optional, default: 50)
+    - return_annotated: whether to return annotated images (optional, default: true)
+    - tiled: true, false or auto, as for /predict (optional)
+    - output_format, quality, max_dimension, progressive, thumbnail_size:
+      annotated image encoding, as for /predict (optional)
+    
+    Each line is one image's /predict result (plus index and filename) in
+    completion order; the last line is a summary.
+    """
+    try:
+        confidence = int(request.form.get('confidence', 50))
+        return_annotated = request.form.get('return_annotated', 'true').lower() == 'true'
+        tiled = parse_tiled()
+        output_options = parse_output_options()
         
-        # Return result
-        if return_annotated and 'annotated_image_path' in result:
-            result['annotated_image_url'] = f"/download/{os.path.basename(result['annotated_image_path'])}"
+        predictor = get_batch_predictor()
+        items, spooled = collect_batch_items()
         
-        return jsonify(result)
+        def close_spooled():
+            for f in spooled:
+                f.close()
+        
+        if not items or len(items) > BATCH_MAX_IMAGES:
+            close_spooled()
+            if not items:
+                return jsonify({"error": f"No images provided. Supported types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
+            return jsonify({"error": f"Too many images. Maximum per batch is {BATCH_MAX_IMAGES}"}), 413
+        
+        logger.info(f"Processing batch of {len(items)} images with confidence: {confidence}")
+        
+        def generate():
+            try:
+                for result in predictor.run(
+                    items,
+                    confidence=confidence,
+                    return_annotated=return_annotated,
+                    output_folder=app.config['OUTPUT_FOLDER'],
+                    tiled=tiled,
+                    output_options=output_options
+                ):
+                    yield json.dumps(publish_outputs(result)) + "\n"
+            finally:
+                close_spooled()
+        
+        return Response(generate(), mimetype='application/x-ndjson')
         
+    except InvalidOutputOptions as e:
+        return jsonify({"error": str(e)}), 400
+    except ModelNotReadyError as e:
+        return model_not_ready(e)
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Archive is not a valid zip file"}), 400
     except Exception as e:
-        logger.error(f"Error processing image: {str(e)}")
-        # Clean up files in case of error
-        if 'input_path' in locals() and os.path.exists(input_path):
-            os.remove(input_path)
-        return jsonify({"error": f"Processing failed: {str(e)}"}), 500
+        logger.error(f"Error processing batch: {str(e)}")
+        return jsonify({"error": f"Batch processing failed: {str(e)}"}), 500
 
 @app.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
-    """Download processed/annotated image."""
+    """
+    Download processed/annotated image.
+    
+    Output files never change, so responses carry an ETag and may be cached
+    privately until the file expires. If-None-Match is answered with 304 and
+    Range requests with 206, so repeat views and resumed downloads do not
+    transfer the image again.
+    """
     try:
-        file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-        print(file_path)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
+        file_path = output_store.path(filename)
+        if file_path is None:
             return jsonify({"error": "File not found"}), 404
+        
+        response = send_file(
+            file_path,
+            mimetype=MIME_TYPES.get(os.path.splitext(file_path)[1].lower()),
+            as_attachment=True,
+            conditional=True,
+            etag=True,
+            max_age=output_store.remaining_ttl(file_path)
+        )
+        response.cache_control.public = None
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        output_store.record_download(response.status_code)
+        return response
+    except HTTPException:
+        # e.g. 416 for an unsatisfiable Range
+        raise
     except Exception as e:
         logger.error(f"Error downloading file {filename}: {str(e)}")
         return jsonify({"error": "Download failed"}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics: request counts, latency and in-flight requests,
+    segmentation stage timings, image and output sizes, and output store
+    and job queue state. Each gunicorn worker reports its own values.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/outputs/stats', methods=['GET'])
+def output_store_stats():
+    """Get output store size, eviction and download counters."""
+    return jsonify({
+        "success": True,
+        "store": output_store.stats(),
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/model/info', methods=['GET'])
 def model_info():
     """Get information about the loaded model."""
     try:
-        info = segmentation_model.get_model_info()
+        if not model_loader.ready:
+            return jsonify({
+                "status": model_loader.state,
+                "model_type": "segmentation",
+                "loader": model_loader.status(),
+                "timestamp": datetime.now().isoformat()
+            }), 503
+        info = model_loader.get().get_model_info()
         return jsonify(info)
     except Exception as e:
         logger.error(f"Error getting model info: {str(e)}")
@@ -211,32 +861,116 @@ def internal_error(e):
 
 # ==================== IOT ENDPOINTS ====================
 
+def iot_device(device_id):
+    """The registered device `device_id`, or the default one for unscoped routes."""
+    return iot_controller if device_id is None else iot_devices.get(device_id)
+
+def iot_monitored_elsewhere(device):
+    """
+    A 409 response if another process monitors `device` (its port and
+    monitoring are that process's to control), else None.
+    """
+    if not device.monitored_elsewhere:
+        return None
+    return jsonify({
+        "error": f"Device {device.device_id} is monitored by another server process; "
+                 f"its readings are served from storage",
+        "monitored_elsewhere": True
+    }), 409
+
+@app.errorhandler(UnknownDeviceError)
+def unknown_device(e):
+    """Handle device-scoped routes for unregistered devices."""
+    return jsonify({"error": str(e)}), 404
+
+@app.route('/iot/devices', methods=['GET'])
+def iot_list_devices():
+    """List registered devices with their status."""
+    try:
+        return jsonify({
+            "success": True,
+            "devices": iot_devices.list(),
+            "registry": iot_devices.stats(),
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"IoT devices error: {str(e)}")
+        return jsonify({"error": f"Failed to list devices: {str(e)}"}), 500
+
+@app.route('/iot/devices', methods=['POST'])
+def iot_add_device():
+    """
+    Register a device.
+    
+    Expected JSON:
+    - id: device id (letters, digits, '_', '.' or '-')
+    - port, baudrate, history_size, poll_interval, gas_threshold,
+      water_critical_level (optional)
+    - monitor: connect and start monitoring right away (optional)
+    """
+    try:
+        settings = dict(request.get_json(silent=True) or {})
+        device = iot_devices.add(settings.pop('id', None), **settings)
+        return jsonify({
+            "success": True,
+            "device": device.get_system_status(),
+            "timestamp": datetime.now().isoformat()
+        }), 201
+    except InvalidDeviceConfig as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"IoT add device error: {str(e)}")
+        return jsonify({"error": f"Failed to add device: {str(e)}"}), 500
+
+@app.route('/iot/devices/<device_id>', methods=['DELETE'])
+def iot_remove_device(device_id):
+    """Stop monitoring, disconnect and unregister a device."""
+    try:
+        iot_devices.remove(device_id)
+        return jsonify({
+            "success": True,
+            "message": f"Removed device {device_id}",
+            "timestamp": datetime.now().isoformat()
+        })
+    except InvalidDeviceConfig as e:
+        return jsonify({"error": str(e)}), 400
+    except UnknownDeviceError:
+        raise
+    except Exception as e:
+        logger.error(f"IoT remove device error: {str(e)}")
+        return jsonify({"error": f"Failed to remove device: {str(e)}"}), 500
+
 @app.route('/iot/connect', methods=['POST'])
-def iot_connect():
+@app.route('/iot/devices/<device_id>/connect', methods=['POST'])
+def iot_connect(device_id=None):
     """
     Connect to Arduino device.
     
     Expected JSON:
     - port: serial port (optional, auto-detected if not provided)
     """
+    device = iot_device(device_id)
+    conflict = iot_monitored_elsewhere(device)
+    if conflict:
+        return conflict
     try:
         data = request.get_json() or {}
         port = data.get('port', None)
         
-        success = iot_controller.connect(port)
+        success = device.connect(port)
         
         if success:
             return jsonify({
                 "success": True,
-                "message": f"Connected to Arduino on port {iot_controller.port}",
-                "port": iot_controller.port,
+                "message": f"Connected to Arduino on port {device.port}",
+                "port": device.port,
                 "timestamp": datetime.now().isoformat()
             })
         else:
             return jsonify({
                 "success": False,
                 "message": "Failed to connect to Arduino",
-                "status": iot_controller.current_data.get("status", "unknown")
+                "status": device.current_data.get("status", "unknown")
             }), 400
             
     except Exception as e:
@@ -244,10 +978,15 @@ def iot_connect():
         return jsonify({"error": f"Connection failed: {str(e)}"}), 500
 
 @app.route('/iot/disconnect', methods=['POST'])
-def iot_disconnect():
+@app.route('/iot/devices/<device_id>/disconnect', methods=['POST'])
+def iot_disconnect(device_id=None):
     """Disconnect from Arduino device."""
+    device = iot_device(device_id)
+    conflict = iot_monitored_elsewhere(device)
+    if conflict:
+        return conflict
     try:
-        iot_controller.disconnect()
+        device.disconnect()
         return jsonify({
             "success": True,
             "message": "Disconnected from Arduino",
@@ -258,49 +997,59 @@ def iot_disconnect():
         return jsonify({"error": f"Disconnect failed: {str(e)}"}), 500
 
 @app.route('/iot/status', methods=['GET'])
-def iot_status():
+@app.route('/iot/devices/<device_id>/status', methods=['GET'])
+def iot_status(device_id=None):
     """Get comprehensive IoT system status."""
+    device = iot_device(device_id)
     try:
-        status = iot_controller.get_system_status()
+        status = device.get_system_status()
         return jsonify(status)
     except Exception as e:
         logger.error(f"IoT status error: {str(e)}")
         return jsonify({"error": f"Failed to get status: {str(e)}"}), 500
 
 @app.route('/iot/data/current', methods=['GET'])
-def iot_current_data():
-    """Get current sensor readings."""
+@app.route('/iot/devices/<device_id>/data/current', methods=['GET'])
+def iot_current_data(device_id=None):
+    """
+    Get current sensor readings: the newest reading received from the
+    Arduino by the serial reader (or generated in mock mode), without
+    touching the serial port.
+    """
+    device = iot_device(device_id)
     try:
-        if not iot_controller.is_connected:
+        if not (device.is_connected or device.monitored_elsewhere):
             return jsonify({
                 "error": "Arduino not connected",
                 "connected": False
             }), 400
         
-        data = iot_controller.read_single_data()
+        data = device.get_latest_reading()
         if data:
             return jsonify(data)
         else:
             return jsonify({
-                "error": "Failed to read data from Arduino",
-                "last_known_data": iot_controller.get_current_data()
-            }), 500
+                "error": "No data received from Arduino yet",
+                "last_known_data": device.get_current_data()
+            }), 503
             
     except Exception as e:
         logger.error(f"IoT current data error: {str(e)}")
         return jsonify({"error": f"Failed to read data: {str(e)}"}), 500
 
 @app.route('/iot/data/history', methods=['GET'])
-def iot_historical_data():
+@app.route('/iot/devices/<device_id>/data/history', methods=['GET'])
+def iot_historical_data(device_id=None):
     """
     Get historical sensor data.
     
     Query parameters:
     - limit: number of recent records to return (default: all)
     """
+    device = iot_device(device_id)
     try:
         limit = request.args.get('limit', type=int)
-        history = iot_controller.get_historical_data(limit)
+        history = device.get_historical_data(limit)
         
         return jsonify({
             "success": True,
@@ -313,17 +1062,68 @@ def iot_historical_data():
         logger.error(f"IoT history error: {str(e)}")
         return jsonify({"error": f"Failed to get history: {str(e)}"}), 500
 
+def time_param(name, default):
+    """Query parameter `name` as epoch seconds; accepts ISO timestamps or epoch seconds."""
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return to_epoch(value)
+
+@app.route('/iot/data/range', methods=['GET'])
+@app.route('/iot/devices/<device_id>/data/range', methods=['GET'])
+def iot_range_data(device_id=None):
+    """
+    Get stored sensor data for a time range, from disk.
+    
+    Query parameters:
+    - start, end: ISO timestamps or epoch seconds (default: the last 24 hours)
+    - resolution: raw, 1m, 1h, 1d or auto (default: auto, the finest
+      resolution returning at most IOT_RANGE_MAX_POINTS points)
+    """
+    device = iot_device(device_id)
+    try:
+        end = time_param('end', time.time())
+        start = time_param('start', end - 86400)
+        resolution = request.args.get('resolution', 'auto')
+    except ValueError as e:
+        return jsonify({"error": f"Invalid start or end: {str(e)}"}), 400
+    
+    if iot_store is None:
+        return jsonify({"error": "Persistent IoT storage is disabled (IOT_DB_ENABLED=false)"}), 503
+    
+    try:
+        data = device.get_range_data(start, end, resolution)
+        return jsonify({
+            "success": True,
+            "data_points": len(data["points"]),
+            **data,
+            "timestamp": datetime.now().isoformat()
+        })
+    except InvalidRangeQuery as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"IoT range data error: {str(e)}")
+        return jsonify({"error": f"Failed to get range data: {str(e)}"}), 500
+
 @app.route('/iot/monitoring/start', methods=['POST'])
-def iot_start_monitoring():
+@app.route('/iot/devices/<device_id>/monitoring/start', methods=['POST'])
+def iot_start_monitoring(device_id=None):
     """Start continuous monitoring of Arduino data."""
+    device = iot_device(device_id)
+    conflict = iot_monitored_elsewhere(device)
+    if conflict:
+        return conflict
     try:
-        if not iot_controller.is_connected:
+        if not device.is_connected:
             return jsonify({
                 "error": "Arduino not connected. Please connect first.",
                 "connected": False
             }), 400
         
-        success = iot_controller.start_monitoring()
+        success = device.start_monitoring()
         
         if success:
             return jsonify({
@@ -343,10 +1143,15 @@ def iot_start_monitoring():
         return jsonify({"error": f"Failed to start monitoring: {str(e)}"}), 500
 
 @app.route('/iot/monitoring/stop', methods=['POST'])
-def iot_stop_monitoring():
+@app.route('/iot/devices/<device_id>/monitoring/stop', methods=['POST'])
+def iot_stop_monitoring(device_id=None):
     """Stop continuous monitoring."""
+    device = iot_device(device_id)
+    conflict = iot_monitored_elsewhere(device)
+    if conflict:
+        return conflict
     try:
-        iot_controller.stop_monitoring_data()
+        device.stop_monitoring_data()
         return jsonify({
             "success": True,
             "message": "Stopped continuous monitoring",
@@ -358,10 +1163,12 @@ def iot_stop_monitoring():
         return jsonify({"error": f"Failed to stop monitoring: {str(e)}"}), 500
 
 @app.route('/iot/alerts', methods=['GET'])
-def iot_alerts():
+@app.route('/iot/devices/<device_id>/alerts', methods=['GET'])
+def iot_alerts(device_id=None):
     """Get active alerts from IoT system."""
+    device = iot_device(device_id)
     try:
-        alerts = iot_controller.get_active_alerts()
+        alerts = device.get_active_alerts()
         return jsonify({
             "success": True,
             "alert_count": len(alerts),
@@ -373,10 +1180,12 @@ def iot_alerts():
         return jsonify({"error": f"Failed to get alerts: {str(e)}"}), 500
 
 @app.route('/iot/analytics', methods=['GET'])
-def iot_analytics():
+@app.route('/iot/devices/<device_id>/analytics', methods=['GET'])
+def iot_analytics(device_id=None):
     """Get analytics from historical IoT data."""
+    device = iot_device(device_id)
     try:
-        analytics = iot_controller.get_analytics()
+        analytics = device.get_analytics()
         return jsonify({
             "success": True,
             "analytics": analytics,
@@ -387,16 +1196,15 @@ def iot_analytics():
         return jsonify({"error": f"Failed to get analytics: {str(e)}"}), 500
 
 @app.route('/iot/thresholds', methods=['GET', 'POST'])
-def iot_thresholds():
+@app.route('/iot/devices/<device_id>/thresholds', methods=['GET', 'POST'])
+def iot_thresholds(device_id=None):
     """Get or update IoT system thresholds."""
+    device = iot_device(device_id)
     try:
         if request.method == 'GET':
             return jsonify({
                 "success": True,
-                "thresholds": {
-                    "gas_threshold": iot_controller.gas_threshold,
-                    "water_critical_level": iot_controller.water_critical_level
-                },
+                "thresholds": device.get_thresholds(),
                 "timestamp": datetime.now().isoformat()
             })
         
@@ -405,15 +1213,12 @@ def iot_thresholds():
             gas_threshold = data.get('gas_threshold')
             water_critical_level = data.get('water_critical_level')
             
-            iot_controller.update_thresholds(gas_threshold, water_critical_level)
+            device.update_thresholds(gas_threshold, water_critical_level)
             
             return jsonify({
                 "success": True,
                 "message": "Thresholds updated successfully",
-                "thresholds": {
-                    "gas_threshold": iot_controller.gas_threshold,
-                    "water_critical_level": iot_controller.water_critical_level
-                },
+                "thresholds": device.get_thresholds(),
                 "timestamp": datetime.now().isoformat()
             })
             
@@ -440,8 +1245,11 @@ def iot_available_ports():
 def dashboard_summary():
     """Get combined summary for dashboard display."""
     try:
-        # Get model info
-        model_info = segmentation_model.get_model_info()
+        # Get model info, if it has finished loading
+        if model_loader.ready:
+            model_info = model_loader.get().get_model_info()
+        else:
+            model_info = {"status": model_loader.state, "loader": model_loader.status()}
         
         # Get IoT status
         iot_status = iot_controller.get_system_status()
@@ -453,11 +1261,14 @@ def dashboard_summary():
             "success": True,
             "segmentation": {
                 "model_info": model_info,
-                "status": "ready"
+                "status": "ready" if model_loader.ready else model_loader.state,
+                "outputs": output_store.stats(),
+                "coalescing": prediction_flights.stats()
             },
             "iot": {
                 "system_status": iot_status,
-                "recent_data": recent_data
+                "recent_data": recent_data,
+                "devices": iot_devices.stats()
             },
             "timestamp": datetime.now().isoformat()
         })
@@ -0,0 +1,131 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPredictor:
+    """
+    Runs segmentation over many images with bounded concurrency.
+    Remote inference (I/O-bound) and decode/annotation (CPU-bound) run on
+    separate thread pools so network waits overlap with local work, and
+    results are yielded in completion order. At most `max_pending` inferred
+    images of a batch wait for annotation; inference workers wait for room
+    when annotation falls behind, so a batch never holds all its decoded
+    images at once.
+    """
+
+    def __init__(self, segmentation_model, inference_concurrency=8,
+                 annotation_concurrency=None, max_pending=None):
+        """Initialize the predictor. Pools are created on first use."""
+        self.segmentation_model = segmentation_model
+        self.inference_concurrency = inference_concurrency
+        self.annotation_concurrency = annotation_concurrency or os.cpu_count() or 2
+        self.max_pending = max_pending or 2 * self.annotation_concurrency
+
+        self._inference_pool = None
+        self._annotation_pool = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, segmentation_model):
+        """Build a predictor from BATCH_* environment variables."""
+        annotation_concurrency = os.getenv("BATCH_ANNOTATION_CONCURRENCY")
+        max_pending = os.getenv("BATCH_MAX_PENDING")
+        return cls(
+            segmentation_model,
+            inference_concurrency=int(os.getenv("BATCH_INFERENCE_CONCURRENCY", "8")),
+            annotation_concurrency=int(annotation_concurrency) if annotation_concurrency else None,
+            max_pending=int(max_pending) if max_pending else None,
+        )
+
+    def _pools(self):
+        with self._lock:
+            if self._inference_pool is None:
+                self._inference_pool = ThreadPoolExecutor(
+                    max_workers=self.inference_concurrency,
+                    thread_name_prefix="batch-inference",
+                )
+                self._annotation_pool = ThreadPoolExecutor(
+                    max_workers=self.annotation_concurrency,
+                    thread_name_prefix="batch-annotation",
+                )
+            return self._inference_pool, self._annotation_pool
+
+    def run(self, items, confidence=50, return_annotated=True, output_folder="outputs",
+            tiled=False, output_options=None):
+        """
+        Process `items`, a list of (name, read) pairs where `read()` returns
+        the image (bytes, path or array) and `name` is used for output files.
+        Yields one dict per image as it finishes, then a summary dict.
+        """
+        inference_pool, annotation_pool = self._pools()
+        results = queue.Queue()
+        # Inferred images queued or being annotated
+        pending = threading.BoundedSemaphore(self.max_pending)
+        start = time.perf_counter()
+
+        def finish(index, name, inference):
+            try:
+                if return_annotated:
+                    result = self.segmentation_model.annotate(
+                        inference, output_folder, output_options
+                    )
+                else:
+                    result = self.segmentation_model.classify(inference)
+                results.put({"index": index, "filename": name, **result})
+            except Exception as e:
+                results.put(self._error(index, name, e))
+            finally:
+                pending.release()
+
+        def infer(index, name, read):
+            try:
+                inference = self.segmentation_model.infer(
+                    read(), confidence, name, tiled, reduced=not return_annotated
+                )
+            except Exception as e:
+                results.put(self._error(index, name, e))
+                return
+            pending.acquire()
+            annotation_pool.submit(finish, index, name, inference)
+
+        futures = [
+            inference_pool.submit(infer, index, name, read)
+            for index, (name, read) in enumerate(items)
+        ]
+
+        succeeded = 0
+        try:
+            for _ in range(len(items)):
+                result = results.get()
+                succeeded += 1 if result.get("success") else 0
+                yield result
+        finally:
+            # Stop queued work if the client went away mid-stream
+            for future in futures:
+                future.cancel()
+
+        elapsed = time.perf_counter() - start
+        yield {
+            "summary": {
+                "total": len(items),
+                "succeeded": succeeded,
+                "failed": len(items) - succeeded,
+                "elapsed_seconds": round(elapsed, 3),
+                "images_per_second": round(len(items) / elapsed, 2) if elapsed else 0.0,
+            }
+        }
+
+    def _error(self, index, name, error):
+        logger.error(f"Batch prediction failed for {name}: {str(error)}")
+        return {
+            "index": index,
+            "filename": name,
+            "success": False,
+            "error": f"Processing failed: {str(error)}",
+        }
@@ -0,0 +1,123 @@
+"""
+Benchmark annotation: the dense supervision path (from_inference builds an
+N x H x W mask stack for MaskAnnotator) vs SegmentationModel.annotate, which
+composites polygons strip by strip.
+
+Each case runs in its own interpreter so peak RSS is comparable, and the
+annotated images of both paths are compared pixel by pixel.
+
+    python benchmarks/bench_annotate.py --megapixels 12 --polygons 10 50 100
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from common import (
+    peak_rss_mb,
+    run_isolated,
+    summarize,
+    synthetic_image,
+    synthetic_predictions,
+    timed,
+)
+from cache_module import InferenceCache
+from segmentation_module import SegmentationModel
+from stub_model import StubModel
+
+MODES = ("dense", "streaming")
+
+
+def annotate_dense(model, result, image):
+    """The original path: dense masks from from_inference."""
+    detections = sv.Detections.from_inference(result)
+    scene = model.mask_annotator.annotate(scene=image.copy(), detections=detections)
+    return sv.LabelAnnotator().annotate(
+        scene=scene, detections=detections,
+        labels=model._health_labels(result["predictions"], image),
+    )
+
+
+def annotate_streaming(model, result, image):
+    scene = model.composite_masks(image.copy(), result["predictions"])
+    detections = sv.Detections(
+        xyxy=np.array([
+            [p["x"] - p["width"] / 2, p["y"] - p["height"] / 2,
+             p["x"] + p["width"] / 2, p["y"] + p["height"] / 2]
+            for p in result["predictions"]
+        ]),
+        class_id=np.zeros(len(result["predictions"]), dtype=int),
+    )
+    return sv.LabelAnnotator().annotate(
+        scene=scene, detections=detections,
+        labels=model._health_labels(result["predictions"], image),
+    )
+
+
+def run_case(mode, args):
+    image = synthetic_image(args.megapixels)
+    result = synthetic_predictions(image.shape, args.polygons)
+    model = SegmentationModel(model=StubModel(result), cache=InferenceCache(max_entries=0))
+    fn = annotate_dense if mode == "dense" else annotate_streaming
+
+    annotated = fn(model, result, image)
+    latencies = timed(lambda: fn(model, result, image), args.repeat)
+    cv2.imwrite(args.output, annotated)
+
+    # End to end through the public API as well
+    with tempfile.TemporaryDirectory() as output_folder:
+        if mode == "streaming":
+            model.predict_and_annotate(image, output_folder=output_folder)
+
+    return {
+        "mode": mode,
+        "megapixels": args.megapixels,
+        "polygons": args.polygons,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        **summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--polygons", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        args.polygons = args.polygons[0]
+        print(json.dumps(run_case(args.mode, args)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in args.polygons:
+            outputs = {}
+            for mode in MODES:
+                outputs[mode] = os.path.join(workdir, f"{mode}_{count}.png")
+                print(json.dumps(run_isolated(os.path.abspath(__file__), [
+                    "--mode", mode,
+                    "--megapixels", str(args.megapixels),
+                    "--polygons", str(count),
+                    "--repeat", str(args.repeat),
+                    "--output", outputs[mode],
+                ])))
+            dense, streaming = (cv2.imread(outputs[mode]) for mode in MODES)
+            diff = cv2.absdiff(dense, streaming)
+            print(
+                f"{count} polygons: {np.count_nonzero(diff.max(axis=2)) / diff.shape[0] / diff.shape[1]:.4%} "
+                f"of pixels differ, max difference {int(diff.max())}",
+                file=sys.stderr,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark /predict-only latency on a local ONNX model against the hosted
+round trip (simulated by a stub with the given latency).
+
+    python benchmarks/bench_backends.py --onnx yolov8n-seg-grass.onnx --latency 0.8
+"""
+
+import argparse
+import json
+
+import cv2
+
+from common import summarize, synthetic_image, synthetic_predictions, timed
+from cache_module import InferenceCache
+from inference_module import OnnxBackend
+from segmentation_module import SegmentationModel
+from stub_model import StubModel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--onnx", required=True, help="path to the exported model")
+    parser.add_argument("--runtime", default="auto", choices=["auto", "onnxruntime", "opencv"])
+    parser.add_argument("--input-size", type=int, default=None)
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--polygons", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.8,
+                        help="simulated hosted inference round trip in seconds")
+    args = parser.parse_args()
+
+    image = synthetic_image(args.megapixels)
+    upload = cv2.imencode(".jpg", image)[1].tobytes()
+    no_cache = InferenceCache(max_entries=0)
+
+    backend = OnnxBackend(args.onnx, input_size=args.input_size, runtime=args.runtime)
+    models = {
+        "hosted_stub": SegmentationModel(
+            model=StubModel(synthetic_predictions(image.shape, args.polygons), args.latency),
+            cache=no_cache,
+        ),
+        f"onnx_{backend.runtime}": SegmentationModel(backend=backend, cache=no_cache),
+    }
+
+    for name, model in models.items():
+        model.predict_only(upload)  # warm-up
+        print(json.dumps({
+            "mode": name,
+            "megapixels": args.megapixels,
+            **summarize(timed(lambda: model.predict_only(upload), args.repeat)),
+        }))
+
+
+if __name__ == "__main__":
+    main()
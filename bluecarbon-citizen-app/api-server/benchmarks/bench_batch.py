@@ -0,0 +1,78 @@
+"""
+Benchmark batch throughput: serial /predict-style calls vs BatchPredictor,
+with a local stub model that simulates the remote inference round trip.
+
+    python benchmarks/bench_batch.py --images 64 --latency 0.4
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+
+from common import synthetic_image, synthetic_predictions
+from batch_module import BatchPredictor
+from cache_module import InferenceCache
+from segmentation_module import SegmentationModel
+from stub_model import StubModel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--megapixels", type=float, default=2)
+    parser.add_argument("--polygons", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.4,
+                        help="simulated inference round trip in seconds")
+    parser.add_argument("--inference-concurrency", type=int, default=16)
+    parser.add_argument("--annotation-concurrency", type=int, default=None)
+    parser.add_argument("--no-annotate", action="store_true")
+    args = parser.parse_args()
+
+    image = synthetic_image(args.megapixels)
+    response = synthetic_predictions(image.shape, args.polygons)
+    upload = cv2.imencode(".jpg", image)[1].tobytes()
+    model = SegmentationModel(
+        model=StubModel(response, latency=args.latency),
+        cache=InferenceCache(max_entries=0),
+    )
+    annotate = not args.no_annotate
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        for i in range(args.images):
+            if annotate:
+                model.predict_and_annotate(upload, output_folder=output_dir, image_name=f"{i}.jpg")
+            else:
+                model.predict_only(upload, image_name=f"{i}.jpg")
+        serial = time.perf_counter() - start
+
+        predictor = BatchPredictor(
+            model,
+            inference_concurrency=args.inference_concurrency,
+            annotation_concurrency=args.annotation_concurrency,
+        )
+        items = [(f"{i}.jpg", lambda: upload) for i in range(args.images)]
+        start = time.perf_counter()
+        for line in predictor.run(items, return_annotated=annotate, output_folder=output_dir):
+            if "summary" in line:
+                assert line["summary"]["failed"] == 0
+        batch = time.perf_counter() - start
+
+    for mode, elapsed in (("serial", serial), ("batch", batch)):
+        print(json.dumps({
+            "mode": mode,
+            "images": args.images,
+            "latency_s": args.latency,
+            "annotate": annotate,
+            "elapsed_s": round(elapsed, 3),
+            "images_per_second": round(args.images / elapsed, 2),
+        }))
+    print(f"batch throughput is {serial / batch:.1f}x serial ({os.cpu_count()} CPUs)")
+
+
+if __name__ == "__main__":
+    main()
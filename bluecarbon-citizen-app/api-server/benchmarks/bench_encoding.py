@@ -0,0 +1,75 @@
+"""
+Benchmark annotated image encoding: size on disk and encode time of the
+OutputOptions a client can request from /predict, on an annotated field
+photo.
+
+    python benchmarks/bench_encoding.py --image ../../assets/images/img1.png --repeat 20
+
+Each case encodes the same annotated image from memory; "thumbnail" cases
+include the extra thumbnail written in the same pass.
+"""
+
+import argparse
+import json
+
+import cv2
+
+from common import SAMPLE_IMAGE, summarize, synthetic_predictions, timed
+from cache_module import InferenceCache
+from encoding_module import OutputOptions
+from segmentation_module import SegmentationModel
+from stub_model import StubModel
+
+CASES = {
+    "default_jpeg_q95": {},
+    "jpeg_q80": {"quality": 80},
+    "jpeg_q80_progressive": {"quality": 80, "progressive": True},
+    "jpeg_q80_1280": {"quality": 80, "max_dimension": 1280},
+    "webp_q80": {"format": "webp", "quality": 80},
+    "webp_q70_1280": {"format": "webp", "quality": 70, "max_dimension": 1280},
+    "webp_q70_1280_thumbnail": {
+        "format": "webp", "quality": 70, "max_dimension": 1280, "thumbnail_size": 256,
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", default=SAMPLE_IMAGE)
+    parser.add_argument("--polygons", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        raise SystemExit(f"Could not read {args.image}")
+    result = synthetic_predictions(image.shape, args.polygons)
+    model = SegmentationModel(model=StubModel(result), cache=InferenceCache(max_entries=0))
+    annotated = model.composite_masks(image.copy(), result["predictions"])
+
+    h, w = annotated.shape[:2]
+    baseline = None
+    for name, kwargs in CASES.items():
+        options = OutputOptions(**kwargs)
+
+        def encode():
+            encoded, _ = options.encode(annotated, options.max_dimension)
+            size = len(encoded)
+            if options.thumbnail_size:
+                thumbnail, _ = options.encode(annotated, options.thumbnail_size)
+                size += len(thumbnail)
+            return size
+
+        size = encode()
+        baseline = baseline or size
+        print(json.dumps({
+            "case": name,
+            "image": f"{w}x{h}",
+            "bytes": size,
+            "vs_default": round(size / baseline, 3),
+            "encode": summarize(timed(encode, args.repeat)),
+        }))
+
+
+if __name__ == "__main__":
+    main()
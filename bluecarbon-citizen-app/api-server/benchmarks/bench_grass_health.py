@@ -0,0 +1,114 @@
+"""
+Benchmark grass health classification: full-size masks vs bounding-box ROIs
+vs a single label map for all polygons.
+
+Each mode runs in its own interpreter so peak RSS is comparable, and the
+labels of every mode are cross-checked against the full-mask reference.
+
+    python benchmarks/bench_grass_health.py --megapixels 24 --polygons 30
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from common import (
+    peak_rss_mb,
+    run_isolated,
+    summarize,
+    synthetic_image,
+    synthetic_polygons,
+    timed,
+)
+from segmentation_module import SegmentationModel
+
+
+def classify_full_mask(model, polygons, image):
+    """The original path: one full-resolution mask per polygon."""
+    labels = []
+    for points in polygons:
+        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        cv2.fillPoly(mask, [points], 255)
+        labels.append(model.classify_grass_health(mask, image))
+    return labels
+
+
+def classify_roi(model, polygons, image):
+    return [model.classify_polygon_health(points, image) for points in polygons]
+
+
+def classify_label_map(model, polygons, image):
+    return model.classify_grass_health_batch(polygons, image)
+
+
+MODES = {
+    "full_mask": classify_full_mask,
+    "roi": classify_roi,
+    "label_map": classify_label_map,
+}
+
+
+def run_case(mode, megapixels, polygon_count, repeat):
+    # Classification needs no model state, so skip the Roboflow setup
+    model = SegmentationModel.__new__(SegmentationModel)
+    image = synthetic_image(megapixels)
+    polygons = synthetic_polygons(image.shape, polygon_count)
+    baseline_rss = peak_rss_mb()
+
+    labels = MODES[mode](model, polygons, image)
+    latencies = timed(lambda: MODES[mode](model, polygons, image), repeat)
+
+    return {
+        "mode": mode,
+        "megapixels": megapixels,
+        "polygons": polygon_count,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_over_image_mb": round(peak_rss_mb() - baseline_rss, 1),
+        "labels": labels,
+        **summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=24)
+    parser.add_argument("--polygons", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", choices=sorted(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_case(args.mode, args.megapixels, args.polygons, args.repeat)))
+        return
+
+    results = {}
+    for mode in MODES:
+        results[mode] = run_isolated(
+            os.path.abspath(__file__),
+            [
+                "--mode", mode,
+                "--megapixels", str(args.megapixels),
+                "--polygons", str(args.polygons),
+                "--repeat", str(args.repeat),
+            ],
+        )
+
+    reference = results["full_mask"].pop("labels")
+    for mode, result in results.items():
+        if mode != "full_mask" and result.pop("labels") != reference:
+            print(f"WARNING: {mode} labels differ from full-mask labels", file=sys.stderr)
+
+    for result in results.values():
+        print(json.dumps(result))
+
+    for mode, result in results.items():
+        speedup = results["full_mask"]["mean_ms"] / max(result["mean_ms"], 1e-9)
+        print(f"{mode}: {speedup:.1f}x vs full_mask", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
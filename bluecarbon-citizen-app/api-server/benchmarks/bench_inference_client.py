@@ -0,0 +1,136 @@
+"""
+Exercise the remote inference client against the local Roboflow stand-in
+(fake_roboflow.py) with injected latency and failures:
+
+- keepalive: pooled keep-alive session vs a new connection per call (as
+  the Roboflow SDK does)
+- flaky: success rate with and without retries when 30% of calls fail
+- slow_tail: worst-case latency with and without per-call deadlines when
+  10% of calls hang
+- outage: calls that reach a dead service once the circuit opens, how fast
+  the rest fail, and recovery once the service is back
+
+    python benchmarks/bench_inference_client.py --calls 200
+"""
+
+import argparse
+import json
+import logging
+import time
+
+import cv2
+import requests
+
+from common import summarize, synthetic_image
+from client_module import CircuitBreaker, InferenceClient, InferenceUnavailableError
+from fake_roboflow import FakeRoboflowServer
+
+MODEL_ID = "segmentation-sohpz/9"
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=10 ** 6))
+    return InferenceClient("test-key", MODEL_ID, base_url=server.url, **kwargs)
+
+
+def run_calls(call, count):
+    """Run `call` `count` times. Returns (latencies in ms, successes)."""
+    latencies, successes = [], 0
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            call()
+            successes += 1
+        except (InferenceUnavailableError, requests.RequestException):
+            pass
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, successes
+
+
+def sdk_style_call(server, upload, timeout=None):
+    """One call the way the SDK makes it: a new connection, no retries."""
+    response = requests.post(
+        f"{server.url}/{MODEL_ID}",
+        params={"api_key": "test-key", "confidence": 50},
+        files={"file": ("image.jpg", upload, "image/jpeg")},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def report(scenario, mode, latencies, successes, **extra):
+    print(json.dumps({
+        "scenario": scenario,
+        "mode": mode,
+        "calls": len(latencies),
+        "success_rate": round(successes / len(latencies), 4),
+        "max_ms": round(max(latencies), 1),
+        **summarize(latencies),
+        **extra,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--megapixels", type=float, default=1)
+    args = parser.parse_args()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    upload = cv2.imencode(".jpg", synthetic_image(args.megapixels))[1].tobytes()
+    server = FakeRoboflowServer().start()
+    try:
+        # Connection reuse
+        client = make_client(server)
+        client.predict(upload, 50)
+        report("keepalive", "pooled_session",
+               *run_calls(lambda: client.predict(upload, 50), args.calls))
+        report("keepalive", "new_connection",
+               *run_calls(lambda: sdk_style_call(server, upload), args.calls))
+
+        # Retries against a service failing 30% of calls with 503
+        server.failure_rate = 0.3
+        for retries in (0, 2):
+            client = make_client(server, retries=retries, backoff=0.01)
+            report("flaky", f"retries_{retries}",
+                   *run_calls(lambda: client.predict(upload, 50), args.calls),
+                   retries_made=client.stats()["retries"])
+        server.failure_rate = 0.0
+
+        # Deadlines against a service where 10% of calls hang for 3 s
+        server.slow_rate, server.slow_latency = 0.1, 3.0
+        slow_calls = max(20, args.calls // 5)
+        report("slow_tail", "no_timeout",
+               *run_calls(lambda: sdk_style_call(server, upload), slow_calls))
+        client = make_client(server, read_timeout=0.5, deadline=1.5, backoff=0.01)
+        report("slow_tail", "deadline_1.5s",
+               *run_calls(lambda: client.predict(upload, 50), slow_calls),
+               timeouts=client.stats()["timeouts"])
+        server.slow_rate = 0.0
+
+        # Circuit breaker during an outage and after recovery
+        server.failure_rate = 1.0
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=1.0)
+        client = make_client(server, retries=1, backoff=0.01, breaker=breaker)
+        before = server.requests
+        latencies, successes = run_calls(lambda: client.predict(upload, 50), args.calls)
+        report("outage", "circuit_breaker", latencies, successes,
+               reached_service=server.requests - before,
+               short_circuited=breaker.counters["short_circuited"],
+               degraded=client.degraded,
+               fail_fast_p50_ms=summarize(latencies[10:])["p50_ms"])
+
+        server.failure_rate = 0.0
+        time.sleep(breaker.reset_timeout)
+        start = time.perf_counter()
+        latencies, successes = run_calls(lambda: client.predict(upload, 50), 10)
+        report("outage", "recovered", latencies, successes,
+               circuit=breaker.state, degraded=client.degraded,
+               recovery_ms=round((time.perf_counter() - start) * 1000, 1))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
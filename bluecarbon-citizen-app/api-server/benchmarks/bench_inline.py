@@ -0,0 +1,161 @@
+"""
+Benchmark end-to-end /predict latency through the frontend proxy for the
+download-URL response (json: /predict, then GET /download/...) and the
+inline responses (image, multipart: one request).
+
+    python benchmarks/bench_inline.py --requests 50 --rtt 80
+
+The app runs under gunicorn with the stub model. By default requests go
+through a local stand-in for the Next.js route app/api/flask-proxy, which,
+like it, buffers each upstream response before answering; `--rtt` delays
+each proxied request to model the round trip of a mobile connection. Use
+`--proxy-url http://localhost:3000/api/flask-proxy` to go through the real
+proxy of a running frontend (pointed at --port) instead.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from common import API_SERVER_DIR, SAMPLE_IMAGE, free_port, summarize, wait_ready
+
+MODES = ("json", "image", "multipart")
+
+HOP_BY_HOP = {"connection", "keep-alive", "transfer-encoding", "content-length"}
+
+
+def start_proxy(upstream, rtt):
+    """
+    Serve a buffering proxy to `upstream` on a free port. Returns its URL
+    and a function that stops it.
+    """
+    session = requests.Session()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def forward(self, method):
+            time.sleep(rtt)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP}
+            upstream_response = session.request(
+                method, upstream + self.path, data=body or None, headers=headers
+            )
+            data = upstream_response.content
+            self.send_response(upstream_response.status_code)
+            for key, value in upstream_response.headers.items():
+                if key.lower() not in HOP_BY_HOP:
+                    self.send_header(key, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.forward("GET")
+
+        def do_POST(self):
+            self.forward("POST")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        # Close kept-alive upstream connections so gunicorn can exit
+        session.close()
+
+    return f"http://127.0.0.1:{server.server_address[1]}", stop
+
+
+def predict(session, proxy_url, mode, upload):
+    """Run one prediction and fetch its annotated image. Returns image bytes."""
+    data = {"return_annotated": "true"}
+    if mode != "json":
+        data["response_format"] = mode
+    response = session.post(
+        proxy_url + "/predict", files={"file": ("field.png", upload)}, data=data
+    )
+    response.raise_for_status()
+
+    if mode == "json":
+        image = session.get(proxy_url + response.json()["annotated_image_url"])
+        image.raise_for_status()
+        return len(image.content)
+    if mode == "image":
+        json.loads(response.headers["X-Prediction-Result"])
+    return len(response.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=80,
+                        help="simulated client round trip per proxied request, ms")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated inference round trip in seconds")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--proxy-url", default=None)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    with open(SAMPLE_IMAGE, "rb") as f:
+        upload = f.read()
+
+    port = args.port or free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "WEB_CONCURRENCY": "1",
+        "STUB_LATENCY": str(args.latency),
+        "INFERENCE_CACHE_ENTRIES": "0",
+        "INFERENCE_CACHE_DIR": "",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--pythonpath", "benchmarks", "stub_app:app"],
+        cwd=API_SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(url, timeout=120)
+        if args.proxy_url:
+            proxy_url, stop_proxy = args.proxy_url, None
+        else:
+            proxy_url, stop_proxy = start_proxy(url, args.rtt / 1000)
+
+        for mode in args.modes:
+            session = requests.Session()
+            predict(session, proxy_url, mode, upload)  # warm up
+            latencies = []
+            received = 0
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                received = predict(session, proxy_url, mode, upload)
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(json.dumps({
+                "mode": mode,
+                "round_trips": 2 if mode == "json" else 1,
+                "rtt_ms": None if args.proxy_url else args.rtt,
+                "image_bytes": received,
+                **summarize(latencies),
+            }))
+            session.close()
+        if stop_proxy:
+            stop_proxy()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
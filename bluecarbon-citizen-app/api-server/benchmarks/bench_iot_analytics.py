@@ -0,0 +1,76 @@
+"""
+Benchmark /iot/analytics computation against history size: the previous
+implementation (full passes over a deque of reading dicts on every call)
+against BlueGuardIoT.get_analytics on the running aggregates kept by
+SensorHistory, plus the cost those aggregates add to each append.
+
+    python benchmarks/bench_iot_analytics.py --sizes 100 10000 86400
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime
+
+os.environ["RENDER"] = "true"  # IoT mock mode: no serial port needed
+
+from common import summarize, timed
+from iot_module import BlueGuardIoT
+
+
+def readings(count, seed=0):
+    rng = random.Random(seed)
+    start = time.time() - count
+    for i in range(count):
+        h2_conc = rng.randint(20, 300)
+        yield {
+            "h2_conc": h2_conc,
+            "h2_alert": 1 if h2_conc > 100 else 0,
+            "water_cm": rng.randint(5, 80),
+            "servo_pos": rng.choice([0, 45, 90, 135, 180]),
+            "timestamp": datetime.fromtimestamp(start + i).isoformat(),
+            "status": "mock_connected",
+            "mock_data": True,
+        }
+
+
+def deque_analytics(data_history):
+    """The previous get_analytics: several passes over a copy of the deque."""
+    history = list(data_history)
+    avg_h2 = sum(d.get("h2_conc", 0) for d in history) / len(history)
+    avg_water = sum(d.get("water_cm", 0) for d in history) / len(history)
+    total_alerts = sum(d.get("h2_alert", 0) for d in history)
+    recent_data = history[-10:] if len(history) >= 10 else history
+    recent_avg_h2 = sum(d.get("h2_conc", 0) for d in recent_data) / len(recent_data)
+    return avg_h2, avg_water, total_alerts, recent_avg_h2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 86400])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        data = list(readings(size))
+
+        old = deque(data, maxlen=size)
+        iot = BlueGuardIoT(data_history_size=size)
+        start = time.perf_counter()
+        for reading in data:
+            iot.data_history.append(reading)
+        append_us = (time.perf_counter() - start) / size * 1e6
+
+        print(json.dumps({
+            "history_size": size,
+            "deque_analytics": summarize(timed(lambda: deque_analytics(old), args.repeat)),
+            "incremental_analytics": summarize(timed(iot.get_analytics, args.repeat)),
+            "append_us": round(append_us, 2),
+        }))
+
+
+if __name__ == "__main__":
+    main()
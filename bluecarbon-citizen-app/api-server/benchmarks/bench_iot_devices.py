@@ -0,0 +1,112 @@
+"""
+Load-test monitoring of many mock BlueGuard stations: CPU and memory per
+device with one monitoring thread per device (BlueGuardIoT on its own)
+against a DeviceRegistry polling all of them from its shared scheduler.
+
+Each case runs in a fresh interpreter: it registers --devices mock devices,
+starts monitoring all of them and measures for --seconds.
+
+    python benchmarks/bench_iot_devices.py --devices 100 300 1000 --seconds 20
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+os.environ["RENDER"] = "true"  # IoT mock mode: no serial port needed
+
+from common import run_isolated
+from devices_module import DeviceRegistry, DeviceScheduler
+from iot_module import BlueGuardIoT
+
+MODES = ("thread_per_device", "scheduler")
+
+
+def rss_mb():
+    """Current resident set size in MB."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def run_case(mode, count, args):
+    before = rss_mb()
+    if mode == "scheduler":
+        registry = DeviceRegistry(scheduler=DeviceScheduler(workers=args.workers))
+        devices = [
+            registry.add(f"station-{i}", history_size=args.history_size,
+                         poll_interval=args.interval)
+            for i in range(count)
+        ]
+    else:
+        devices = []
+        for i in range(count):
+            device = BlueGuardIoT(data_history_size=args.history_size, device_id=f"station-{i}")
+            device.poll_interval = args.interval
+            devices.append(device)
+    for device in devices:
+        device.start_monitoring()
+
+    time.sleep(args.interval)  # let every device start polling
+    readings = sum(len(device.data_history) for device in devices)
+    cpu, wall = time.process_time(), time.perf_counter()
+    time.sleep(args.seconds)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    readings = sum(len(device.data_history) for device in devices) - readings
+    threads = threading.active_count()
+    after = rss_mb()
+    scheduler = registry.scheduler.stats() if mode == "scheduler" else None
+
+    start = time.perf_counter()
+    for device in devices:
+        device.stop_monitoring_data()
+    stop_seconds = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "devices": count,
+        "threads": threads,
+        "readings_per_second": round(readings / wall, 1),
+        "expected_per_second": round(count / args.interval, 1),
+        "cpu_percent": round(cpu / wall * 100, 2),
+        "cpu_percent_per_device": round(cpu / wall * 100 / count, 4),
+        "rss_mb": round(after, 1),
+        "rss_mb_per_device": round((after - before) / count, 3),
+        "history_mb_per_device": round(devices[0].data_history.nbytes / (1024 * 1024), 3),
+        "stop_all_seconds": round(stop_seconds, 2),
+        **({"scheduler": scheduler} if scheduler else {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[100, 300, 1000])
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--interval", type=float, default=2, help="poll interval per device")
+    parser.add_argument("--history-size", type=int, default=8640,
+                        help="readings kept in memory per device")
+    parser.add_argument("--workers", type=int, default=4, help="scheduler poll workers")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_case(args.mode, args.devices[0], args)))
+        return
+
+    for count in args.devices:
+        for mode in args.modes:
+            print(json.dumps(run_isolated(os.path.abspath(__file__), [
+                "--mode", mode,
+                "--devices", str(count),
+                "--seconds", str(args.seconds),
+                "--interval", str(args.interval),
+                "--history-size", str(args.history_size),
+                "--workers", str(args.workers),
+            ])))
+
+
+if __name__ == "__main__":
+    main()
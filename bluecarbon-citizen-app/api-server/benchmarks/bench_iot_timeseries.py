@@ -0,0 +1,104 @@
+"""
+Benchmark the persistent IoT store (TimeSeriesStore): write throughput of
+batched inserts with incremental rollups, and /iot/data/range query latency
+per resolution, against aggregating the raw readings of the same range.
+
+Readings come from the IoT mock generator (BlueGuardIoT in mock mode),
+back-dated to cover --days at one reading every --interval seconds.
+
+    python benchmarks/bench_iot_timeseries.py --days 90 --interval 5
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ["RENDER"] = "true"  # IoT mock mode: no serial port needed
+
+from common import summarize, timed
+from iot_module import BlueGuardIoT
+from timeseries_module import TimeSeriesStore
+
+DEVICE = "bench"
+
+# Aggregating raw readings per hour, as a range query would without rollups
+RAW_HOURLY = """
+SELECT CAST(ts / 3600 AS INTEGER) AS hour, COUNT(*), SUM(h2_alert = 1),
+       MIN(h2_conc), MAX(h2_conc), AVG(h2_conc),
+       MIN(water_cm), MAX(water_cm), AVG(water_cm)
+FROM readings WHERE device = ? AND ts >= ? AND ts < ? GROUP BY hour
+"""
+
+
+def mock_readings(count, interval, end):
+    iot = BlueGuardIoT(data_history_size=1)
+    start = end - count * interval
+    for i in range(count):
+        reading = iot.read_single_data()
+        reading["timestamp"] = start + i * interval
+        yield reading
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=float, default=90)
+    parser.add_argument("--interval", type=float, default=5, help="seconds between readings")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="iot-store-"), "readings.db")
+    # Keep everything so raw aggregation can be compared over the whole range
+    store = TimeSeriesStore(
+        path, batch_size=args.batch_size,
+        retention_days={"raw": None, "1m": None, "1h": None},
+    )
+
+    end = time.time()
+    count = int(args.days * 86400 / args.interval)
+    readings = list(mock_readings(count, args.interval, end))
+
+    start = time.perf_counter()
+    for i, reading in enumerate(readings, 1):
+        store.append(DEVICE, reading)
+        if i % args.batch_size == 0:
+            store.flush()
+    store.flush()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "readings": count,
+        "batch_size": args.batch_size,
+        "writes_per_second": round(count / elapsed),
+        "db_mb": round(os.path.getsize(path) / 1e6, 1),
+    }))
+
+    connection = store._reader()
+    for days in sorted({1, 7, 30, args.days}):
+        range_start = end - days * 86400
+        for resolution in ("auto", "raw", "1m", "1h", "1d"):
+            if resolution == "raw" and days > 7:
+                continue
+            result = store.query_range(DEVICE, range_start, end, resolution)
+            latencies = timed(lambda: store.query_range(DEVICE, range_start, end, resolution),
+                              args.repeat)
+            print(json.dumps({
+                "days": days,
+                "resolution": resolution,
+                "used": result["resolution"],
+                "points": len(result["points"]),
+                "truncated": result["truncated"],
+                **summarize(latencies),
+            }))
+        latencies = timed(
+            lambda: connection.execute(RAW_HOURLY, (DEVICE, range_start, end)).fetchall(),
+            max(3, args.repeat // 4),
+        )
+        print(json.dumps({"days": days, "resolution": "raw_grouped_hourly", **summarize(latencies)}))
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
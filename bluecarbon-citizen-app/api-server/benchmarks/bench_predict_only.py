@@ -0,0 +1,72 @@
+"""
+Benchmark predict_only against predict_and_annotate with a local stub model.
+
+    python benchmarks/bench_predict_only.py --megapixels 12 --polygons 30
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import cv2
+
+from common import summarize, synthetic_image, synthetic_predictions, timed
+from segmentation_module import SegmentationModel
+from stub_model import StubModel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--polygons", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="simulated inference round trip in seconds",
+    )
+    args = parser.parse_args()
+
+    image = synthetic_image(args.megapixels)
+    response = synthetic_predictions(image.shape, args.polygons)
+    model = SegmentationModel(model=StubModel(response, latency=args.latency))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        image_path = os.path.join(workdir, "field.jpg")
+        cv2.imwrite(image_path, image)
+        del image
+
+        output_folder = os.path.join(workdir, "outputs")
+        cases = {
+            "annotated": lambda: model.predict_and_annotate(
+                image_path, confidence=50, output_folder=output_folder
+            ),
+            "predict_only": lambda: model.predict_only(image_path, confidence=50),
+        }
+
+        labels = {}
+        results = {}
+        for name, fn in cases.items():
+            labels[name] = fn()["labels"]
+            results[name] = {
+                "mode": name,
+                "megapixels": args.megapixels,
+                "polygons": args.polygons,
+                **summarize(timed(fn, args.repeat)),
+            }
+            print(json.dumps(results[name]))
+
+    agreement = sum(
+        a == b for a, b in zip(labels["annotated"], labels["predict_only"])
+    ) / max(len(labels["annotated"]), 1)
+    speedup = results["annotated"]["mean_ms"] / max(results["predict_only"]["mean_ms"], 1e-9)
+    print(
+        f"predict_only is {speedup:.1f}x faster; "
+        f"label agreement {agreement:.1%}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
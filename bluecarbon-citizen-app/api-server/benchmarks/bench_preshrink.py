@@ -0,0 +1,139 @@
+"""
+Benchmark uploading images to the remote model shrunk to its input size
+against uploading the originals, through the local Roboflow stand-in
+(fake_roboflow.py) serving a green-blob model that, like the hosted one,
+resizes its input to a fixed size. The uplink is simulated at --upload-mbps.
+
+Reports upload bytes and end-to-end latency (upload, inference and the
+full-resolution decode annotation needs either way), and checks that the
+polygons mapped back from the shrunk upload agree with the full-size path:
+each full-size instance is matched to the shrunk-path instance with the
+highest mask IoU.
+
+    python benchmarks/bench_preshrink.py --megapixels 12 --upload-mbps 20
+"""
+
+import argparse
+import json
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from bench_tiling import blob_field
+from common import summarize
+from client_module import CircuitBreaker, InferenceClient
+from fake_roboflow import FakeRoboflowServer
+from inference_module import ImageSource, RoboflowBackend
+from stub_model import BlobBackend
+
+MODEL_ID = "segmentation-sohpz/9"
+
+
+def camera_jpeg(megapixels, blobs, quality):
+    """A blob field with sensor-like noise, encoded like a camera upload."""
+    image, _ = blob_field(megapixels, blobs)
+    noise = np.random.default_rng(1).integers(0, 24, size=image.shape, dtype=np.uint8)
+    return cv2.imencode(".jpg", cv2.add(image, noise), [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def polygon_iou(a, b):
+    """Mask IoU of two predictions, rasterized over their joint bounding box."""
+    pa = np.array([[p["x"], p["y"]] for p in a["points"]])
+    pb = np.array([[p["x"], p["y"]] for p in b["points"]])
+    x0, y0 = np.floor(np.minimum(pa.min(axis=0), pb.min(axis=0))).astype(int)
+    x1, y1 = np.ceil(np.maximum(pa.max(axis=0), pb.max(axis=0))).astype(int)
+    masks = []
+    for points in (pa, pb):
+        mask = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.round(points - (x0, y0)).astype(np.int32)], 1)
+        masks.append(mask.astype(bool))
+    union = np.logical_or(*masks).sum()
+    return float(np.logical_and(*masks).sum() / union) if union else 0.0
+
+
+def boxes_overlap(a, b):
+    return (abs(a["x"] - b["x"]) * 2 < a["width"] + b["width"]
+            and abs(a["y"] - b["y"]) * 2 < a["height"] + b["height"])
+
+
+def agreement(reference, candidate):
+    """Match each reference instance to its best candidate by mask IoU."""
+    ious, box_errors = [], []
+    for ref in reference:
+        best, best_iou = None, 0.0
+        for cand in candidate:
+            if boxes_overlap(ref, cand):
+                iou = polygon_iou(ref, cand)
+                if iou > best_iou:
+                    best, best_iou = cand, iou
+        ious.append(best_iou)
+        if best is not None:
+            box_errors.append(max(abs(ref[k] - best[k]) for k in ("x", "y", "width", "height")))
+    return {
+        "reference_instances": len(reference),
+        "candidate_instances": len(candidate),
+        "matched_iou_0.5": sum(iou >= 0.5 for iou in ious),
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+        "p5_iou": round(float(np.percentile(ious, 5)), 4) if ious else None,
+        "max_box_error_px": round(max(box_errors), 1) if box_errors else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--blobs", type=int, default=60)
+    parser.add_argument("--quality", type=int, default=92, help="JPEG quality of the original")
+    parser.add_argument("--input-size", type=int, default=640,
+                        help="long side the simulated model resizes its input to")
+    parser.add_argument("--upload-mbps", type=float, default=20)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="simulated inference time in seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    upload = camera_jpeg(args.megapixels, args.blobs, args.quality)
+    server = FakeRoboflowServer(
+        backend=BlobBackend(input_size=args.input_size),
+        latency=args.latency,
+        upload_mbps=args.upload_mbps,
+    ).start()
+    predictions = {}
+    try:
+        for mode, upload_size in (("original", 0), ("preshrink", args.input_size)):
+            client = InferenceClient("test-key", MODEL_ID, base_url=server.url,
+                                     breaker=CircuitBreaker(failure_threshold=10 ** 6))
+            backend = RoboflowBackend(client=client, upload_size=upload_size)
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                source = ImageSource(upload, "photo.jpg")
+                result = backend.predict(source, 40)
+                source.decode()
+                latencies.append((time.perf_counter() - start) * 1000)
+            predictions[mode] = result["predictions"]
+
+            counters = backend.upload_counters
+            print(json.dumps({
+                "mode": mode,
+                "megapixels": args.megapixels,
+                "upload_mbps": args.upload_mbps,
+                "original_bytes": len(upload),
+                "upload_bytes": counters["bytes_uploaded"] // counters["uploads"],
+                "instances": len(result["predictions"]),
+                **summarize(latencies),
+            }))
+    finally:
+        server.stop()
+
+    print(json.dumps({
+        "check": "polygon_agreement",
+        **agreement(predictions["original"], predictions["preshrink"]),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark how current the served Arduino reading is, with a fake Arduino
+on a pty (fake_arduino.py) writing at several rates, some lines in
+fragments and some preceded by noise:
+
+- polling: the previous monitoring loop, reading at most one line when
+  bytes are waiting and then sleeping --interval seconds
+- reader: BlueGuardIoT with the event-driven SerialReader, which drains
+  every buffered line as it arrives into the current-data snapshot
+
+Staleness of the served value is sampled every 100 ms, as readings behind
+the newest one written and as the age of the served one (the *_ms fields).
+CPU is that of the thread doing the reading.
+
+    python benchmarks/bench_serial_reader.py --rates 0.5 10 100 --seconds 30
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+os.environ.pop("RENDER", None)  # real serial mode
+
+import serial
+
+from common import summarize
+from fake_arduino import FakeArduino
+from iot_module import BlueGuardIoT
+
+MODES = ("polling", "reader")
+
+
+def thread_cpu(thread):
+    return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+
+
+def polling_loop(connection, stop, interval, served):
+    """The previous _monitor_loop around read_single_data."""
+    while not stop.is_set():
+        try:
+            if connection.in_waiting > 0:
+                line = connection.readline().decode().strip()
+                served.update(json.loads(line))
+        except ValueError:
+            pass
+        stop.wait(interval)
+
+
+def run(mode, rate, args):
+    arduino = FakeArduino(rate=rate, split_rate=args.split_rate,
+                          noise_rate=args.noise_rate).start()
+    if mode == "polling":
+        connection = serial.Serial(arduino.port, 9600, timeout=2)
+        served, stop = {}, threading.Event()
+        thread = threading.Thread(target=polling_loop,
+                                  args=(connection, stop, args.interval, served))
+        thread.start()
+        current = lambda: served.get("seq")
+    else:
+        device = BlueGuardIoT(port=arduino.port, data_history_size=100000)
+        device.connect()
+        device.start_monitoring()
+        thread = next(t for t in threading.enumerate() if t.name == "iot-reader")
+        current = lambda: (device.get_latest_reading() or {}).get("seq")
+
+    time.sleep(1)
+    cpu = thread_cpu(thread)
+    behind, seconds_behind = [], []
+    end = time.monotonic() + args.seconds
+    while time.monotonic() < end:
+        seq, newest, now = current(), arduino.seq, time.time()
+        if seq is not None:
+            behind.append(newest - seq)
+            seconds_behind.append(now - arduino.sent_at.get(seq, now))
+        time.sleep(0.1)
+    cpu = thread_cpu(thread) - cpu
+
+    if mode == "polling":
+        stop.set()
+        thread.join()
+        connection.close()
+        recorded = None
+    else:
+        recorded = len(device.data_history)
+        device.disconnect()
+    arduino.stop()
+
+    return {
+        "mode": mode,
+        "lines_per_second": rate,
+        "samples": len(behind),
+        "mean_readings_behind": round(sum(behind) / len(behind), 1) if behind else None,
+        "max_readings_behind": max(behind) if behind else None,
+        "max_ms": round(max(seconds_behind) * 1000, 1),
+        **summarize([seconds * 1000 for seconds in seconds_behind]),
+        "readings_recorded": recorded,
+        "readings_written": arduino.seq,
+        "reader_cpu_percent": round(cpu / args.seconds * 100, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.5, 10, 100])
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--interval", type=float, default=5,
+                        help="sleep between polls of the polling loop")
+    parser.add_argument("--split-rate", type=float, default=0.3)
+    parser.add_argument("--noise-rate", type=float, default=0.05)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    for rate in args.rates:
+        for mode in args.modes:
+            print(json.dumps(run(mode, rate, args)))
+
+
+if __name__ == "__main__":
+    main()
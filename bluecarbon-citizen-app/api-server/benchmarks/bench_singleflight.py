@@ -0,0 +1,106 @@
+"""
+Measure request coalescing under bursts of identical /predict requests (a
+double-tapped submit, or a client retrying a slow response) against
+gunicorn serving the app with a local stub model.
+
+Each burst sends --burst identical requests at once; bursts differ in their
+confidence so no burst can reuse another's result. Modes:
+
+- off: SINGLEFLIGHT_ENABLED=false, every request runs its own prediction
+- threads: coalescing within each worker (default)
+- cross_worker: also across workers, through SINGLEFLIGHT_LOCK_DIR
+
+    python benchmarks/bench_singleflight.py --workers 4 --burst 6 --latency 1.0
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import API_SERVER_DIR, SAMPLE_IMAGE, free_port, summarize, wait_ready
+
+MODES = ("off", "threads", "cross_worker")
+
+
+def run(mode, args, upload):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    lock_dir = tempfile.mkdtemp(prefix="singleflight-")
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "WEB_CONCURRENCY": str(args.workers),
+        "GUNICORN_THREADS": str(args.threads),
+        "STUB_LATENCY": str(args.latency),
+        "INFERENCE_CACHE_ENTRIES": "0",
+        "INFERENCE_CACHE_DIR": "",
+        "SINGLEFLIGHT_ENABLED": "false" if mode == "off" else "true",
+        "SINGLEFLIGHT_LOCK_DIR": lock_dir if mode == "cross_worker" else "",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--pythonpath", "benchmarks", "stub_app:app"],
+        cwd=API_SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    def post(confidence):
+        # A new connection per request, so gunicorn spreads them over workers
+        start = time.perf_counter()
+        response = requests.post(
+            url + "/predict",
+            files={"file": ("field.png", upload)},
+            data={"confidence": str(confidence), "return_annotated": "true"},
+        )
+        response.raise_for_status()
+        return (time.perf_counter() - start) * 1000, response.json().get("coalesced", False)
+
+    try:
+        wait_ready(url, timeout=120)
+        time.sleep(1)
+        latencies, executions = [], 0
+        with ThreadPoolExecutor(max_workers=args.burst) as pool:
+            for burst in range(args.bursts):
+                results = list(pool.map(post, [10 + burst] * args.burst))
+                latencies.extend(ms for ms, _ in results)
+                executions += sum(not coalesced for _, coalesced in results)
+        return {
+            "mode": mode,
+            "workers": args.workers,
+            "requests": len(latencies),
+            "predictions_run": executions,
+            "predictions_per_burst": round(executions / args.bursts, 2),
+            "max_ms": round(max(latencies), 1),
+            **summarize(latencies),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--burst", type=int, default=6, help="identical requests per burst")
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=1.0,
+                        help="simulated inference round trip in seconds")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    with open(SAMPLE_IMAGE, "rb") as f:
+        upload = f.read()
+
+    for mode in args.modes:
+        print(json.dumps(run(mode, args, upload)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark tiled inference on a large synthetic orthomosaic against a single
+whole-image model call, with a local backend that segments green blobs after
+resizing its input to the model input size (as a hosted model would).
+
+Each mode runs in its own interpreter so peak RSS is comparable, and the
+instance count is checked against the blobs actually drawn.
+
+    python benchmarks/bench_tiling.py --megapixels 100 --blobs 400 --latency 0.3
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from common import image_shape_for_megapixels, peak_rss_mb, run_isolated
+from cache_module import InferenceCache
+from segmentation_module import SegmentationModel
+from stub_model import BlobBackend
+from tiling_module import TiledPredictor
+
+MODES = ("whole", "tiled")
+
+
+def blob_field(megapixels, blobs, seed=0):
+    """
+    Draw `blobs` green disks of 10-150 px radius on a brown background.
+    Returns the image and the number of separate blobs (touching disks
+    count as one).
+    """
+    rng = np.random.default_rng(seed)
+    h, w = image_shape_for_megapixels(megapixels)
+    image = np.full((h, w, 3), (60, 50, 70), dtype=np.uint8)
+    for _ in range(blobs):
+        radius = int(rng.integers(10, 150))
+        center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+        cv2.circle(image, center, radius, (40, 200, 60), -1)
+    green = (image[:, :, 1] == 200).astype(np.uint8)
+    count = cv2.connectedComponents(green)[0] - 1
+    return image, count
+
+
+def run_case(mode, args):
+    with open(args.image, "rb") as f:
+        upload = f.read()
+    baseline_rss = peak_rss_mb()
+
+    backend = BlobBackend(latency=args.latency, input_size=args.input_size)
+    model = SegmentationModel(backend=backend, cache=InferenceCache(max_entries=0))
+    model.tiler = TiledPredictor(
+        backend,
+        tile_size=args.tile_size,
+        overlap=args.overlap,
+        concurrency=args.concurrency,
+    )
+
+    start = time.perf_counter()
+    result = model.predict_only(upload, tiled=(mode == "tiled"))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "megapixels": args.megapixels,
+        "true_instances": args.true_instances,
+        "instances": len(result["raw_predictions"]),
+        "model_calls": backend.calls,
+        "elapsed_s": round(elapsed, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_over_input_mb": round(peak_rss_mb() - baseline_rss, 1),
+        **({"tiling": result["tiling"]} if "tiling" in result else {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=100)
+    parser.add_argument("--blobs", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.3,
+                        help="simulated inference round trip in seconds")
+    parser.add_argument("--input-size", type=int, default=1024,
+                        help="long side the simulated model resizes its input to")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--overlap", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=(*MODES, "generate"), help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    parser.add_argument("--true-instances", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode == "generate":
+        image, true_count = blob_field(args.megapixels, args.blobs)
+        cv2.imwrite(args.image, image)
+        print(json.dumps({"true_instances": true_count}))
+        return
+    if args.mode:
+        print(json.dumps(run_case(args.mode, args)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Generate in a subprocess too, so this process stays small and
+        # does not inflate the children's peak RSS
+        image_path = os.path.join(workdir, "orthomosaic.png")
+        true_count = run_isolated(os.path.abspath(__file__), [
+            "--mode", "generate", "--image", image_path,
+            "--megapixels", str(args.megapixels), "--blobs", str(args.blobs),
+        ])["true_instances"]
+
+        case_args = [
+            "--megapixels", str(args.megapixels),
+            "--latency", str(args.latency),
+            "--input-size", str(args.input_size),
+            "--tile-size", str(args.tile_size),
+            "--overlap", str(args.overlap),
+            "--concurrency", str(args.concurrency),
+            "--image", image_path,
+            "--true-instances", str(true_count),
+        ]
+        for mode in MODES:
+            print(json.dumps(run_isolated(os.path.abspath(__file__), [*case_args, "--mode", mode])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark the /predict upload path: spooling to disk vs in-memory bytes,
+under concurrent load, with a local stub model.
+
+    python benchmarks/bench_upload_path.py --megapixels 12 --concurrency 1 4 8
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from common import summarize, synthetic_image, synthetic_predictions
+from cache_module import InferenceCache
+from segmentation_module import SegmentationModel
+from stub_model import StubModel
+
+
+def disk_request(model, upload, upload_dir, output_dir):
+    """The original path: save, let the model and imread re-read, remove."""
+    input_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}.jpg")
+    with open(input_path, "wb") as f:
+        f.write(upload)
+    try:
+        return model.predict_and_annotate(input_path, output_folder=output_dir)
+    finally:
+        os.remove(input_path)
+
+
+def memory_request(model, upload, upload_dir, output_dir):
+    return model.predict_and_annotate(upload, output_folder=output_dir, image_name="upload.jpg")
+
+
+MODES = {
+    "disk": disk_request,
+    "memory": memory_request,
+}
+
+
+def run_load(fn, concurrency, requests_total):
+    latencies = []
+
+    def one():
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(one) for _ in range(requests_total)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    return {"throughput_rps": round(requests_total / elapsed, 2), **summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--polygons", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated inference round trip in seconds")
+    parser.add_argument("--workdir", default=None,
+                        help="directory for spooled uploads (e.g. /tmp on Render)")
+    args = parser.parse_args()
+
+    image = synthetic_image(args.megapixels)
+    response = synthetic_predictions(image.shape, args.polygons)
+    upload = cv2.imencode(".jpg", image)[1].tobytes()
+    del image
+
+    model = SegmentationModel(
+        model=StubModel(response, latency=args.latency),
+        cache=InferenceCache(max_entries=0),
+    )
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        upload_dir = os.path.join(workdir, "uploads")
+        output_dir = os.path.join(workdir, "outputs")
+        os.makedirs(upload_dir)
+
+        for concurrency in args.concurrency:
+            for mode, fn in MODES.items():
+                result = run_load(
+                    lambda: fn(model, upload, upload_dir, output_dir),
+                    concurrency,
+                    args.requests,
+                )
+                print(json.dumps({
+                    "mode": mode,
+                    "concurrency": concurrency,
+                    "upload_mb": round(len(upload) / 1e6, 2),
+                    **result,
+                }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Measure gunicorn per-worker memory and first-request latency with and
+without preload_app + warm-up, serving the app with a local stub model.
+
+    python benchmarks/bench_workers.py --workers 4 --requests 200
+
+RSS counts shared pages in every worker; PSS splits them between the
+processes sharing them and USS counts only the worker's private pages, so
+PSS/USS show what copy-on-write sharing saves.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from common import API_SERVER_DIR, SAMPLE_IMAGE, free_port, summarize, wait_ready
+
+CONFIGS = {
+    "per_worker_load": {"GUNICORN_PRELOAD": "false", "MODEL_LOADING": "eager", "MODEL_WARMUP": "false"},
+    "preload_warmup": {"GUNICORN_PRELOAD": "true", "MODEL_LOADING": "eager", "MODEL_WARMUP": "true"},
+}
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def memory_mb(pid):
+    """Return RSS, PSS and USS of a process in MB (Linux smaps_rollup)."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(fields["Rss"], 1),
+        "pss_mb": round(fields["Pss"], 1),
+        "uss_mb": round(fields["Private_Clean"] + fields["Private_Dirty"], 1),
+    }
+
+
+def run(name, env_overrides, args, upload):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        **env_overrides,
+        "PORT": str(port),
+        "WEB_CONCURRENCY": str(args.workers),
+        "GUNICORN_THREADS": "1",
+        "STUB_LATENCY": str(args.latency),
+        "INFERENCE_CACHE_ENTRIES": "0",
+        "INFERENCE_CACHE_DIR": "",
+    }
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--pythonpath", "benchmarks", "stub_app:app"],
+        cwd=API_SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(url, timeout=120)
+        # Let every worker finish booting before measuring
+        while len(children(server.pid)) < args.workers:
+            time.sleep(0.1)
+        time.sleep(1)
+        boot_s = time.perf_counter() - start
+
+        latencies = []
+        for _ in range(args.requests):
+            t = time.perf_counter()
+            response = requests.post(
+                url + "/predict",
+                files={"file": ("field.png", upload)},
+                data={"return_annotated": "true"},
+            )
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - t) * 1000)
+
+        workers = [memory_mb(pid) for pid in children(server.pid)]
+        first = latencies[:args.workers * 2]
+        steady = latencies[args.workers * 2:]
+        return {
+            "mode": name,
+            "workers": args.workers,
+            "boot_s": round(boot_s, 2),
+            "master": memory_mb(server.pid),
+            "per_worker": workers,
+            "worker_rss_mb_mean": round(sum(w["rss_mb"] for w in workers) / len(workers), 1),
+            "worker_pss_mb_mean": round(sum(w["pss_mb"] for w in workers) / len(workers), 1),
+            "worker_uss_mb_mean": round(sum(w["uss_mb"] for w in workers) / len(workers), 1),
+            "first_requests": {"max_ms": round(max(first), 1), **summarize(first)},
+            "steady_state": summarize(steady),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated inference round trip in seconds")
+    parser.add_argument("--modes", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    args = parser.parse_args()
+
+    with open(SAMPLE_IMAGE, "rb") as f:
+        upload = f.read()
+
+    for name in args.modes:
+        print(json.dumps(run(name, CONFIGS[name], args, upload)))
+
+
+if __name__ == "__main__":
+    main()
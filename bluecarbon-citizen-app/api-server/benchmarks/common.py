@@ -0,0 +1,150 @@
+"""
+Shared helpers for the API server benchmarks.
+Builds synthetic field photos and grass polygons, and measures peak RSS of a
+benchmark case by running it in a fresh interpreter.
+"""
+
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import requests
+
+API_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if API_SERVER_DIR not in sys.path:
+    sys.path.insert(0, API_SERVER_DIR)
+
+# Bundled field photo, also the default warm-up image
+SAMPLE_IMAGE = os.path.normpath(
+    os.path.join(API_SERVER_DIR, "..", "..", "assets", "images", "img1.png")
+)
+
+
+def image_shape_for_megapixels(megapixels, aspect=4 / 3):
+    """Return an (h, w) shape with roughly the requested number of megapixels."""
+    h = int(np.sqrt(megapixels * 1e6 / aspect))
+    w = int(h * aspect)
+    return h, w
+
+
+def synthetic_image(megapixels, seed=0):
+    """
+    Build a BGR uint8 image of the given size with grass-like texture.
+    The left half is green-dominant and the right half red-dominant so both
+    health classes occur.
+    """
+    rng = np.random.default_rng(seed)
+    h, w = image_shape_for_megapixels(megapixels)
+    image = rng.integers(0, 80, size=(h, w, 3), dtype=np.uint8)
+    image[:, : w // 2, 1] += 120
+    image[:, w // 2 :, 2] += 120
+    return image
+
+
+def synthetic_polygons(shape, count, seed=0, max_radius_frac=0.12):
+    """
+    Build `count` random star-shaped polygons inside an image of `shape`.
+    Returns a list of (K, 2) int32 arrays of x, y points.
+    """
+    rng = np.random.default_rng(seed)
+    h, w = shape[:2]
+    polygons = []
+    for _ in range(count):
+        radius = rng.uniform(0.2, 1.0) * max_radius_frac * min(h, w)
+        cx = rng.uniform(0, w)
+        cy = rng.uniform(0, h)
+        n = int(rng.integers(8, 40))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n))
+        radii = radius * rng.uniform(0.6, 1.0, n)
+        xs = cx + radii * np.cos(angles)
+        ys = cy + radii * np.sin(angles)
+        polygons.append(np.stack([xs, ys], axis=1).astype(np.int32))
+    return polygons
+
+
+def synthetic_predictions(shape, count, seed=0, class_name="grass"):
+    """Build a Roboflow-style instance segmentation response for `shape`."""
+    h, w = shape[:2]
+    predictions = []
+    for i, points in enumerate(synthetic_polygons(shape, count, seed=seed)):
+        x0, y0 = points.min(axis=0)
+        x1, y1 = points.max(axis=0)
+        predictions.append({
+            "x": float(x0 + x1) / 2,
+            "y": float(y0 + y1) / 2,
+            "width": float(x1 - x0),
+            "height": float(y1 - y0),
+            "confidence": 0.9,
+            "class": class_name,
+            "class_id": 0,
+            "detection_id": f"synthetic-{i}",
+            "points": [{"x": float(x), "y": float(y)} for x, y in points],
+        })
+    return {"image": {"width": w, "height": h}, "predictions": predictions}
+
+
+def peak_rss_mb():
+    """Return this process's peak resident set size in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def timed(fn, repeat):
+    """Run `fn` `repeat` times and return the list of latencies in ms."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    """Summarize a list of latencies (ms) into mean/p50/p95/min."""
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": round(float(np.mean(ordered)), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "min_ms": round(ordered[0], 3),
+    }
+
+
+def run_isolated(script, args):
+    """
+    Run a benchmark case in a fresh interpreter so its peak RSS is not
+    polluted by other cases, and return the JSON it prints on stdout.
+    """
+    output = subprocess.run(
+        [sys.executable, script, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    """Return a free local TCP port."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout):
+    """Poll a server's /ready endpoint until it answers 200."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url + "/ready", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("server did not become ready")
@@ -0,0 +1,123 @@
+"""
+Pseudo-terminal stand-in for the BlueGuard Arduino: writes one JSON reading
+per line ({"h2_conc", "h2_alert", "water_cm", "servo_pos", "seq"}) at a
+fixed rate to the master side of a pty, so the API server can open the
+slave side as its serial port. Lines can be written in random fragments
+and mixed with non-JSON noise, as a real serial link delivers them.
+
+Run it standalone and connect the API server to the printed port:
+
+    python benchmarks/fake_arduino.py --rate 10 --split-rate 0.3
+    curl -X POST localhost:5000/iot/connect -H 'Content-Type: application/json' \\
+        -d '{"port": "/dev/pts/N"}'
+
+or start it in-process with FakeArduino (see bench_serial_reader.py).
+`seq` numbers the readings, so a consumer can tell how stale its value is.
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import tty
+
+
+class FakeArduino:
+    """Writes sensor readings to a pty at `rate` lines per second."""
+
+    def __init__(self, rate=1.0, split_rate=0.0, noise_rate=0.0, gas_threshold=100, seed=0):
+        self.rate = rate
+        self.split_rate = split_rate
+        self.noise_rate = noise_rate
+        self.gas_threshold = gas_threshold
+        self.random = random.Random(seed)
+
+        self._master, self._slave = os.openpty()
+        # No echo or newline translation, like a serial line
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+
+        self.seq = 0
+        self.sent_at = {}
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reading(self):
+        h2_conc = self.random.randint(20, 300)
+        return {
+            "h2_conc": h2_conc,
+            "h2_alert": 1 if h2_conc > self.gas_threshold else 0,
+            "water_cm": self.random.randint(5, 80),
+            "servo_pos": self.random.choice([0, 45, 90, 135, 180]),
+            "seq": self.seq,
+        }
+
+    def _write(self, data):
+        try:
+            os.write(self._master, data)
+        except BlockingIOError:
+            # Nobody is reading the port and its buffer is full
+            self.dropped += 1
+
+    def emit(self):
+        """Write the next reading (and maybe a noise line), possibly in fragments."""
+        self.seq += 1
+        line = json.dumps(self.reading()).encode() + b"\n"
+        if self.random.random() < self.noise_rate:
+            line = b"sensor warming up...\n" + line
+        self.sent_at[self.seq] = time.time()
+        self.sent_at.pop(self.seq - 100000, None)
+        if self.random.random() < self.split_rate:
+            cut = self.random.randint(1, len(line) - 1)
+            self._write(line[:cut])
+            time.sleep(0.001)
+            self._write(line[cut:])
+        else:
+            self._write(line)
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        due = time.monotonic()
+        while not self._stop.is_set():
+            self.emit()
+            due += interval
+            self._stop.wait(max(0.0, due - time.monotonic()))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        os.close(self._master)
+        os.close(self._slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=1.0, help="readings per second")
+    parser.add_argument("--split-rate", type=float, default=0.0,
+                        help="share of lines written in two fragments")
+    parser.add_argument("--noise-rate", type=float, default=0.0,
+                        help="share of lines preceded by a non-JSON line")
+    args = parser.parse_args()
+
+    arduino = FakeArduino(rate=args.rate, split_rate=args.split_rate,
+                          noise_rate=args.noise_rate).start()
+    print(f"Fake Arduino on {arduino.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        arduino.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Local HTTP stand-in for the hosted Roboflow model API, with injected
+latency, failures and a limited uplink. It accepts the same multipart upload
+as the hosted endpoint (POST /<project>/<version>?api_key=...&confidence=...)
+and answers with synthetic polygons scaled to the uploaded image, or with
+the predictions of any local backend (e.g. BlobBackend, which looks at the
+pixels at a fixed input size like the hosted model).
+
+Run it standalone and point the API server at it:
+
+    python benchmarks/fake_roboflow.py --port 9001 --latency 0.2 --failure-rate 0.3
+    ROBOFLOW_API_URL=http://127.0.0.1:9001 ROBOFLOW_API_KEY=test python app.py
+
+or start it in-process with FakeRoboflowServer (see bench_inference_client.py).
+The failure settings are plain attributes and may be changed while it runs.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+from common import free_port, synthetic_predictions
+from inference_module import ImageSource
+from stub_model import BlobBackend, ReplayBackend
+
+
+class FakeRoboflowServer:
+    """Threaded WSGI server imitating the hosted inference endpoint."""
+
+    def __init__(self, port=None, latency=0.0, failure_rate=0.0, failure_status=503,
+                 slow_rate=0.0, slow_latency=5.0, polygons=20, seed=0, backend=None,
+                 upload_mbps=None):
+        self.port = port or free_port()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.upload_mbps = upload_mbps
+
+        self.backend = backend or ReplayBackend(
+            synthetic_predictions((1000, 1000), polygons, seed=seed)
+        )
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        with self._lock:
+            self.requests += 1
+            roll = self.random.random()
+            slow = self.random.random() < self.slow_rate
+
+        delay = self.slow_latency if slow else self.latency
+        if self.upload_mbps:
+            # Transfer time of the request body over the simulated uplink
+            delay += (request.content_length or 0) * 8 / (self.upload_mbps * 1e6)
+        time.sleep(delay)
+
+        if roll < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            response = Response(json.dumps({"message": "injected failure"}),
+                                status=self.failure_status, mimetype="application/json")
+        elif not request.args.get("api_key"):
+            response = Response(json.dumps({"message": "missing api_key"}),
+                                status=403, mimetype="application/json")
+        elif "file" not in request.files:
+            response = Response(json.dumps({"message": "missing file"}),
+                                status=400, mimetype="application/json")
+        else:
+            confidence = float(request.args.get("confidence", 40))
+            source = ImageSource(request.files["file"].read())
+            result = self.backend.predict(source, confidence)
+            response = Response(json.dumps(result), mimetype="application/json")
+        return response(environ, start_response)
+
+    def start(self):
+        self._server = make_server("127.0.0.1", self.port, self, threaded=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--polygons", type=int, default=20)
+    parser.add_argument("--upload-mbps", type=float, default=None,
+                        help="simulated client uplink bandwidth")
+    parser.add_argument("--blob-model", type=int, default=None, metavar="INPUT_SIZE",
+                        help="predict green blobs at this input size instead of "
+                             "replaying synthetic polygons")
+    args = parser.parse_args()
+
+    server = FakeRoboflowServer(
+        port=args.port, latency=args.latency, failure_rate=args.failure_rate,
+        failure_status=args.failure_status, slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency, polygons=args.polygons,
+        backend=BlobBackend(input_size=args.blob_model) if args.blob_model else None,
+        upload_mbps=args.upload_mbps,
+    ).start()
+    print(f"Fake Roboflow API on {server.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+WSGI entry point for the server benchmarks: the real app, with the hosted
+model replaced by a local stub that answers in STUB_LATENCY seconds.
+The stub replays the Roboflow response recorded in STUB_RECORDED (a JSON
+file) or, by default, STUB_POLYGONS synthetic polygons, scaled to the size
+of each uploaded image.
+
+    gunicorn --pythonpath benchmarks stub_app:app
+"""
+
+import os
+
+import cv2
+
+from common import SAMPLE_IMAGE, synthetic_predictions
+import segmentation_module
+from stub_model import ReplayBackend
+
+_latency = float(os.getenv("STUB_LATENCY", "0"))
+if os.getenv("STUB_RECORDED"):
+    _backend = ReplayBackend.from_file(os.getenv("STUB_RECORDED"), _latency)
+else:
+    _backend = ReplayBackend(
+        synthetic_predictions(cv2.imread(SAMPLE_IMAGE).shape, int(os.getenv("STUB_POLYGONS", "20"))),
+        _latency,
+    )
+segmentation_module.create_backend = lambda api_key=None: _backend
+
+from app import app  # noqa: E402
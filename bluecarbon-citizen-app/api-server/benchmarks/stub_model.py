@@ -0,0 +1,146 @@
+"""
+Local stand-in for the hosted Roboflow model used by the benchmarks.
+Returns a fixed instance segmentation response after an optional delay that
+simulates the network round trip.
+"""
+
+import copy
+import json
+import time
+
+
+class StubPrediction:
+    """Mimics the Roboflow prediction group: only `.json()` is used."""
+
+    def __init__(self, response):
+        self.response = response
+
+    def json(self):
+        return copy.deepcopy(self.response)
+
+
+class StubModel:
+    """Drop-in for `project.version(n).model` with a canned response."""
+
+    def __init__(self, response, latency=0.0):
+        self.response = response
+        self.latency = latency
+        self.calls = 0
+
+    def predict(self, image, confidence=40):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return StubPrediction(self.response)
+
+
+class BlobBackend:
+    """
+    Local stand-in for a segmentation backend that actually looks at the
+    pixels: every green-dominant blob is one "grass" instance. Used where
+    results must depend on the image content, e.g. per-tile inference.
+    Like a real model it sees the image resized to `input_size` on its long
+    side, so small blobs in a large image are lost.
+    """
+
+    name = "blob"
+    version = "blob-stub"
+
+    def __init__(self, latency=0.0, min_area=50, input_size=None):
+        self.latency = latency
+        self.min_area = min_area
+        self.input_size = input_size
+        self.calls = 0
+
+    def predict(self, source, confidence):
+        import cv2
+        import numpy as np
+
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        image = source.decode()
+        scale = 1.0
+        if self.input_size and max(image.shape[:2]) > self.input_size:
+            scale = self.input_size / max(image.shape[:2])
+            seen = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            seen = image
+        b, g, r = cv2.split(seen)
+        mask = ((g.astype(np.int16) - np.maximum(b, r)) > 40).astype(np.uint8)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        predictions = []
+        for i, contour in enumerate(contours):
+            if cv2.contourArea(contour) < self.min_area:
+                continue
+            contour = contour / scale
+            x, y, w, h = cv2.boundingRect(contour.astype(np.int32))
+            predictions.append({
+                "x": x + w / 2,
+                "y": y + h / 2,
+                "width": float(w),
+                "height": float(h),
+                "confidence": 0.9,
+                "class": "grass",
+                "class_id": 0,
+                "detection_id": f"blob-{i}",
+                "points": [{"x": float(px), "y": float(py)} for px, py in contour.reshape(-1, 2)],
+            })
+        return {"image": {"width": image.shape[1], "height": image.shape[0]}, "predictions": predictions}
+
+    def info(self):
+        return {"backend": self.name, "version": self.version, "classes": ["grass"]}
+
+
+class ReplayBackend:
+    """
+    Segmentation backend that replays a recorded Roboflow response (the
+    raw JSON of a real prediction, or a synthetic one) for any image: the
+    polygons are scaled from the recorded image size to the size of the
+    image being predicted, and predictions under the confidence threshold
+    are dropped as the hosted API does.
+    """
+
+    name = "replay"
+    version = "replay-stub"
+
+    def __init__(self, response, latency=0.0):
+        self.response = response
+        self.latency = latency
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path, latency=0.0):
+        with open(path) as f:
+            return cls(json.load(f), latency)
+
+    def predict(self, source, confidence):
+        from tiling_module import image_size
+
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        width, height = image_size(source)
+        recorded = self.response["image"]
+        sx = width / float(recorded["width"])
+        sy = height / float(recorded["height"])
+
+        predictions = []
+        for pred in self.response["predictions"]:
+            if pred.get("confidence", 1.0) * 100 < confidence:
+                continue
+            predictions.append({
+                **pred,
+                "x": pred["x"] * sx,
+                "y": pred["y"] * sy,
+                "width": pred["width"] * sx,
+                "height": pred["height"] * sy,
+                "points": [{"x": p["x"] * sx, "y": p["y"] * sy} for p in pred.get("points", [])],
+            })
+        return {"image": {"width": width, "height": height}, "predictions": predictions}
+
+    def info(self):
+        return {"backend": self.name, "version": self.version, "classes": ["grass"]}
@@ -0,0 +1,385 @@
+"""
+Offline benchmark suite for the API server, for catching regressions.
+
+    python benchmarks/suite.py run --output results.json
+    python benchmarks/suite.py run --quick --baseline baseline.json
+    python benchmarks/suite.py compare baseline.json results.json
+
+Nothing leaves the machine: the model is replaced by a stub that replays a
+recorded Roboflow response (--recorded, or synthetic polygons) scaled to
+each image, images are synthetic and seeded, and the IoT routes run in mock
+mode (RENDER=true). The suite measures:
+
+- stages: per-stage cost of predict_and_annotate and predict_only
+  in-process (StageTimer), per image size and polygon count
+- predict: /predict latency and throughput against the app under gunicorn
+  at each concurrency level, per image size
+- iot: request throughput of the IoT routes at each concurrency level
+
+Results are written as JSON: run metadata and a flat list of metrics, each
+with a unit and whether lower or higher is better. `--baseline` (or the
+compare command) flags metrics that got worse than the baseline by more
+than `--tolerance` (timings also by at least `--min-delta-ms`) and exits
+with status 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+import requests
+
+from common import (
+    API_SERVER_DIR,
+    free_port,
+    summarize,
+    synthetic_image,
+    synthetic_predictions,
+    wait_ready,
+)
+
+IOT_ROUTES = (
+    "/iot/status",
+    "/iot/data/current",
+    "/iot/data/history?limit=50",
+    "/iot/alerts",
+    "/iot/analytics",
+)
+
+
+def metric(results, name, value, unit, better="lower", **labels):
+    results.append({
+        "name": name,
+        "labels": labels,
+        "value": round(float(value), 3),
+        "unit": unit,
+        "better": better,
+    })
+
+
+def metric_key(entry):
+    labels = ",".join(f"{k}={v}" for k, v in sorted(entry["labels"].items()))
+    return f"{entry['name']}{{{labels}}}"
+
+
+def recorded_response(args):
+    if args.recorded:
+        with open(args.recorded) as f:
+            return json.load(f)
+    return synthetic_predictions(synthetic_image(1).shape, 20)
+
+
+def encoded_image(megapixels):
+    return cv2.imencode(".jpg", synthetic_image(megapixels), [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def bench_stages(args, results):
+    """Per-stage cost of the segmentation pipeline, in-process."""
+    from cache_module import InferenceCache
+    from metrics_module import StageTimer
+    from segmentation_module import SegmentationModel
+    from stub_model import ReplayBackend
+
+    for megapixels in args.megapixels:
+        upload = encoded_image(megapixels)
+        shape = synthetic_image(megapixels).shape
+        for polygons in args.polygons:
+            backend = ReplayBackend(synthetic_predictions(shape, polygons))
+            model = SegmentationModel(backend=backend, cache=InferenceCache(max_entries=0))
+            labels = {"megapixels": megapixels, "polygons": polygons}
+
+            with tempfile.TemporaryDirectory() as output_folder:
+                for path in ("annotate", "predict_only"):
+                    stages = {}
+                    totals = []
+                    for i in range(args.repeat + 1):
+                        timer = StageTimer()
+                        if path == "annotate":
+                            model.predict_and_annotate(upload, output_folder=output_folder,
+                                                       image_name="bench.jpg", timer=timer)
+                        else:
+                            model.predict_only(upload, image_name="bench.jpg", timer=timer)
+                        if i == 0:
+                            continue  # warm-up
+                        summary = timer.summary()
+                        totals.append(summary["total_ms"])
+                        for stage, ms in summary["stages_ms"].items():
+                            stages.setdefault(stage, []).append(ms)
+
+                    metric(results, "stage_ms", np.median(totals), "ms",
+                           path=path, stage="total", **labels)
+                    for stage, values in stages.items():
+                        metric(results, "stage_ms", np.median(values), "ms",
+                               path=path, stage=stage, **labels)
+            print(f"stages: {megapixels} MP, {polygons} polygons done", file=sys.stderr)
+
+
+def load(url, concurrency, requests_total, make_request):
+    """
+    Run `requests_total` requests from `concurrency` threads, each with its
+    own keep-alive session. Returns (latencies in ms, elapsed seconds, errors).
+    """
+    per_thread = max(1, requests_total // concurrency)
+
+    def worker(_):
+        session = requests.Session()
+        latencies, errors = [], 0
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            try:
+                response = make_request(session, url)
+                if response.status_code >= 400:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+        session.close()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies = [ms for outcome in outcomes for ms in outcome[0]]
+    return latencies, elapsed, sum(outcome[1] for outcome in outcomes)
+
+
+def start_server(args, recorded_path):
+    port = free_port()
+    env = {
+        **os.environ,
+        "RENDER": "true",  # IoT mock mode
+        "PORT": str(port),
+        "WEB_CONCURRENCY": str(args.workers),
+        "GUNICORN_THREADS": str(max(args.concurrency)),
+        "STUB_RECORDED": recorded_path,
+        "STUB_LATENCY": str(args.latency),
+        "INFERENCE_CACHE_ENTRIES": "0",
+        "INFERENCE_CACHE_DIR": "",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--pythonpath", "benchmarks", "stub_app:app"],
+        cwd=API_SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(url, timeout=120)
+    except Exception:
+        server.terminate()
+        raise
+    return server, url
+
+
+def bench_server(args, results):
+    """/predict and IoT route latency and throughput under gunicorn."""
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(recorded_response(args), f)
+        recorded_path = f.name
+
+    server, url = start_server(args, recorded_path)
+    try:
+        for megapixels in args.megapixels:
+            upload = encoded_image(megapixels)
+
+            def predict(session, url):
+                return session.post(url + "/predict", files={"file": ("bench.jpg", upload)},
+                                    data={"return_annotated": "true"})
+
+            load(url, 1, 2, predict)  # warm up every code path once
+            for concurrency in args.concurrency:
+                latencies, elapsed, errors = load(
+                    url, concurrency, args.requests, predict
+                )
+                stats = summarize(latencies)
+                labels = {"megapixels": megapixels, "concurrency": concurrency}
+                metric(results, "predict_latency_p50", stats["p50_ms"], "ms", **labels)
+                metric(results, "predict_latency_p95", stats["p95_ms"], "ms", **labels)
+                metric(results, "predict_throughput", len(latencies) / elapsed, "req/s",
+                       better="higher", **labels)
+                metric(results, "predict_errors", errors, "count", **labels)
+                print(f"predict: {megapixels} MP at concurrency {concurrency} done", file=sys.stderr)
+
+        for route in IOT_ROUTES:
+            def get(session, url, route=route):
+                return session.get(url + route)
+
+            for concurrency in args.concurrency:
+                latencies, elapsed, errors = load(url, concurrency, args.iot_requests, get)
+                labels = {"route": route.split("?")[0], "concurrency": concurrency}
+                metric(results, "iot_latency_p95", summarize(latencies)["p95_ms"], "ms", **labels)
+                metric(results, "iot_throughput", len(latencies) / elapsed, "req/s",
+                       better="higher", **labels)
+                metric(results, "iot_errors", errors, "count", **labels)
+        print("iot done", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+        os.remove(recorded_path)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=API_SERVER_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, tolerance, min_delta_ms=1.0):
+    """
+    Compare two result files. Returns (rows, regressions): one row per
+    metric present in both, and the rows that got worse than `tolerance`.
+    Timings must also have changed by at least `min_delta_ms`, so noise in
+    sub-millisecond stages is not flagged. Error counts regress on any
+    increase.
+    """
+    base = {metric_key(entry): entry for entry in baseline["results"]}
+    rows, regressions = [], []
+    for entry in current["results"]:
+        key = metric_key(entry)
+        if key not in base:
+            continue
+        old, new = base[key]["value"], entry["value"]
+        if entry["unit"] == "count":
+            worse = new > old
+        elif old == 0 or (entry["unit"] == "ms" and abs(new - old) < min_delta_ms):
+            worse = False
+        elif entry["better"] == "lower":
+            worse = new > old * (1 + tolerance)
+        else:
+            worse = new < old * (1 - tolerance)
+        row = {
+            "metric": key,
+            "baseline": old,
+            "current": new,
+            "change": round((new - old) / old, 4) if old else None,
+            "regression": worse,
+        }
+        rows.append(row)
+        if worse:
+            regressions.append(row)
+    return rows, regressions
+
+
+def report(rows, regressions, tolerance):
+    for row in rows:
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "n/a"
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<90} {row['baseline']:>10} -> {row['current']:>10} "
+              f"({change}){flag}", file=sys.stderr)
+    print(f"{len(regressions)} of {len(rows)} metrics regressed by more than "
+          f"{tolerance:.0%}", file=sys.stderr)
+
+
+def run(args):
+    if args.quick:
+        args.megapixels = args.megapixels or [1]
+        args.polygons = args.polygons or [20]
+        args.concurrency = args.concurrency or [1, 4]
+        args.repeat = min(args.repeat, 3)
+        args.requests = min(args.requests, 16)
+        args.iot_requests = min(args.iot_requests, 100)
+    args.megapixels = args.megapixels or [1, 12]
+    args.polygons = args.polygons or [10, 50]
+    args.concurrency = args.concurrency or [1, 4, 8]
+
+    results = []
+    if "stages" in args.sections:
+        bench_stages(args, results)
+    if "server" in args.sections:
+        bench_server(args, results)
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "config": {
+                key: getattr(args, key) for key in (
+                    "megapixels", "polygons", "concurrency", "repeat", "requests",
+                    "iot_requests", "workers", "latency", "recorded",
+                )
+            },
+        },
+        "results": results,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(baseline, output, args.tolerance, args.min_delta_ms)
+        report(rows, regressions, args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite")
+    run_parser.add_argument("--sections", nargs="+", default=["stages", "server"],
+                            choices=["stages", "server"])
+    run_parser.add_argument("--megapixels", type=float, nargs="+")
+    run_parser.add_argument("--polygons", type=int, nargs="+")
+    run_parser.add_argument("--concurrency", type=int, nargs="+")
+    run_parser.add_argument("--repeat", type=int, default=10,
+                            help="in-process repetitions per stage case")
+    run_parser.add_argument("--requests", type=int, default=48,
+                            help="/predict requests per concurrency level")
+    run_parser.add_argument("--iot-requests", type=int, default=400,
+                            help="requests per IoT route and concurrency level")
+    run_parser.add_argument("--workers", type=int, default=2)
+    run_parser.add_argument("--latency", type=float, default=0.0,
+                            help="simulated inference round trip in seconds")
+    run_parser.add_argument("--recorded", default=None,
+                            help="recorded Roboflow response JSON to replay")
+    run_parser.add_argument("--quick", action="store_true",
+                            help="small configuration for a fast check")
+    run_parser.add_argument("--output", default=None)
+    run_parser.add_argument("--baseline", default=None)
+    run_parser.add_argument("--tolerance", type=float, default=0.15)
+    run_parser.add_argument("--min-delta-ms", type=float, default=1.0)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+    compare_parser.add_argument("--min-delta-ms", type=float, default=1.0)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        sys.exit(run(args))
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, args.tolerance, args.min_delta_ms)
+    report(rows, regressions, args.tolerance)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
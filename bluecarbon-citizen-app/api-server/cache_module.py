@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceCache:
+    """
+    Content-addressed cache for segmentation results.
+    Entries are keyed on the image content hash, confidence threshold and
+    model version. An in-memory LRU tier sits in front of an optional
+    on-disk tier whose total size is bounded.
+    """
+
+    def __init__(self, max_entries=128, max_memory_bytes=64 * 1024 * 1024,
+                 disk_dir=None, max_disk_bytes=512 * 1024 * 1024,
+                 store_annotated=False):
+        """Initialize the cache tiers."""
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.store_annotated = store_annotated
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_files())
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from INFERENCE_CACHE_* environment variables."""
+        return cls(
+            max_entries=int(os.getenv("INFERENCE_CACHE_ENTRIES", "128")),
+            max_memory_bytes=int(os.getenv("INFERENCE_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+            disk_dir=os.getenv("INFERENCE_CACHE_DIR") or None,
+            max_disk_bytes=int(os.getenv("INFERENCE_CACHE_DISK_MB", "512")) * 1024 * 1024,
+            store_annotated=os.getenv("INFERENCE_CACHE_ANNOTATED", "false").lower() == "true",
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or bool(self.disk_dir)
+
+    @staticmethod
+    def make_key(image, confidence, model_version):
+        """
+        Hash the image content together with the inference parameters.
+        `image` may be a file path, encoded bytes or a decoded array.
+        """
+        digest = hashlib.sha256()
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        elif hasattr(image, "shape"):
+            if not image.flags.c_contiguous:
+                image = image.copy(order="C")
+            digest.update(f"{image.shape}|{image.dtype}|".encode())
+            digest.update(memoryview(image))
+        else:
+            digest.update(image)
+        digest.update(f"|{confidence}|{model_version}".encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up an entry. Returns a dict with "result" (the raw prediction
+        JSON) and, if stored,
+        "labels" and "annotated" (encoded image bytes), or None on a miss.
+        """
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return cached[0]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._put_memory(key, entry)
+        return entry
+
+    def put(self, key, result, labels=None, annotated=None):
+        """Store the raw prediction JSON and, optionally, the annotated output."""
+        entry = {"result": result}
+        if self.store_annotated and annotated is not None:
+            entry["labels"] = labels
+            entry["annotated"] = annotated
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if annotated is None and cached is not None and "annotated" in cached[0]:
+                # Keep the richer entry already cached for this image
+                return
+            self._put_memory(key, entry)
+        self._write_disk(key, entry)
+
+    def stats(self):
+        """Return hit/miss/eviction counters and tier sizes."""
+        with self._lock:
+            counters = dict(self.counters)
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            return {
+                **counters,
+                "hit_rate": round(
+                    (counters["memory_hits"] + counters["disk_hits"]) / lookups, 4
+                ) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_enabled": bool(self.disk_dir),
+                "disk_bytes": self._disk_bytes,
+                "store_annotated": self.store_annotated,
+            }
+
+    def _entry_size(self, entry):
+        return len(json.dumps(entry["result"])) + len(entry.get("annotated") or b"")
+
+    def _put_memory(self, key, entry):
+        """Insert into the LRU tier and evict down to its bounds. Lock held."""
+        if self.max_entries <= 0:
+            return
+
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        size = self._entry_size(entry)
+        self._memory[key] = (entry, size)
+        self._memory_bytes += size
+
+        while self._memory and (
+            len(self._memory) > self.max_entries
+            or self._memory_bytes > self.max_memory_bytes
+        ):
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.counters["memory_evictions"] += 1
+
+    def _disk_paths(self, key):
+        base = os.path.join(self.disk_dir, key)
+        return base + ".json", base + ".annotated"
+
+    def _disk_files(self):
+        """List (path, mtime, size) of cache files on disk."""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((path, stat.st_mtime, stat.st_size))
+        return files
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+
+        json_path, annotated_path = self._disk_paths(key)
+        try:
+            with open(json_path) as f:
+                entry = json.load(f)
+            os.utime(json_path)
+            if "labels" in entry and os.path.exists(annotated_path):
+                with open(annotated_path, "rb") as f:
+                    entry["annotated"] = f.read()
+                os.utime(annotated_path)
+            else:
+                entry.pop("labels", None)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+
+        json_path, annotated_path = self._disk_paths(key)
+        record = {"result": entry["result"]}
+        if "annotated" in entry:
+            record["labels"] = entry["labels"]
+
+        try:
+            written = self._write_atomic(json_path, json.dumps(record).encode())
+            if "annotated" in entry:
+                written += self._write_atomic(annotated_path, entry["annotated"])
+        except OSError as e:
+            logger.error(f"Failed to write cache entry {key}: {str(e)}")
+            return
+
+        with self._lock:
+            self._disk_bytes += written
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _write_atomic(self, path, data):
+        """Write via a temp file and rename. Returns the net change in bytes."""
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        # Unique per process and thread: workers share the cache directory
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return len(data) - previous
+
+    def _evict_disk(self):
+        """Delete least recently used files until the tier fits its bound."""
+        files = sorted(self._disk_files(), key=lambda item: item[1])
+        total = sum(size for _, _, size in files)
+
+        evicted = 0
+        for path, _, size in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if path.endswith(".json"):
+                evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+            self.counters["disk_evictions"] += evicted
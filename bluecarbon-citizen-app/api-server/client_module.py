@@ -0,0 +1,253 @@
+import os
+import random
+import threading
+import time
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: the request itself was fine, the service was not
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class InferenceUnavailableError(Exception):
+    """Raised when the remote model cannot answer within the call's deadline."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(InferenceUnavailableError):
+    """Raised without calling the service while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive failed calls.
+    The circuit stays open for `reset_timeout` seconds, then lets one trial
+    call through (half-open): success closes it, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """Initialize a closed breaker."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+        self.counters = {"opened": 0, "short_circuited": 0}
+
+    def allow(self):
+        """
+        Return before a call, or raise CircuitOpenError if it must not be
+        made.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            self.counters["short_circuited"] += 1
+            raise CircuitOpenError(
+                "Inference service unavailable (circuit open)",
+                retry_after=max(1, int(remaining + 1)),
+            )
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Inference circuit closed")
+            self.state = "closed"
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or (
+                self.state == "closed" and self._failures >= self.failure_threshold
+            ):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.counters["opened"] += 1
+                logger.warning(
+                    f"Inference circuit opened after {self._failures} consecutive failures"
+                )
+
+    def status(self):
+        with self._lock:
+            status = {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                **self.counters,
+            }
+            if self.state == "open":
+                status["retry_in_seconds"] = round(
+                    max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 1
+                )
+            return status
+
+
+class InferenceClient:
+    """
+    HTTP client for the hosted Roboflow model API.
+    A pooled keep-alive session is reused across calls. Each call has a
+    deadline covering all of its attempts. Connection errors, timeouts,
+    unreadable responses and 429/5xx responses are retried with jittered
+    exponential backoff, since inference has no side effects. A circuit
+    breaker fails fast while the service keeps failing.
+    """
+
+    def __init__(self, api_key, model_id, base_url="https://serverless.roboflow.com",
+                 connect_timeout=3.05, read_timeout=20, deadline=30, retries=2,
+                 backoff=0.25, pool_size=8, breaker=None):
+        """Initialize the client. Connections are opened on first use."""
+        self.api_key = api_key
+        self.model_id = model_id
+        self.url = f"{base_url.rstrip('/')}/{model_id}"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+
+        self._session = None
+        self._lock = threading.Lock()
+
+        self.counters = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "failures": 0,
+            "timeouts": 0,
+        }
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_env(cls, api_key, model_id):
+        """Build a client from ROBOFLOW_API_URL, INFERENCE_* and CIRCUIT_* variables."""
+        return cls(
+            api_key,
+            model_id,
+            base_url=os.getenv("ROBOFLOW_API_URL", "https://serverless.roboflow.com"),
+            connect_timeout=float(os.getenv("INFERENCE_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.getenv("INFERENCE_READ_TIMEOUT", "20")),
+            deadline=float(os.getenv("INFERENCE_DEADLINE_SECONDS", "30")),
+            retries=int(os.getenv("INFERENCE_RETRIES", "2")),
+            backoff=float(os.getenv("INFERENCE_BACKOFF_SECONDS", "0.25")),
+            pool_size=int(os.getenv("INFERENCE_POOL_SIZE", "8")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+            ),
+        )
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def predict(self, data, confidence, filename="image.jpg", content_type="image/jpeg"):
+        """
+        Upload encoded image bytes and return the prediction JSON.
+        Raises InferenceUnavailableError (CircuitOpenError when failing fast)
+        if no attempt succeeds before the deadline, and HTTPError for
+        responses that are not worth retrying (e.g. a bad API key).
+        """
+        self.breaker.allow()
+        session = self._get_session()
+        params = {"api_key": self.api_key, "confidence": confidence}
+        deadline = time.monotonic() + self.deadline
+        self._count("calls")
+
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            self._count("attempts")
+            try:
+                response = session.post(
+                    self.url,
+                    params=params,
+                    files={"file": (filename, data, content_type)},
+                    timeout=(
+                        min(self.connect_timeout, remaining),
+                        min(self.read_timeout, remaining),
+                    ),
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    result = response.json()
+                    self.breaker.record_success()
+                    return result
+                error = f"HTTP {response.status_code}"
+            except requests.HTTPError:
+                # A client error: the service is up, do not count it against it
+                self.breaker.record_success()
+                raise
+            except (requests.RequestException, ValueError) as e:
+                # Connection errors, timeouts, broken or non-JSON responses
+                if isinstance(e, requests.Timeout):
+                    self._count("timeouts")
+                error = type(e).__name__
+
+            # Full jitter: a random pause up to the exponential backoff
+            pause = random.uniform(0, self.backoff * 2 ** attempt)
+            if attempt >= self.retries or time.monotonic() + pause >= deadline:
+                self._count("failures")
+                self.breaker.record_failure()
+                raise InferenceUnavailableError(
+                    f"Inference failed after {attempt + 1} attempts: {error}"
+                )
+
+            logger.warning(f"Inference attempt {attempt + 1} failed ({error}), retrying")
+            time.sleep(pause)
+            attempt += 1
+            self._count("retries")
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @property
+    def degraded(self):
+        return self.breaker.state != "closed"
+
+    def stats(self):
+        """Return call counters, timeouts and the circuit breaker state."""
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "deadline_seconds": self.deadline,
+            "max_retries": self.retries,
+            "circuit": self.breaker.status(),
+        }
+
+    def _after_fork(self):
+        # Pooled connections must not be shared with the parent process
+        self._lock = threading.Lock()
+        self._session = None
@@ -0,0 +1,387 @@
+import heapq
+import itertools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: no forking workers to elect from
+    fcntl = None
+
+from iot_module import BlueGuardIoT
+from reader_module import SerialReader
+
+logger = logging.getLogger(__name__)
+
+DEVICE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+# Settings accepted for a device in IOT_DEVICES and by DeviceRegistry.add
+DEVICE_SETTINGS = {
+    "port": str,
+    "baudrate": int,
+    "history_size": int,
+    "poll_interval": float,
+    "gas_threshold": float,
+    "water_critical_level": float,
+    "monitor": bool,
+}
+
+
+class UnknownDeviceError(KeyError):
+    """Raised when a device id is not in the registry."""
+
+    def __str__(self):
+        return f"Unknown device: {self.args[0]}"
+
+
+class InvalidDeviceConfig(ValueError):
+    """Raised for a device id or settings that cannot be registered."""
+
+
+class DeviceScheduler:
+    """
+    Polls any number of monitored devices from one scheduler thread instead
+    of one sleeping thread per device. Devices wait in a heap ordered by
+    their next due time; when one is due, its poll() runs on a small shared
+    pool of `workers` threads (so one slow poll does not hold up the
+    others) and it is scheduled again `poll_interval` after its previous due
+    time. Late polls are counted, not made up for.
+    """
+
+    def __init__(self, workers=4):
+        """Initialize the schedule. Threads start with the first device."""
+        self.workers = workers
+        self._heap = []
+        self._tokens = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pool = None
+
+        self.counters = {
+            "polls": 0,
+            "poll_errors": 0,
+            "late_polls": 0,
+        }
+        self._max_lag = 0.0
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def add(self, device):
+        """Start polling `device` every `device.poll_interval` seconds, from now."""
+        with self._cond:
+            token = self._tokens[device] = next(self._sequence)
+            heapq.heappush(self._heap, (time.monotonic(), token, device))
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="iot-poll"
+                )
+                self._thread = threading.Thread(
+                    target=self._run, name="iot-scheduler", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, device):
+        """Stop polling `device`. A poll already running finishes."""
+        with self._cond:
+            # Its heap entry is skipped when it comes up
+            self._tokens.pop(device, None)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    due, token, device = self._heap[0]
+                    if self._tokens.get(device) != token:
+                        heapq.heappop(self._heap)
+                        continue
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    break
+            self._pool.submit(self._poll, device, due, token)
+
+    def _poll(self, device, due, token):
+        lag = time.monotonic() - due
+        try:
+            device.poll()
+            error = False
+        except Exception as e:
+            logger.error(f"Error polling IoT device {device.device_id}: {str(e)}")
+            error = True
+
+        with self._cond:
+            self.counters["polls"] += 1
+            self.counters["poll_errors"] += int(error)
+            if lag > device.poll_interval:
+                self.counters["late_polls"] += 1
+            self._max_lag = max(self._max_lag, lag)
+            if self._tokens.get(device) == token:
+                next_due = max(due + device.poll_interval, time.monotonic())
+                heapq.heappush(self._heap, (next_due, token, device))
+                self._cond.notify()
+
+    def stats(self):
+        """Return poll counters, the number of devices and the worst lag seen."""
+        with self._cond:
+            return {
+                **self.counters,
+                "devices": len(self._tokens),
+                "workers": self.workers,
+                "max_lag_seconds": round(self._max_lag, 3),
+            }
+
+    def _after_fork(self):
+        # The scheduler thread and pool belong to the parent; start polling
+        # the parent's devices again in the child, which has its own copies
+        devices = list(self._tokens)
+        self._cond = threading.Condition()
+        self._heap = []
+        self._tokens = {}
+        self._thread = None
+        self._pool = None
+        for device in devices:
+            self.add(device)
+
+
+class DeviceRegistry:
+    """
+    BlueGuard stations by device id, each a BlueGuardIoT with its own port,
+    history and thresholds. Arduinos are all read by the process-wide
+    SerialReader as their data arrives, mock stations are polled by one
+    shared DeviceScheduler, and all write to one TimeSeriesStore (if any)
+    under their id. The device registered first is the default one, served by the
+    unscoped /iot/* routes.
+    The devices configured with monitor=True are monitored by exactly one
+    of the server's processes: the one holding an exclusive lock on
+    `owner_lock`. The other processes serve their readings and thresholds
+    from the store.
+    """
+
+    def __init__(self, store=None, scheduler=None, defer_monitoring=False, owner_lock=None):
+        """
+        Initialize an empty registry. With `defer_monitoring`, devices added
+        with `monitor=True` are only connected and monitored by
+        start_deferred() (in a worker after a preloading master forks), and
+        only if this process becomes the owner through `owner_lock` (a lock
+        file path; None monitors in every process).
+        """
+        self.store = store
+        self.scheduler = scheduler or DeviceScheduler()
+        self.defer_monitoring = defer_monitoring
+        self.owner_lock = owner_lock
+        self.default_id = None
+        self._devices = {}
+        self._deferred = []
+        self._lock = threading.Lock()
+        self._owner_fd = None
+        self._owner_pid = None
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_env(cls, store=None):
+        """
+        Build a registry with the devices listed in IOT_DEVICES: a JSON list
+        of {"id": ..., <DEVICE_SETTINGS>} objects, or the path of a file
+        holding one. A device with id "default" comes first, with default
+        settings unless listed. IOT_POLL_WORKERS sizes the shared poll pool;
+        IOT_MONITOR_AFTER_FORK defers monitoring to start_deferred().
+        IOT_OWNER_LOCK is the lock file electing the process that monitors
+        them (default: next to the store's database).
+        """
+        default_lock = (
+            f"{store.path}.owner.lock" if store is not None
+            else os.path.join(tempfile.gettempdir(), "blueguard-iot.owner.lock")
+        )
+        registry = cls(
+            store=store,
+            scheduler=DeviceScheduler(workers=int(os.getenv("IOT_POLL_WORKERS", "4"))),
+            defer_monitoring=True,
+            owner_lock=os.getenv("IOT_OWNER_LOCK") or default_lock,
+        )
+        devices = os.getenv("IOT_DEVICES", "").strip()
+        if devices and not devices.startswith("["):
+            with open(devices) as f:
+                devices = f.read()
+        configs = [dict(config) for config in json.loads(devices)] if devices else []
+        if not any(config.get("id") == "default" for config in configs):
+            configs.append({"id": "default"})
+        configs.sort(key=lambda config: config.get("id") != "default")
+        for config in configs:
+            registry.add(config.pop("id", None), **config)
+        if os.getenv("IOT_MONITOR_AFTER_FORK", "false").lower() != "true":
+            registry.start_deferred()
+        return registry
+
+    def _check_id(self, device_id):
+        if not isinstance(device_id, str) or not DEVICE_ID_PATTERN.match(device_id):
+            raise InvalidDeviceConfig(
+                f"Invalid device id: {device_id!r} (1-64 letters, digits, '_', '.' or '-')"
+            )
+        if device_id in self._devices:
+            raise InvalidDeviceConfig(f"Device already registered: {device_id}")
+
+    def register(self, device_id, device):
+        """Add an existing BlueGuardIoT under `device_id`."""
+        with self._lock:
+            self._check_id(device_id)
+            device.device_id = device_id
+            device.scheduler = self.scheduler
+            self._devices[device_id] = device
+            if self.default_id is None:
+                self.default_id = device_id
+        return device
+
+    def add(self, device_id, **settings):
+        """
+        Create and register a device from DEVICE_SETTINGS. With
+        `monitor=True` it is connected and monitored right away, or by
+        start_deferred() if monitoring is deferred.
+        """
+        self._check_id(device_id)
+        for name, value in settings.items():
+            expected = DEVICE_SETTINGS.get(name)
+            if expected is None:
+                raise InvalidDeviceConfig(
+                    f"Unknown device setting: {name}. Supported: {', '.join(DEVICE_SETTINGS)}"
+                )
+            if value is None:
+                continue
+            types = (int, float) if expected is float else expected
+            if isinstance(value, bool) != (expected is bool) or not isinstance(value, types):
+                raise InvalidDeviceConfig(f"Device setting {name} must be {expected.__name__}")
+            if name in ("baudrate", "history_size", "poll_interval") and value <= 0:
+                raise InvalidDeviceConfig(f"Device setting {name} must be positive")
+
+        device = BlueGuardIoT(
+            port=settings.get("port"),
+            baudrate=settings.get("baudrate") or 9600,
+            data_history_size=settings.get("history_size"),
+            store=self.store,
+            device_id=device_id,
+        )
+        if settings.get("gas_threshold") is not None or settings.get("water_critical_level") is not None:
+            device.update_thresholds(settings.get("gas_threshold"), settings.get("water_critical_level"))
+        if settings.get("poll_interval"):
+            device.poll_interval = settings["poll_interval"]
+        self.register(device_id, device)
+
+        if settings.get("monitor"):
+            with self._lock:
+                deferred = self.defer_monitoring
+                if deferred:
+                    self._deferred.append(device)
+            if not deferred and device.connect():
+                device.start_monitoring()
+        return device
+
+    def start_deferred(self):
+        """
+        Connect and monitor the devices deferred so far if this process is
+        the owner, or else serve them from the store; then stop deferring.
+        """
+        with self._lock:
+            devices, self._deferred = self._deferred, []
+            self.defer_monitoring = False
+        devices = [device for device in devices if self._devices.get(device.device_id) is device]
+        if not devices:
+            return
+        if self._claim_ownership():
+            for device in devices:
+                if device.connect():
+                    device.start_monitoring()
+            return
+
+        logger.info(
+            f"IoT devices {', '.join(device.device_id for device in devices)} are "
+            f"monitored by another process (lock {self.owner_lock})"
+        )
+        if self.store is None:
+            logger.warning("Persistent IoT storage is disabled, so this process has no readings to serve")
+        for device in devices:
+            device.serve_from_store()
+
+    def _claim_ownership(self):
+        """Take the owner lock if no other process holds it. True if this process owns it."""
+        if self.owner_lock is None or fcntl is None:
+            return True
+        if self._owner_pid == os.getpid():
+            return True
+        fd = os.open(self.owner_lock, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # Held until the process exits
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._owner_fd, self._owner_pid = fd, os.getpid()
+        logger.info(f"This process ({os.getpid()}) monitors the configured IoT devices")
+        return True
+
+    def get(self, device_id):
+        """Return the device registered as `device_id`. Raises UnknownDeviceError."""
+        with self._lock:
+            device = self._devices.get(device_id)
+        if device is None:
+            raise UnknownDeviceError(device_id)
+        return device
+
+    def remove(self, device_id):
+        """Stop monitoring, disconnect and unregister a device (not the default one)."""
+        if device_id == self.default_id:
+            raise InvalidDeviceConfig("The default device cannot be removed")
+        device = self.get(device_id)
+        device.stop_monitoring_data()
+        device.disconnect()
+        with self._lock:
+            self._devices.pop(device_id, None)
+        return device
+
+    def __len__(self):
+        return len(self._devices)
+
+    def list(self):
+        """Return the status of every device."""
+        with self._lock:
+            devices = list(self._devices.values())
+        return [device.get_system_status() for device in devices]
+
+    def stats(self):
+        """Return device counts and the scheduler's poll counters."""
+        with self._lock:
+            devices = list(self._devices.values())
+        return {
+            "devices": len(devices),
+            "connected": sum(device.is_connected for device in devices),
+            "monitoring": sum(device.is_monitoring for device in devices),
+            "default_device": self.default_id,
+            "monitoring_owner": self._owner_pid == os.getpid(),
+            "scheduler": self.scheduler.stats(),
+            "serial_reader": SerialReader.shared().stats(),
+        }
+
+    def _after_fork(self):
+        # The owner lock stays with the parent; a child must claim its own
+        if self._owner_fd is not None:
+            os.close(self._owner_fd)
+            self._owner_fd = None
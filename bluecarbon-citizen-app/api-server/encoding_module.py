@@ -0,0 +1,153 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "jpeg": ".jpg",
+    "webp": ".webp",
+}
+
+# Mimetype of each output file extension, for the responses serving them
+MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
+
+
+class InvalidOutputOptions(ValueError):
+    """Raised when requested output encoding options are invalid."""
+
+
+class OutputOptions:
+    """
+    How annotated images are encoded: format (jpeg or webp), quality
+    (1-100), optional downscaling to `max_dimension` on the long side,
+    progressive JPEG, and an optional thumbnail of `thumbnail_size` pixels
+    on the long side written in the same pass.
+    The defaults reproduce the original full-resolution quality-95 JPEG.
+    """
+
+    def __init__(self, format="jpeg", quality=95, max_dimension=None,
+                 progressive=False, thumbnail_size=None):
+        """Validate and store the options."""
+        format = (format or "jpeg").lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in FORMATS:
+            raise InvalidOutputOptions(
+                f"Unsupported output format: {format}. Supported: {', '.join(FORMATS)}"
+            )
+        if not 1 <= quality <= 100:
+            raise InvalidOutputOptions("Quality must be between 1 and 100")
+        if max_dimension is not None and max_dimension < 16:
+            raise InvalidOutputOptions("max_dimension must be at least 16 pixels")
+        if thumbnail_size is not None and thumbnail_size < 16:
+            raise InvalidOutputOptions("thumbnail_size must be at least 16 pixels")
+
+        self.format = format
+        self.quality = quality
+        self.max_dimension = max_dimension
+        self.progressive = progressive and format == "jpeg"
+        self.thumbnail_size = thumbnail_size
+
+    @classmethod
+    def from_env(cls):
+        """Server-wide defaults from OUTPUT_* environment variables."""
+        max_dimension = os.getenv("OUTPUT_MAX_DIMENSION")
+        thumbnail_size = os.getenv("OUTPUT_THUMBNAIL_SIZE")
+        return cls(
+            format=os.getenv("OUTPUT_FORMAT", "jpeg"),
+            quality=int(os.getenv("OUTPUT_QUALITY", "95")),
+            max_dimension=int(max_dimension) if max_dimension else None,
+            progressive=os.getenv("OUTPUT_PROGRESSIVE", "false").lower() == "true",
+            thumbnail_size=int(thumbnail_size) if thumbnail_size else None,
+        )
+
+    @classmethod
+    def from_form(cls, form, defaults=None):
+        """
+        Read output_format, quality, max_dimension, progressive and
+        thumbnail_size from request form data, falling back to `defaults`.
+        A max_dimension or thumbnail_size of 0 disables it.
+        """
+        defaults = defaults or cls()
+
+        def optional_int(name, default):
+            value = form.get(name)
+            if value in (None, ""):
+                return default
+            try:
+                value = int(value)
+            except ValueError:
+                raise InvalidOutputOptions(f"{name} must be an integer")
+            return value or None
+
+        quality = optional_int("quality", defaults.quality)
+        if quality is None:
+            raise InvalidOutputOptions("Quality must be between 1 and 100")
+        progressive = form.get("progressive")
+        return cls(
+            format=form.get("output_format", defaults.format),
+            quality=quality,
+            max_dimension=optional_int("max_dimension", defaults.max_dimension),
+            progressive=defaults.progressive if progressive is None
+            else progressive.lower() == "true",
+            thumbnail_size=optional_int("thumbnail_size", defaults.thumbnail_size),
+        )
+
+    @property
+    def extension(self):
+        return FORMATS[self.format]
+
+    @property
+    def is_default(self):
+        """True if the output matches the original encoding (cacheable)."""
+        return (
+            self.format == "jpeg" and self.quality == 95 and not self.progressive
+            and self.max_dimension is None and self.thumbnail_size is None
+        )
+
+    def encode_params(self):
+        # OpenCV is imported on use so the app can parse options at startup
+        # without loading it
+        import cv2
+
+        if self.format == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        if self.progressive:
+            params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        return params
+
+    def encode(self, image, max_dimension=None):
+        """
+        Downscale `image` to `max_dimension` on its long side (if larger)
+        and encode it from memory. Returns (bytes, info).
+        """
+        import cv2
+
+        h, w = image.shape[:2]
+        if max_dimension and max(h, w) > max_dimension:
+            scale = max_dimension / max(h, w)
+            image = cv2.resize(
+                image,
+                (max(1, round(w * scale)), max(1, round(h * scale))),
+                interpolation=cv2.INTER_AREA,
+            )
+
+        ok, encoded = cv2.imencode(self.extension, image, self.encode_params())
+        if not ok:
+            raise Exception(f"Failed to encode annotated image as {self.format}")
+        encoded = encoded.tobytes()
+
+        info = {
+            "format": self.format,
+            "quality": self.quality,
+            "progressive": self.progressive,
+            "width": image.shape[1],
+            "height": image.shape[0],
+            "bytes": len(encoded),
+        }
+        return encoded, info
@@ -0,0 +1,378 @@
+import math
+import threading
+from collections import deque
+from datetime import datetime
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Column name and dtype of each stored field. Readings are stored as epoch
+# seconds; status strings are stored as indexes into a small per-history table.
+COLUMNS = (
+    ("timestamp", np.float64),
+    ("h2_conc", np.float32),
+    ("h2_alert", np.int8),
+    ("water_cm", np.float32),
+    ("servo_pos", np.int16),
+    ("status", np.uint8),
+)
+
+# Numeric fields with running statistics (see SensorHistory.summary)
+STATS_FIELDS = ("h2_conc", "water_cm")
+
+# Fields missing from a reading are stored as this value and left out of
+# its record again
+MISSING = {
+    np.dtype(np.float32): np.nan,
+    np.dtype(np.int8): -1,
+    np.dtype(np.int16): -1,
+}
+
+
+def to_epoch(value):
+    """Convert a reading timestamp (ISO string or epoch seconds) to epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value:
+        return datetime.fromisoformat(value).timestamp()
+    return datetime.now().timestamp()
+
+
+def _field_range(dtype):
+    dtype = np.dtype(dtype)
+    info = np.finfo(dtype) if dtype.kind == "f" else np.iinfo(dtype)
+    return dtype.kind, float(info.min), float(info.max), MISSING[dtype]
+
+
+# Kind, range and missing sentinel of each numeric reading field (see _coerce)
+FIELD_RANGES = {name: _field_range(dtype) for name, dtype in COLUMNS[1:-1]}
+
+
+def _coerce(name, value):
+    """
+    Return a reading value as stored in its column (the missing sentinel
+    for None), or raise ValueError if it is not a number of the column's
+    kind or does not fit the column.
+    """
+    kind, low, high, missing = FIELD_RANGES[name]
+    if value is None:
+        return missing
+    if kind == "f":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{name} must be a number, got {value!r}")
+        value = float(value)
+        # NaN is stored as missing; infinities and values past the dtype's
+        # range (which would become infinities) are rejected
+        if not low <= value <= high and value == value:
+            raise ValueError(f"{name} out of range: {value!r}")
+        return value
+    if not isinstance(value, (int, float)) or (
+            isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    value = int(value)
+    if not low <= value <= high:
+        raise ValueError(f"{name} out of range: {value!r}")
+    return value
+
+
+def check_reading(reading):
+    """
+    Return the values of a reading dict as SensorHistory stores them (the
+    status still a string), or raise ValueError if one does not fit its column.
+    """
+    try:
+        timestamp = to_epoch(reading.get("timestamp"))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"Invalid timestamp: {reading.get('timestamp')!r}") from None
+    if not math.isfinite(timestamp):
+        raise ValueError(f"Invalid timestamp: {reading.get('timestamp')!r}")
+    values = {"timestamp": timestamp}
+    for name in FIELD_RANGES:
+        values[name] = _coerce(name, reading.get(name))
+    values["status"] = reading.get("status", "unknown")
+    if not isinstance(values["status"], str):
+        raise ValueError(f"status must be a string, got {values['status']!r}")
+    return values
+
+
+def _to_json(column):
+    """
+    Convert a stored column to numbers as the readings had them (None where
+    missing): int when whole, otherwise the shortest float that round-trips
+    through the column dtype.
+    """
+    if column.dtype.kind == "f":
+        values = []
+        for value in column.tolist():
+            if value != value:
+                values.append(None)
+            elif value.is_integer():
+                values.append(int(value))
+            else:
+                values.append(float(str(column.dtype.type(value))))
+        return values
+    missing = MISSING[column.dtype]
+    return [None if value == missing else value for value in column.tolist()]
+
+
+class RunningStats:
+    """
+    Count, mean, variance, minimum and maximum of the values in a sliding
+    window, updated in O(1) (amortized for min/max) as values enter and
+    leave it. Mean and variance use Welford's updates (and their inverse on
+    removal), which stay accurate over long runs where a running sum of
+    squares cancels catastrophically. Min and max come from monotonic
+    deques of (seq, value).
+    """
+
+    def __init__(self, track_extremes=True):
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0  # sum of squared deviations from the mean
+        self._min = deque() if track_extremes else None
+        self._max = deque() if track_extremes else None
+
+    def add(self, seq, value):
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+        if self._min is not None:
+            while self._min and self._min[-1][1] >= value:
+                self._min.pop()
+            self._min.append((seq, value))
+            while self._max and self._max[-1][1] <= value:
+                self._max.pop()
+            self._max.append((seq, value))
+
+    def remove(self, seq, value):
+        """Remove the value added as `seq`, which must be the oldest in the window."""
+        self.count -= 1
+        if self.count == 0:
+            # Reset rather than carry rounding residue into the next values
+            self._mean = self._m2 = 0.0
+        else:
+            delta = value - self._mean
+            self._mean -= delta / self.count
+            self._m2 = max(self._m2 - delta * (value - self._mean), 0.0)
+        if self._min is not None:
+            if self._min and self._min[0][0] == seq:
+                self._min.popleft()
+            if self._max and self._max[0][0] == seq:
+                self._max.popleft()
+
+    @property
+    def mean(self):
+        return self._mean if self.count else None
+
+    @property
+    def std_dev(self):
+        """Sample standard deviation."""
+        if self.count < 2:
+            return None
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+
+class SensorHistory:
+    """
+    Fixed-capacity ring buffer of sensor readings stored column by column
+    in preallocated NumPy arrays. Each column is allocated twice over and
+    every value is written to both halves, so the newest `n` readings are
+    always one contiguous slice: latest() returns views without copying.
+    That makes 40 bytes per reading (about 3.5 MB per day of readings at
+    1 Hz) instead of a few hundred for a dict. Appends are O(1).
+    Running statistics of STATS_FIELDS over the whole history and over the
+    newest `recent_window` readings, alert counts and time-based EWMAs are
+    updated as readings enter and leave the buffer, so summary() is O(1).
+    """
+
+    def __init__(self, capacity, extra_fields=None, recent_window=10, ewma_seconds=60):
+        """
+        Allocate the columns. `extra_fields` (e.g. {"mock_data": True}) are
+        constant fields added to every record returned by records().
+        `ewma_seconds` is the EWMA time constant: a reading's weight decays
+        by 1/e over that time, however irregular the readings are.
+        """
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1")
+        self.capacity = capacity
+        self.extra_fields = dict(extra_fields or {})
+        self.recent_window = max(1, min(recent_window, capacity))
+        self.ewma_seconds = ewma_seconds
+
+        self._columns = {
+            name: np.full(2 * capacity, MISSING.get(np.dtype(dtype), 0), dtype=dtype)
+            for name, dtype in COLUMNS
+        }
+        self._statuses = []
+        self._next = 0
+        self._size = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+        self._stats = {name: RunningStats() for name in STATS_FIELDS}
+        self._recent = {name: RunningStats(track_extremes=False) for name in STATS_FIELDS}
+        self._ewma = {name: None for name in STATS_FIELDS}
+        self._ewma_time = {name: None for name in STATS_FIELDS}
+        self._alerts = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """Memory held by the columns."""
+        return sum(column.nbytes for column in self._columns.values())
+
+    def append(self, reading):
+        """
+        Store one reading dict (as produced by BlueGuardIoT) in O(1). Raise
+        ValueError, storing nothing, if a value does not fit its column.
+        """
+        values = check_reading(reading)
+
+        with self._lock:
+            values["status"] = self._status_code(values["status"])
+            i = self._next
+            self._retire(i)
+            for name, value in values.items():
+                column = self._columns[name]
+                column[i] = value
+                column[i + self.capacity] = value
+            self._admit(i, values["timestamp"])
+            self._next = (i + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            self._seq += 1
+
+    def _retire(self, i):
+        """
+        Update the statistics for the readings leaving the whole history
+        (the one in slot i, about to be overwritten) and the recent window.
+        Lock held.
+        """
+        seq = self._seq
+        if self._size == self.capacity:
+            old_seq = seq - self.capacity
+            for name, stats in self._stats.items():
+                value = float(self._columns[name][i])
+                if value == value:
+                    stats.remove(old_seq, value)
+            self._alerts -= int(self._columns["h2_alert"][i] == 1)
+
+        if seq >= self.recent_window:
+            j = (i - self.recent_window) % self.capacity
+            for name, stats in self._recent.items():
+                value = float(self._columns[name][j])
+                if value == value:
+                    stats.remove(seq - self.recent_window, value)
+
+    def _admit(self, i, timestamp):
+        """Update the statistics for the reading just written to slot i. Lock held."""
+        seq = self._seq
+        for name in STATS_FIELDS:
+            value = float(self._columns[name][i])
+            if value != value:
+                continue
+            self._stats[name].add(seq, value)
+            self._recent[name].add(seq, value)
+
+            previous, last_time = self._ewma[name], self._ewma_time[name]
+            if previous is None:
+                self._ewma[name] = value
+            else:
+                elapsed = max(timestamp - last_time, 0.0)
+                alpha = 1 - math.exp(-elapsed / self.ewma_seconds) if self.ewma_seconds else 1.0
+                self._ewma[name] = previous + alpha * (value - previous)
+            self._ewma_time[name] = timestamp
+        self._alerts += int(self._columns["h2_alert"][i] == 1)
+
+    def summary(self):
+        """
+        Return running statistics of the stored readings in O(1): count,
+        the time they span, per-field mean/std_dev/min/max over the whole
+        history, mean/std_dev over the newest `recent_window` readings and
+        EWMA, and the number of gas alerts. Readings missing a field are
+        left out of that field's statistics.
+        """
+        with self._lock:
+            if not self._size:
+                return {"count": 0}
+            end = self._next + self.capacity
+            newest = float(self._columns["timestamp"][end - 1])
+            oldest = float(self._columns["timestamp"][end - self._size])
+            fields = {}
+            for name in STATS_FIELDS:
+                stats, recent = self._stats[name], self._recent[name]
+                fields[name] = {
+                    "count": stats.count,
+                    "mean": stats.mean,
+                    "std_dev": stats.std_dev,
+                    "min": stats.min,
+                    "max": stats.max,
+                    "recent_mean": recent.mean,
+                    "recent_std_dev": recent.std_dev,
+                    "ewma": self._ewma[name],
+                }
+            return {
+                "count": self._size,
+                "first_timestamp": oldest,
+                "last_timestamp": newest,
+                "span_seconds": newest - oldest,
+                "alerts": self._alerts,
+                "recent_window": self.recent_window,
+                "ewma_seconds": self.ewma_seconds,
+                "fields": fields,
+            }
+
+    def _status_code(self, status):
+        """Index of a status string, added to the table if new. Lock held."""
+        # Status strings come from a handful of connection states; past 255
+        # distinct ones, new strings share the last code
+        if status in self._statuses:
+            return self._statuses.index(status)
+        if len(self._statuses) == 255:
+            self._statuses.append("other")
+        if len(self._statuses) > 255:
+            return 255
+        self._statuses.append(status)
+        return len(self._statuses) - 1
+
+    def latest(self, n=None):
+        """
+        Return the newest `n` readings (all by default), oldest first, as a
+        dict of column views. Views are not copies: they show later appends
+        once the buffer wraps, so copy what must outlive the next append.
+        """
+        with self._lock:
+            return self._latest(n)
+
+    def _latest(self, n):
+        n = self._size if n is None else max(0, min(n, self._size))
+        end = self._next + self.capacity
+        return {name: column[end - n:end] for name, column in self._columns.items()}
+
+    def records(self, limit=None):
+        """Return the newest `limit` readings (all by default) as reading dicts."""
+        with self._lock:
+            columns = {name: view.copy() for name, view in self._latest(limit).items()}
+            statuses = list(self._statuses)
+
+        fields = [(name, _to_json(columns[name])) for name, _ in COLUMNS[1:-1]]
+        records = []
+        for i, timestamp in enumerate(columns["timestamp"].tolist()):
+            record = {name: values[i] for name, values in fields if values[i] is not None}
+            record["timestamp"] = datetime.fromtimestamp(timestamp).isoformat()
+            record["status"] = statuses[columns["status"][i]]
+            record.update(self.extra_fields)
+            records.append(record)
+        return records
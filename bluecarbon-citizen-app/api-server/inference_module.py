@@ -0,0 +1,559 @@
+import ast
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+import uuid
+import logging
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from client_module import InferenceClient
+
+logger = logging.getLogger(__name__)
+
+ROBOFLOW_PROJECT = "segmentation-sohpz"
+ROBOFLOW_VERSION = 9
+
+# JPEG-DCT reductions for decoding below full resolution, coarsest first
+REDUCED_READ_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Allow Pillow to read the header of very large orthomosaics
+Image.MAX_IMAGE_PIXELS = None
+
+
+class ImageSource:
+    """
+    Wraps an image given as a file path, encoded bytes or a decoded BGR
+    array, and decodes it at most once at full resolution.
+    `min_dimension` is the smallest long side the image is needed at when
+    it will never be needed in full (e.g. health statistics without
+    annotation); None means it will be.
+    """
+
+    def __init__(self, image, name=None, min_dimension=None):
+        if isinstance(image, (bytearray, memoryview)):
+            image = bytes(image)
+        self.image = image
+        self.name = name or (
+            os.path.basename(image) if isinstance(image, str) else "upload"
+        )
+        self.min_dimension = min_dimension
+        self._decoded = image if isinstance(image, np.ndarray) else None
+        self._reduced = None
+
+    def decode(self, flag=cv2.IMREAD_COLOR):
+        """
+        Return the image as a BGR array. Reduced-resolution flags are honoured
+        unless a full-resolution decode is already available.
+        """
+        if self._decoded is not None:
+            return self._decoded
+
+        if isinstance(self.image, str):
+            image = cv2.imread(self.image, flag)
+        else:
+            image = cv2.imdecode(np.frombuffer(self.image, dtype=np.uint8), flag)
+        if image is None:
+            raise Exception("Failed to load image")
+
+        if flag == cv2.IMREAD_COLOR:
+            self._decoded = image
+        return image
+
+    def decode_reduced(self, min_dimension):
+        """
+        Return the image with at least `min_dimension` (and the source's own
+        `min_dimension`) pixels on its long side, decoded at the coarsest
+        JPEG-DCT reduction that keeps them, or in full for a source needed
+        at full resolution. The decode is kept, so one decode serves every
+        later call that needs no more pixels.
+        """
+        if self._decoded is not None:
+            return self._decoded
+        if self.min_dimension is None:
+            return self.decode()
+        min_dimension = max(min_dimension, self.min_dimension)
+        if self._reduced is not None and max(self._reduced.shape[:2]) >= min_dimension:
+            return self._reduced
+
+        long_side = max(image_size(self))
+        flag = cv2.IMREAD_COLOR
+        for factor, reduced_flag in REDUCED_READ_FLAGS:
+            if long_side / factor >= min_dimension:
+                flag = reduced_flag
+                break
+        image = self.decode(flag)
+        if flag != cv2.IMREAD_COLOR:
+            self._reduced = image
+        return image
+
+
+def image_size(source):
+    """
+    Return (width, height) of an ImageSource from the file header, without
+    decoding the pixels when it is not decoded already.
+    """
+    if isinstance(source.image, np.ndarray):
+        h, w = source.image.shape[:2]
+        return w, h
+    try:
+        fp = source.image if isinstance(source.image, str) else io.BytesIO(source.image)
+        with Image.open(fp) as im:
+            return im.size
+    except Exception:
+        h, w = source.decode().shape[:2]
+        return w, h
+
+
+class InferenceBackend:
+    """
+    Interface for segmentation inference backends.
+    `predict` returns a Roboflow-style instance segmentation response:
+    {"image": {"width", "height"}, "predictions": [{"x", "y", "width",
+    "height", "confidence", "class", "class_id", "detection_id", "points"}]}
+    with box centres/sizes and polygon points in original image pixels.
+    """
+
+    name = "base"
+
+    @property
+    def version(self):
+        """Identifier of the loaded model, used in inference cache keys."""
+        raise NotImplementedError
+
+    def predict(self, source, confidence):
+        """Run inference on an ImageSource with a 0-100 confidence threshold."""
+        raise NotImplementedError
+
+    @property
+    def degraded(self):
+        """True while the backend is failing fast (e.g. circuit breaker open)."""
+        return False
+
+    def info(self):
+        """Describe the backend for /model/info."""
+        return {"backend": self.name, "version": self.version, "classes": []}
+
+
+class RoboflowBackend(InferenceBackend):
+    """
+    Hosted Roboflow model, called through an InferenceClient (pooled
+    connections, deadlines, retries and a circuit breaker) or, with
+    ROBOFLOW_CLIENT=sdk, through the Roboflow SDK.
+    The model runs at a fixed input resolution, so the client uploads images
+    shrunk to `upload_size` on their long side and maps the predictions back
+    to original image pixels.
+    """
+
+    name = "roboflow"
+
+    def __init__(self, api_key=None, model=None, client=None, upload_size=None,
+                 upload_quality=None):
+        """
+        Resolve the hosted model. `model` may be any object with the Roboflow
+        `predict(image, confidence)` interface (e.g. a local stub), in which
+        case Roboflow is not contacted; `client` may be a preconfigured
+        InferenceClient. `upload_size` (ROBOFLOW_UPLOAD_SIZE, 0 to upload
+        originals) and `upload_quality` (ROBOFLOW_UPLOAD_QUALITY) apply to
+        client uploads.
+        """
+        self.api_key = api_key
+        self.project = None
+        self.model = model
+        self.client = client
+        self.upload_size = (
+            int(os.getenv("ROBOFLOW_UPLOAD_SIZE", "640")) if upload_size is None else upload_size
+        )
+        self.upload_quality = (
+            int(os.getenv("ROBOFLOW_UPLOAD_QUALITY", "90")) if upload_quality is None
+            else upload_quality
+        )
+        self._lock = threading.Lock()
+        self.upload_counters = {"uploads": 0, "shrunk": 0, "bytes_uploaded": 0}
+
+        if model is not None or client is not None:
+            return
+
+        if not self.api_key:
+            raise ValueError("ROBOFLOW_API_KEY not found in environment variables")
+
+        if os.getenv("ROBOFLOW_CLIENT", "http").lower() == "http":
+            self.client = InferenceClient.from_env(
+                self.api_key, f"{ROBOFLOW_PROJECT}/{ROBOFLOW_VERSION}"
+            )
+            return
+
+        from roboflow import Roboflow
+
+        rf = Roboflow(api_key=self.api_key)
+        self.project = rf.workspace().project(ROBOFLOW_PROJECT)
+        self.model = self.project.version(ROBOFLOW_VERSION).model
+
+    @property
+    def version(self):
+        if self.client is not None:
+            # Shrunk uploads may predict slightly different polygons
+            if self.upload_size:
+                return f"{self.client.model_id}@{self.upload_size}"
+            return self.client.model_id
+        return getattr(self.model, "id", None) or type(self.model).__name__
+
+    @property
+    def degraded(self):
+        return self.client is not None and self.client.degraded
+
+    def predict(self, source, confidence):
+        if self.client is not None:
+            data, filename, content_type, scale = self._upload(source)
+            result = self.client.predict(data, confidence, filename, content_type)
+            if scale is not None:
+                self._rescale(result, *scale)
+            return result
+
+        # The SDK takes a path or an RGB array, not encoded bytes
+        if isinstance(source.image, str):
+            image = source.image
+        else:
+            image = cv2.cvtColor(source.decode(), cv2.COLOR_BGR2RGB)
+        return self.model.predict(image, confidence=confidence).json()
+
+    def _upload(self, source):
+        """
+        Return (data, filename, content_type, scale) to upload for an
+        ImageSource. Images larger than `upload_size` are shrunk to it and
+        sent as JPEG, with `scale` = (sx, sy, width, height) mapping the
+        predictions back; others are sent as received (arrays as JPEG) with
+        `scale` None.
+        """
+        width, height = image_size(source)
+        image = source.image
+        scale = None
+        if self.upload_size and max(width, height) > self.upload_size:
+            # Decoded once here, at the resolution the later stages need;
+            # annotation and health classification reuse it
+            image = source.decode_reduced(self.upload_size)
+            if (image.shape[1] > image.shape[0]) != (width > height):
+                # The decoder applied an EXIF rotation the header size lacks
+                width, height = height, width
+            gain = self.upload_size / max(width, height)
+            size = (max(1, round(width * gain)), max(1, round(height * gain)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            scale = (width / size[0], height / size[1], width, height)
+        elif not isinstance(source.image, np.ndarray):
+            if isinstance(source.image, str):
+                with open(source.image, "rb") as f:
+                    data = f.read()
+            else:
+                data = source.image
+            content_type = mimetypes.guess_type(source.name)[0] or "application/octet-stream"
+            self._count_upload(data, shrunk=False)
+            return data, source.name, content_type, None
+
+        # No chroma subsampling: at model input size it blurs colour edges
+        # by several original pixels
+        ok, encoded = cv2.imencode(".jpg", image, [
+            cv2.IMWRITE_JPEG_QUALITY, self.upload_quality,
+            cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+        ])
+        if not ok:
+            raise Exception("Failed to encode image for upload")
+        data = encoded.tobytes()
+        self._count_upload(data, shrunk=scale is not None)
+        return data, "image.jpg", "image/jpeg", scale
+
+    def _count_upload(self, data, shrunk):
+        with self._lock:
+            self.upload_counters["uploads"] += 1
+            self.upload_counters["shrunk"] += int(shrunk)
+            self.upload_counters["bytes_uploaded"] += len(data)
+
+    @staticmethod
+    def _rescale(result, sx, sy, width, height):
+        """Map boxes and polygon points predicted on a shrunk upload back."""
+        for pred in result.get("predictions", []):
+            pred["x"] = pred["x"] * sx
+            pred["y"] = pred["y"] * sy
+            pred["width"] = pred["width"] * sx
+            pred["height"] = pred["height"] * sy
+            pred["points"] = [
+                {**p, "x": p["x"] * sx, "y": p["y"] * sy} for p in pred.get("points", [])
+            ]
+        result["image"] = {**result.get("image", {}), "width": width, "height": height}
+
+    def info(self):
+        return {
+            "backend": self.name,
+            "workspace": self.project.workspace.name
+            if hasattr(self.project, "workspace")
+            else "unknown",
+            "project": self.project.name
+            if hasattr(self.project, "name")
+            else ROBOFLOW_PROJECT,
+            "version": str(ROBOFLOW_VERSION),
+            "api_key_status": "configured" if self.api_key else "missing",
+            "classes": ["grass"],  # Add your actual classes here
+            **({
+                "client": self.client.stats(),
+                "upload": {
+                    "max_size": self.upload_size,
+                    "jpeg_quality": self.upload_quality,
+                    **self.upload_counters,
+                },
+            } if self.client is not None else {}),
+        }
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    Local CPU backend for a YOLOv8-style instance segmentation model exported
+    to ONNX (outputs: detections [1, 4 + classes + coeffs, anchors] and mask
+    prototypes [1, coeffs, mh, mw]). Runs on onnxruntime when installed and
+    falls back to OpenCV's DNN module.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path, classes=None, input_size=None, runtime="auto",
+                 iou_threshold=0.5, mask_threshold=0.5):
+        """Load the ONNX model."""
+        if not model_path or not os.path.exists(model_path):
+            raise ValueError(f"ONNX model not found: {model_path}")
+
+        self.model_path = model_path
+        self.iou_threshold = iou_threshold
+        self.mask_threshold = mask_threshold
+        self._lock = threading.Lock()
+
+        digest = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        self._version = f"onnx:{os.path.basename(model_path)}:{digest.hexdigest()[:12]}"
+
+        self.session = None
+        self.net = None
+        metadata_names = None
+        if runtime in ("auto", "onnxruntime"):
+            try:
+                import onnxruntime as ort
+
+                self.session = ort.InferenceSession(
+                    model_path, providers=["CPUExecutionProvider"]
+                )
+                model_input = self.session.get_inputs()[0]
+                self.input_name = model_input.name
+                shape = model_input.shape
+                if input_size is None and isinstance(shape[-1], int):
+                    input_size = shape[-1]
+                metadata_names = self.session.get_modelmeta().custom_metadata_map.get("names")
+            except ImportError:
+                if runtime == "onnxruntime":
+                    raise
+        if self.session is None:
+            self.net = cv2.dnn.readNetFromONNX(model_path)
+
+        self.runtime = "onnxruntime" if self.session is not None else "opencv"
+        # OpenCV does not expose the input shape; set ONNX_INPUT_SIZE if not 640
+        self.input_size = int(input_size or 640)
+        self.classes = classes or self._parse_names(metadata_names) or ["grass"]
+
+        logger.info(
+            f"Loaded ONNX model {model_path} on {self.runtime} "
+            f"(input {self.input_size}, classes {self.classes})"
+        )
+
+    @classmethod
+    def from_env(cls):
+        """Build the backend from ONNX_* environment variables."""
+        classes = os.getenv("ONNX_CLASSES")
+        input_size = os.getenv("ONNX_INPUT_SIZE")
+        return cls(
+            os.getenv("ONNX_MODEL_PATH"),
+            classes=[c.strip() for c in classes.split(",")] if classes else None,
+            input_size=int(input_size) if input_size else None,
+            runtime=os.getenv("ONNX_RUNTIME", "auto"),
+        )
+
+    @property
+    def version(self):
+        return self._version
+
+    def info(self):
+        return {
+            "backend": self.name,
+            "runtime": self.runtime,
+            "model_path": self.model_path,
+            "version": self.version,
+            "input_size": self.input_size,
+            "classes": self.classes,
+        }
+
+    def _parse_names(self, names):
+        """Parse Ultralytics' "{0: 'grass', ...}" metadata into a class list."""
+        if not names:
+            return None
+        try:
+            parsed = ast.literal_eval(names)
+        except (ValueError, SyntaxError):
+            return None
+        if isinstance(parsed, dict):
+            return [parsed[k] for k in sorted(parsed)]
+        return list(parsed)
+
+    def _letterbox(self, image):
+        """Resize keeping aspect ratio and pad to a square model input."""
+        h, w = image.shape[:2]
+        gain = min(self.input_size / h, self.input_size / w)
+        new_w, new_h = int(round(w * gain)), int(round(h * gain))
+        pad_x = (self.input_size - new_w) // 2
+        pad_y = (self.input_size - new_h) // 2
+
+        canvas = np.full((self.input_size, self.input_size, 3), 114, dtype=np.uint8)
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+            image, (new_w, new_h), interpolation=cv2.INTER_LINEAR
+        )
+        return canvas, gain, pad_x, pad_y
+
+    def _run(self, blob):
+        if self.session is not None:
+            outputs = self.session.run(None, {self.input_name: blob})
+        else:
+            # cv2.dnn.Net is not thread-safe
+            with self._lock:
+                self.net.setInput(blob)
+                outputs = self.net.forward(self.net.getUnconnectedOutLayersNames())
+        detections = next(o for o in outputs if o.ndim == 3)
+        protos = next(o for o in outputs if o.ndim == 4)
+        return detections[0], protos[0]
+
+    def predict(self, source, confidence):
+        image = source.decode()
+        h, w = image.shape[:2]
+
+        canvas, gain, pad_x, pad_y = self._letterbox(image)
+        blob = cv2.dnn.blobFromImage(canvas, 1 / 255.0, swapRB=True)
+        detections, protos = self._run(blob)
+
+        num_classes = len(self.classes)
+        rows = detections.T
+        boxes_cxcywh = rows[:, :4]
+        scores = rows[:, 4:4 + num_classes]
+        coefficients = rows[:, 4 + num_classes:]
+
+        class_ids = scores.argmax(axis=1)
+        class_scores = scores[np.arange(len(rows)), class_ids]
+        keep = class_scores >= confidence / 100.0
+        boxes_cxcywh = boxes_cxcywh[keep]
+        class_ids = class_ids[keep]
+        class_scores = class_scores[keep]
+        coefficients = coefficients[keep]
+
+        predictions = []
+        if len(class_scores):
+            xywh = np.column_stack([
+                boxes_cxcywh[:, 0] - boxes_cxcywh[:, 2] / 2,
+                boxes_cxcywh[:, 1] - boxes_cxcywh[:, 3] / 2,
+                boxes_cxcywh[:, 2],
+                boxes_cxcywh[:, 3],
+            ])
+            if hasattr(cv2.dnn, "NMSBoxesBatched"):
+                indices = cv2.dnn.NMSBoxesBatched(
+                    xywh.tolist(), class_scores.tolist(), class_ids.tolist(),
+                    confidence / 100.0, self.iou_threshold,
+                )
+            else:
+                indices = cv2.dnn.NMSBoxes(
+                    xywh.tolist(), class_scores.tolist(),
+                    confidence / 100.0, self.iou_threshold,
+                )
+            indices = np.array(indices, dtype=np.int64).reshape(-1)
+
+            num_coefficients, mask_h, mask_w = protos.shape
+            proto_flat = protos.reshape(num_coefficients, -1)
+            for i in indices:
+                prediction = self._to_prediction(
+                    xywh[i], class_ids[i], class_scores[i], coefficients[i],
+                    proto_flat, (mask_h, mask_w), gain, pad_x, pad_y, (h, w),
+                )
+                if prediction is not None:
+                    predictions.append(prediction)
+
+        return {"image": {"width": w, "height": h}, "predictions": predictions}
+
+    def _to_prediction(self, box, class_id, score, coefficients, proto_flat,
+                       proto_shape, gain, pad_x, pad_y, image_shape):
+        """
+        Map one detection back to original image pixels and trace its mask
+        into a polygon. The mask is upsampled only inside its bounding box.
+        """
+        h, w = image_shape
+        mask_h, mask_w = proto_shape
+
+        # Box in original image coordinates, clamped
+        x0 = max((box[0] - pad_x) / gain, 0)
+        y0 = max((box[1] - pad_y) / gain, 0)
+        x1 = min((box[0] + box[2] - pad_x) / gain, w)
+        y1 = min((box[1] + box[3] - pad_y) / gain, h)
+        if x1 - x0 < 1 or y1 - y0 < 1:
+            return None
+
+        # Threshold logits rather than sigmoid probabilities (same result)
+        logits = (coefficients @ proto_flat).reshape(mask_h, mask_w)
+        logit_threshold = np.log(self.mask_threshold / (1 - self.mask_threshold))
+
+        # Box in prototype-mask coordinates
+        to_proto = mask_w / self.input_size
+        px0 = int(np.floor((x0 * gain + pad_x) * to_proto))
+        py0 = int(np.floor((y0 * gain + pad_y) * to_proto))
+        px1 = int(np.ceil((x1 * gain + pad_x) * to_proto))
+        py1 = int(np.ceil((y1 * gain + pad_y) * to_proto))
+        crop = logits[py0:max(py1, py0 + 1), px0:max(px1, px0 + 1)]
+
+        box_w = int(np.ceil(x1)) - int(x0)
+        box_h = int(np.ceil(y1)) - int(y0)
+        roi_mask = cv2.resize(crop, (box_w, box_h), interpolation=cv2.INTER_LINEAR)
+        roi_mask = (roi_mask > logit_threshold).astype(np.uint8)
+
+        contours, _ = cv2.findContours(roi_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        contour = max(contours, key=cv2.contourArea).reshape(-1, 2)
+        if len(contour) < 3:
+            return None
+
+        class_id = int(class_id)
+        return {
+            "x": float(x0 + x1) / 2,
+            "y": float(y0 + y1) / 2,
+            "width": float(x1 - x0),
+            "height": float(y1 - y0),
+            "confidence": round(float(score), 4),
+            "class": self.classes[class_id] if class_id < len(self.classes) else str(class_id),
+            "class_id": class_id,
+            "detection_id": str(uuid.uuid4()),
+            "points": [
+                {"x": float(px + int(x0)), "y": float(py + int(y0))}
+                for px, py in contour
+            ],
+        }
+
+
+def create_backend(name=None, api_key=None):
+    """
+    Create the inference backend selected by `name` or the
+    SEGMENTATION_BACKEND environment variable ("roboflow" or "onnx").
+    """
+    name = (name or os.getenv("SEGMENTATION_BACKEND", "roboflow")).lower()
+    if name == "roboflow":
+        return RoboflowBackend(api_key=api_key)
+    if name == "onnx":
+        return OnnxBackend.from_env()
+    raise ValueError(f"Unknown SEGMENTATION_BACKEND: {name}")
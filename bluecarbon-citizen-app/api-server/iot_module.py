@@ -6,20 +6,51 @@ import threading
 import logging
 import random
 from datetime import datetime
-from collections import deque
 import serial.tools.list_ports
+from history_module import SensorHistory, check_reading
+from reader_module import SerialReader
 
 logger = logging.getLogger(__name__)
 
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
 class BlueGuardIoT:
     """
     IoT module for BlueGuard system - handles Arduino communication and data processing.
     Manages gas detection, water level monitoring, and servo control.
     """
     
-    def __init__(self, port=None, baudrate=9600, data_history_size=100):
-        """Initialize IoT controller with mock mode support."""
+    def __init__(self, port=None, baudrate=9600, data_history_size=None, store=None,
+                 device_id="default", reader=None):
+        """
+        Initialize IoT controller with mock mode support.
+        `data_history_size` readings are kept in memory (default:
+        IOT_HISTORY_SIZE, one day of readings at 1 Hz). IOT_RECENT_WINDOW
+        and IOT_EWMA_SECONDS configure the analytics trends.
+        Readings collected by the monitoring loop are also written to
+        `store` (a TimeSeriesStore), if given, under `device_id`.
+        Mock monitoring runs on its own thread unless `scheduler` (a
+        DeviceScheduler shared by many devices) is set. A real Arduino is
+        read by `reader` (default: the process-wide SerialReader) as its
+        data arrives; HTTP handlers only read the resulting snapshot.
+        With a store, thresholds are shared with other processes through
+        it, and a device monitored by another process is served from the
+        readings that process stores (see serve_from_store).
+        """
         self.mock_mode = os.getenv('RENDER', 'false').lower() == 'true'
+        self.store = store
+        self.device_id = device_id
+        self.scheduler = None
+        self.reader = reader
+        self.monitored_elsewhere = False
+        self._snapshot_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = 0.0
+        self._synced_row = 0
+        self.read_counters = {"readings": 0, "parse_errors": 0, "invalid_readings": 0}
+        if data_history_size is None:
+            data_history_size = int(os.getenv('IOT_HISTORY_SIZE', '86400'))
         
         if self.mock_mode:
             logger.info("IoT Module running in MOCK MODE for web deployment")
@@ -47,9 +78,15 @@ class BlueGuardIoT:
             "mock_data": True
         }
         
-        self.data_history = deque(maxlen=data_history_size)
+        self.has_reading = True
+        self.data_history = SensorHistory(
+            data_history_size, extra_fields={"mock_data": True},
+            recent_window=int(os.getenv('IOT_RECENT_WINDOW', '10')),
+            ewma_seconds=float(os.getenv('IOT_EWMA_SECONDS', '60'))
+        )
         self.gas_threshold = 100
         self.water_critical_level = 10
+        self.poll_interval = 2  # Faster updates in mock mode
         self.monitor_thread = None
         self.stop_monitoring = threading.Event()
         
@@ -73,9 +110,15 @@ class BlueGuardIoT:
             "status": "disconnected"
         }
         
-        self.data_history = deque(maxlen=data_history_size)
+        self.has_reading = False
+        self.data_history = SensorHistory(
+            data_history_size,
+            recent_window=int(os.getenv('IOT_RECENT_WINDOW', '10')),
+            ewma_seconds=float(os.getenv('IOT_EWMA_SECONDS', '60'))
+        )
         self.gas_threshold = 100
         self.water_critical_level = 10
+        self.poll_interval = 5
         self.monitor_thread = None
         self.stop_monitoring = threading.Event()
     
@@ -110,7 +153,7 @@ class BlueGuardIoT:
         """Connect to Arduino (or simulate connection in mock mode)."""
         if self.mock_mode:
             self.is_connected = True
-            self.current_data["status"] = "mock_connected"
+            self._publish({"status": "mock_connected"})
             logger.info("Mock connection established")
             return True
         
@@ -124,40 +167,108 @@ class BlueGuardIoT:
             if not self.port:
                 raise Exception("No Arduino port found. Please specify port manually.")
             
+            self._close_serial()
             self.serial_connection = serial.Serial(self.port, self.baudrate, timeout=2)
             time.sleep(2)  # Arduino initialization
             
+            # From here on the reader handles everything the Arduino sends
+            if self.reader is None:
+                self.reader = SerialReader.shared()
+            self.reader.add(self, self.serial_connection)
+            
             self.is_connected = True
-            self.current_data["status"] = "connected"
+            self._publish({"status": "connected"})
             logger.info(f"Connected to Arduino on port {self.port}")
             return True
             
         except Exception as e:
             logger.error(f"Failed to connect to Arduino: {str(e)}")
             self.is_connected = False
-            self.current_data["status"] = f"connection_failed: {str(e)}"
+            self._publish({"status": f"connection_failed: {str(e)}"})
             return False
     
     def disconnect(self):
         """Disconnect from Arduino."""
         if self.mock_mode:
             self.is_connected = False
-            self.current_data["status"] = "mock_disconnected"
+            self._publish({"status": "mock_disconnected"})
             logger.info("Mock disconnection")
             return
         
         try:
             self.stop_monitoring_data()
-            if self.serial_connection and self.serial_connection.is_open:
-                self.serial_connection.close()
+            self._close_serial()
             self.is_connected = False
-            self.current_data["status"] = "disconnected"
+            self._publish({"status": "disconnected"})
             logger.info("Disconnected from Arduino")
         except Exception as e:
             logger.error(f"Error during disconnect: {str(e)}")
     
+    def _close_serial(self):
+        """Stop reading and close the serial port, if open."""
+        if self.reader is not None:
+            self.reader.remove(self)
+        if self.serial_connection and self.serial_connection.is_open:
+            self.serial_connection.close()
+    
+    def handle_lines(self, lines):
+        """
+        Handle lines received from the Arduino (called by the serial reader).
+        Each JSON object line is a reading, recorded while monitoring; the
+        newest becomes the current data. Other lines (boot messages, line
+        noise) and readings whose fields have the wrong type or range are
+        counted and skipped. Return the number of lines skipped.
+        """
+        timestamp = datetime.now().isoformat()
+        readings = []
+        for line in lines:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                self.read_counters["parse_errors"] += 1
+                logger.debug(f"Ignoring non-JSON line from Arduino: {line[:80]}")
+                continue
+            data["timestamp"] = timestamp
+            data["status"] = "connected"
+            try:
+                check_reading(data)
+            except ValueError as e:
+                self.read_counters["invalid_readings"] += 1
+                logger.debug(f"Ignoring invalid reading from Arduino: {str(e)}")
+                continue
+            readings.append(data)
+        
+        rejected = len(lines) - len(readings)
+        if not readings:
+            return rejected
+        self.read_counters["readings"] += len(readings)
+        if self.is_monitoring:
+            for data in readings:
+                self._record(data)
+        self._publish(readings[-1])
+        return rejected
+    
+    def handle_read_error(self, error):
+        """Mark the Arduino as disconnected after a read failure (called by the serial reader)."""
+        self.is_connected = False
+        self._publish({"status": f"connection_lost: {str(error)}"})
+    
+    def _publish(self, changes):
+        """Update the current data snapshot served to HTTP handlers."""
+        with self._snapshot_lock:
+            snapshot = dict(self.current_data)
+            snapshot.update(changes)
+            self.current_data = snapshot
+            if "h2_conc" in changes:
+                self.has_reading = True
+    
     def read_single_data(self):
-        """Read sensor data (mock or real)."""
+        """
+        Generate a mock reading, or return the newest reading received from
+        the Arduino (None before the first).
+        """
         if self.mock_mode:
             # Generate realistic mock data
             h2_conc = random.randint(20, 300)
@@ -174,24 +285,13 @@ class BlueGuardIoT:
                 "mock_data": True
             }
             
-            self.current_data.update(mock_data)
+            self._publish(mock_data)
             return mock_data
         
-        # Real hardware reading logic
-        if not self.is_connected or not self.serial_connection:
-            return None
-        
-        try:
-            if self.serial_connection.in_waiting > 0:
-                line = self.serial_connection.readline().decode().strip()
-                data = json.loads(line)
-                data["timestamp"] = datetime.now().isoformat()
-                data["status"] = "connected"
-                self.current_data.update(data)
-                return data
-        except Exception as e:
-            logger.error(f"Error reading from Arduino: {str(e)}")
+        # Real readings arrive through the serial reader
+        if not self.is_connected:
             return None
+        return self.get_latest_reading()
     
     def start_monitoring(self):
         """Start continuous monitoring."""
@@ -202,10 +302,15 @@ class BlueGuardIoT:
             logger.error("Cannot start monitoring - not connected")
             return False
         
-        self.stop_monitoring.clear()
+        # A real Arduino's readings are recorded by the serial reader as
+        # they arrive; mock readings are generated on a schedule
         self.is_monitoring = True
-        self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-        self.monitor_thread.start()
+        if self.mock_mode and self.scheduler is not None:
+            self.scheduler.add(self)
+        elif self.mock_mode:
+            self.stop_monitoring.clear()
+            self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            self.monitor_thread.start()
         
         logger.info("Started continuous monitoring")
         return True
@@ -213,119 +318,237 @@ class BlueGuardIoT:
     def stop_monitoring_data(self):
         """Stop continuous monitoring."""
         if self.is_monitoring:
-            self.stop_monitoring.set()
             self.is_monitoring = False
+            if self.scheduler is not None:
+                self.scheduler.remove(self)
+            self.stop_monitoring.set()
             if self.monitor_thread:
                 self.monitor_thread.join(timeout=5)
+                self.monitor_thread = None
             logger.info("Stopped continuous monitoring")
     
+    def poll(self):
+        """Generate one mock reading and record it: one iteration of mock monitoring."""
+        self._sync()
+        data = self.read_single_data()
+        if data:
+            self._record(data)
+        return data
+    
+    def _record(self, data):
+        self.data_history.append(data)
+        if self.store is not None:
+            self.store.append(self.device_id, data)
+    
+    def serve_from_store(self):
+        """
+        Mark the device as monitored by another process: its readings are
+        taken from the store instead of the serial port or mock generator.
+        """
+        self.monitored_elsewhere = True
+        self._publish({"status": "monitored_elsewhere"})
+    
+    def _sync(self):
+        """
+        Pick up thresholds changed by other processes and, for a device
+        monitored elsewhere, the readings stored since the last sync. At
+        most once a second.
+        """
+        if self.store is None:
+            return
+        with self._sync_lock:
+            now = time.monotonic()
+            if now - self._synced_at < 1:
+                return
+            self._synced_at = now
+            try:
+                settings = self.store.get_settings(self.device_id)
+                readings = []
+                if self.monitored_elsewhere:
+                    readings, self._synced_row = self.store.readings_since(
+                        self.device_id, self._synced_row, self.data_history.capacity
+                    )
+            except Exception as e:
+                logger.error(f"Failed to sync IoT device {self.device_id} from storage: {str(e)}")
+                return
+            self.gas_threshold = settings.get("gas_threshold", self.gas_threshold)
+            self.water_critical_level = settings.get(
+                "water_critical_level", self.water_critical_level
+            )
+            for data in readings:
+                self.data_history.append(data)
+        if readings:
+            self._publish(readings[-1])
+    
     def _monitor_loop(self):
-        """Background monitoring loop."""
+        """Background monitoring loop (mock mode)."""
         while not self.stop_monitoring.is_set():
             try:
-                data = self.read_single_data()
-                if data:
-                    self.data_history.append(data)
-                time.sleep(5 if not self.mock_mode else 2)  # Faster updates in mock mode
+                self.poll()
+                self.stop_monitoring.wait(self.poll_interval)
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {str(e)}")
-                time.sleep(5)
+                self.stop_monitoring.wait(5)
     
     def get_current_data(self):
         """Get the most recent sensor data."""
-        return self.current_data.copy()
+        self._sync()
+        with self._snapshot_lock:
+            return dict(self.current_data)
+    
+    def get_latest_reading(self):
+        """Get the most recent sensor data, or None if no reading has arrived yet."""
+        self._sync()
+        with self._snapshot_lock:
+            return dict(self.current_data) if self.has_reading else None
     
     def get_historical_data(self, limit=None):
         """Get historical sensor data."""
-        history = list(self.data_history)
-        if limit:
-            history = history[-limit:]
-        return history
+        self._sync()
+        return self.data_history.records(limit or None)
+    
+    def get_range_data(self, start, end, resolution="auto"):
+        """
+        Get stored readings between two epoch times, raw or from a rollup
+        tier (see TimeSeriesStore.query_range).
+        """
+        if self.store is None:
+            raise RuntimeError("Persistent IoT storage is disabled")
+        result = self.store.query_range(self.device_id, start, end, resolution)
+        result.update({
+            "device_id": self.device_id,
+            "start": datetime.fromtimestamp(start).isoformat(),
+            "end": datetime.fromtimestamp(end).isoformat(),
+            "mock_mode": self.mock_mode
+        })
+        return result
     
     def get_system_status(self):
         """Get comprehensive system status."""
+        current = self.get_current_data()
         return {
+            "device_id": self.device_id,
             "connected": self.is_connected,
             "port": self.port,
-            "status": self.current_data.get("status", "unknown"),
+            "status": current.get("status", "unknown"),
             "monitoring": self.is_monitoring,
+            "monitored_elsewhere": self.monitored_elsewhere,
             "mock_mode": self.mock_mode,
             "data_points_collected": len(self.data_history),
-            "last_reading": self.current_data.get("timestamp"),
-            "thresholds": {
-                "gas_threshold": self.gas_threshold,
-                "water_critical_level": self.water_critical_level
-            }
+            "history_capacity": self.data_history.capacity,
+            "readings_received": self.read_counters["readings"],
+            "unparsed_lines": self.read_counters["parse_errors"],
+            "invalid_readings": self.read_counters["invalid_readings"],
+            "persistent_storage": self.store is not None,
+            "last_reading": current.get("timestamp"),
+            "thresholds": self.get_thresholds()
         }
     
     def get_active_alerts(self):
         """Get list of active alerts."""
         alerts = []
+        current = self.get_current_data()
         
-        if self.current_data.get("h2_alert", 0) == 1:
+        if current.get("h2_alert", 0) == 1:
             alerts.append({
                 "type": "gas_leak",
                 "severity": "critical",
-                "message": f"Hydrogen leak detected! Concentration: {self.current_data.get('h2_conc', 0)}",
-                "timestamp": self.current_data.get("timestamp"),
+                "message": f"Hydrogen leak detected! Concentration: {current.get('h2_conc', 0)}",
+                "timestamp": current.get("timestamp"),
                 "mock": self.mock_mode
             })
         
-        if self.current_data.get("water_cm", 100) < self.water_critical_level:
+        if current.get("water_cm", 100) < self.water_critical_level:
             alerts.append({
                 "type": "water_level",
                 "severity": "warning",
-                "message": f"Low water level: {self.current_data.get('water_cm', 0)} cm",
-                "timestamp": self.current_data.get("timestamp"),
+                "message": f"Low water level: {current.get('water_cm', 0)} cm",
+                "timestamp": current.get("timestamp"),
                 "mock": self.mock_mode
             })
         
         return alerts
     
+    def get_thresholds(self):
+        """Get the alert thresholds, as last set by any process."""
+        self._sync()
+        return {
+            "gas_threshold": self.gas_threshold,
+            "water_critical_level": self.water_critical_level
+        }
+    
     def update_thresholds(self, gas_threshold=None, water_critical_level=None):
-        """Update system thresholds."""
+        """Update system thresholds (in the store too, for the other processes)."""
         if gas_threshold is not None:
             self.gas_threshold = gas_threshold
         if water_critical_level is not None:
             self.water_critical_level = water_critical_level
+        if self.store is not None:
+            settings = {
+                "gas_threshold": gas_threshold,
+                "water_critical_level": water_critical_level,
+            }
+            self.store.put_settings(
+                self.device_id,
+                **{name: value for name, value in settings.items() if value is not None}
+            )
         
         logger.info(f"Updated thresholds - Gas: {self.gas_threshold}, Water: {self.water_critical_level}cm")
     
     def get_analytics(self):
         """Get analytics from historical data."""
+        self._sync()
         if not self.data_history:
             return {
                 "message": "No historical data available",
                 "mock_mode": self.mock_mode
             }
         
-        history = list(self.data_history)
-        
-        # Calculate averages
-        avg_h2 = sum(d.get("h2_conc", 0) for d in history) / len(history)
-        avg_water = sum(d.get("water_cm", 0) for d in history) / len(history)
+        # Running aggregates kept by the history: O(1) whatever its size
+        summary = self.data_history.summary()
+        count = summary["count"]
+        h2 = summary["fields"]["h2_conc"]
+        water = summary["fields"]["water_cm"]
+        total_alerts = summary["alerts"]
         
-        # Count alerts
-        total_alerts = sum(d.get("h2_alert", 0) for d in history)
-        
-        # Get recent trends (last 10 readings)
-        recent_data = history[-10:] if len(history) >= 10 else history
-        recent_avg_h2 = sum(d.get("h2_conc", 0) for d in recent_data) / len(recent_data)
+        avg_h2 = h2["mean"]
+        recent_avg_h2 = h2["recent_mean"]
+        if avg_h2 is None or recent_avg_h2 is None or recent_avg_h2 == avg_h2:
+            trend = "stable"
+        else:
+            trend = "increasing" if recent_avg_h2 > avg_h2 else "decreasing"
         
         return {
-            "data_points": len(history),
-            "time_span_minutes": len(history) * (5 if not self.mock_mode else 2) / 60,
+            "data_points": count,
+            "time_span_minutes": round(summary["span_seconds"] / 60, 2),
+            "first_reading": datetime.fromtimestamp(summary["first_timestamp"]).isoformat(),
+            "last_reading": datetime.fromtimestamp(summary["last_timestamp"]).isoformat(),
             "averages": {
-                "h2_concentration": round(avg_h2, 2),
-                "water_level_cm": round(avg_water, 2)
+                "h2_concentration": _round(avg_h2),
+                "water_level_cm": _round(water["mean"])
+            },
+            "ranges": {
+                "h2_concentration": {"min": _round(h2["min"]), "max": _round(h2["max"])},
+                "water_level_cm": {"min": _round(water["min"]), "max": _round(water["max"])}
+            },
+            "std_dev": {
+                "h2_concentration": _round(h2["std_dev"]),
+                "water_level_cm": _round(water["std_dev"])
+            },
+            "ewma": {
+                "h2_concentration": _round(h2["ewma"]),
+                "water_level_cm": _round(water["ewma"]),
+                "time_constant_seconds": summary["ewma_seconds"]
             },
             "alerts": {
                 "total_gas_alerts": total_alerts,
-                "alert_rate_percent": round((total_alerts / len(history)) * 100, 2)
+                "alert_rate_percent": round((total_alerts / count) * 100, 2)
             },
             "trends": {
-                "recent_avg_h2": round(recent_avg_h2, 2),
-                "trend": "increasing" if recent_avg_h2 > avg_h2 else "decreasing" if recent_avg_h2 < avg_h2 else "stable"
+                "recent_avg_h2": _round(recent_avg_h2),
+                "recent_std_h2": _round(h2["recent_std_dev"]),
+                "recent_window": summary["recent_window"],
+                "trend": trend
             },
             "mock_mode": self.mock_mode
         }
@@ -0,0 +1,229 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobQueue:
+    """
+    Bounded background worker pool for segmentation jobs.
+    Jobs are queued up to `max_queue`, run on `max_workers` threads and kept
+    for `result_ttl` seconds after finishing so clients can poll them.
+    A job's `job_timeout` counts from submission; a running job cannot be
+    interrupted, so one that overruns is reported as timed out and its
+    result is discarded. A job that times out while still queued never
+    runs; its `on_skip` callback, if any, is called instead.
+    """
+
+    def __init__(self, max_workers=2, max_queue=16, job_timeout=120, result_ttl=600):
+        """Initialize the queue. Worker threads start on the first submit."""
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.result_ttl = result_ttl
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._on_skip = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        self._busy = 0
+
+        self.counters = {
+            "submitted": 0,
+            "rejected": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "timed_out": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Build a queue from JOB_* environment variables."""
+        return cls(
+            max_workers=int(os.getenv("JOB_WORKERS", "2")),
+            max_queue=int(os.getenv("JOB_QUEUE_SIZE", "16")),
+            job_timeout=float(os.getenv("JOB_TIMEOUT_SECONDS", "120")),
+            result_ttl=float(os.getenv("JOB_RESULT_TTL_SECONDS", "600")),
+        )
+
+    def submit(self, fn, *args, on_skip=None, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` and return its job id. `on_skip()` is
+        called if the job times out before it starts (e.g. to release what
+        `fn` would have cleaned up).
+        Raises QueueFullError when the queue is at capacity.
+        """
+        self._start_workers()
+        self._prune()
+
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "submitted_at": now,
+            "deadline": now + self.job_timeout,
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+
+        with self._lock:
+            self._jobs[job_id] = job
+            try:
+                self._queue.put_nowait((job_id, fn, args, kwargs))
+            except queue.Full:
+                del self._jobs[job_id]
+                self.counters["rejected"] += 1
+                raise QueueFullError(
+                    f"Job queue is full ({self.max_queue} jobs waiting)"
+                )
+            if on_skip is not None:
+                self._on_skip[job_id] = on_skip
+            self.counters["submitted"] += 1
+
+        return job_id
+
+    def get(self, job_id):
+        """Return a JSON-serializable snapshot of a job, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._check_deadline(job, time.time())
+            on_skip = self._on_skip.pop(job_id, None) if job["status"] == "timeout" else None
+            snapshot = dict(job)
+        self._call_on_skip(job_id, on_skip)
+
+        snapshot.pop("deadline")
+        for key in ("submitted_at", "started_at", "finished_at"):
+            if snapshot[key] is not None:
+                snapshot[key] = datetime.fromtimestamp(snapshot[key]).isoformat()
+        if snapshot["result"] is None:
+            snapshot.pop("result")
+        if snapshot["error"] is None:
+            snapshot.pop("error")
+        return snapshot
+
+    def stats(self):
+        """Return queue depth, worker usage and job outcome counters."""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.max_queue,
+                "running": self._busy,
+                "workers": self.max_workers,
+                "job_timeout_seconds": self.job_timeout,
+                "tracked_jobs": len(self._jobs),
+                **self.counters,
+            }
+
+    def _start_workers(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop, name=f"job-worker-{i}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            job_id, fn, args, kwargs = self._queue.get()
+            try:
+                self._run(job_id, fn, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id, fn, args, kwargs):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # The job either starts now or never runs
+            on_skip = self._on_skip.pop(job_id, None)
+            skipped = job is None or self._check_deadline(job, time.time())
+            if not skipped:
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                self._busy += 1
+        if skipped:
+            self._call_on_skip(job_id, on_skip)
+            return
+
+        try:
+            result, error = fn(*args, **kwargs), None
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            result, error = None, str(e)
+
+        with self._lock:
+            self._busy -= 1
+            # A job that overran its deadline keeps its timeout status
+            if self._check_deadline(job, time.time()):
+                return
+            job["finished_at"] = time.time()
+            if error is None:
+                job["status"] = "succeeded"
+                job["result"] = result
+                self.counters["succeeded"] += 1
+            else:
+                job["status"] = "failed"
+                job["error"] = error
+                self.counters["failed"] += 1
+
+    def _check_deadline(self, job, now):
+        """
+        Mark an unfinished job as timed out once past its deadline.
+        Returns True if the job is (now) timed out. Lock held.
+        """
+        if job["status"] == "timeout":
+            return True
+        if job["status"] in ("queued", "running") and now > job["deadline"]:
+            job["status"] = "timeout"
+            job["finished_at"] = now
+            job["error"] = f"Job exceeded {self.job_timeout}s timeout"
+            self.counters["timed_out"] += 1
+            return True
+        return False
+
+    def _call_on_skip(self, job_id, on_skip):
+        if on_skip is None:
+            return
+        try:
+            on_skip()
+        except Exception as e:
+            logger.error(f"Cleanup of skipped job {job_id} failed: {str(e)}")
+
+    def _prune(self):
+        """
+        Time out queued jobs past their deadline (calling their on_skip) and
+        forget finished jobs older than result_ttl.
+        """
+        now = time.time()
+        cutoff = now - self.result_ttl
+        with self._lock:
+            skipped = [
+                (job_id, self._on_skip.pop(job_id, None))
+                for job_id, job in self._jobs.items()
+                if job["status"] == "queued" and self._check_deadline(job, now)
+            ]
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None and job["finished_at"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id, on_skip in skipped:
+            self._call_on_skip(job_id, on_skip)
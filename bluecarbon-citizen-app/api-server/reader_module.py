@@ -0,0 +1,263 @@
+import os
+import selectors
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per os.read call while draining a ready device
+READ_CHUNK = 65536
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+class LineParser:
+    """
+    Splits a serial byte stream into lines as bytes arrive. A trailing
+    partial line is kept until the rest of it arrives; a line longer than
+    `max_line` (a device that never sends a newline) is dropped.
+    """
+
+    def __init__(self, max_line=4096):
+        self.max_line = max_line
+        self._partial = b""
+        self.dropped = 0
+
+    def feed(self, data):
+        """Add received bytes and return the complete, non-empty lines they finish."""
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        if len(self._partial) > self.max_line:
+            self._partial = b""
+            self.dropped += 1
+        decoded = []
+        for line in lines:
+            if len(line) > self.max_line:
+                self.dropped += 1
+                continue
+            line = line.decode("utf-8", errors="replace").strip()
+            if line:
+                decoded.append(line)
+        return decoded
+
+
+class _Registration:
+    """A device being read, its serial connection and line parser."""
+
+    def __init__(self, device, connection, max_line):
+        self.device = device
+        self.connection = connection
+        self.parser = LineParser(max_line)
+        self.stop = threading.Event()
+
+
+class SerialReader:
+    """
+    Reads serial devices as their data arrives instead of polling them.
+    One thread blocks in a selector on every registered port (and a wake-up
+    pipe); when a port is readable, everything buffered for it is drained
+    at once, split into lines (keeping a partial line for the next read),
+    and the lines are handed to `device.handle_lines(lines)`, which returns
+    how many of them it rejected (counted as rejected_lines). A read error
+    or hang-up unregisters the device and calls
+    `device.handle_read_error(error)`.
+    Ports that cannot be selected on (Windows) get a thread of their own,
+    blocked in a read.
+    """
+
+    def __init__(self, max_line=4096):
+        """Initialize the reader. Its thread starts with the first device."""
+        self.max_line = max_line
+        self._lock = threading.Lock()
+        self._selector = None
+        self._wake_r = self._wake_w = None
+        self._thread = None
+        self._changes = []
+        self._registrations = {}
+
+        self.counters = {
+            "wakeups": 0,
+            "bytes": 0,
+            "lines": 0,
+            "dropped_lines": 0,
+            "rejected_lines": 0,
+            "read_errors": 0,
+        }
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def shared(cls):
+        """The process-wide reader, so all devices share one reader thread."""
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = cls()
+            return _shared
+
+    def add(self, device, connection):
+        """Start reading `connection` (an open serial.Serial) for `device`."""
+        registration = _Registration(device, connection, self.max_line)
+        with self._lock:
+            self._registrations[device] = registration
+        if not self._selectable(connection):
+            threading.Thread(
+                target=self._read_blocking, args=(registration,),
+                name=f"iot-reader-{device.device_id}", daemon=True,
+            ).start()
+            return
+        self._change("add", registration)
+
+    def remove(self, device):
+        """Stop reading `device`. Returns once its port is no longer read."""
+        with self._lock:
+            registration = self._registrations.pop(device, None)
+        if registration is None:
+            return
+        registration.stop.set()
+        if self._selectable(registration.connection):
+            # Wait so the caller can close the port without the selector
+            # still watching its file descriptor
+            self._change("remove", registration).wait(timeout=5)
+
+    def __len__(self):
+        return len(self._registrations)
+
+    @staticmethod
+    def _selectable(connection):
+        return os.name == "posix" and hasattr(connection, "fileno")
+
+    def _change(self, action, registration):
+        """Queue a selector change for the reader thread and wake it up."""
+        done = threading.Event()
+        with self._lock:
+            if self._thread is None:
+                self._selector = selectors.DefaultSelector()
+                self._wake_r, self._wake_w = os.pipe()
+                os.set_blocking(self._wake_r, False)
+                self._selector.register(self._wake_r, selectors.EVENT_READ)
+                self._thread = threading.Thread(target=self._run, name="iot-reader", daemon=True)
+                self._thread.start()
+            self._changes.append((action, registration, done))
+        os.write(self._wake_w, b"x")
+        return done
+
+    def _apply_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for action, registration, done in changes:
+            try:
+                if action == "add":
+                    self._selector.register(
+                        registration.connection.fileno(), selectors.EVENT_READ, registration
+                    )
+                else:
+                    self._selector.unregister(registration.connection.fileno())
+            except (KeyError, ValueError, OSError) as e:
+                if action == "add":
+                    self._fail(registration, e)
+            done.set()
+
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.fileobj == self._wake_r:
+                    try:
+                        os.read(self._wake_r, READ_CHUNK)
+                    except BlockingIOError:
+                        pass
+                    self._apply_changes()
+                elif not key.data.stop.is_set():
+                    self._drain(key.data)
+
+    def _drain(self, registration):
+        """Read everything buffered for a ready port and pass on the complete lines."""
+        fd = registration.connection.fileno()
+        chunks = []
+        error = None
+        while True:
+            try:
+                chunk = os.read(fd, READ_CHUNK)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                error = e
+                break
+            if not chunk:
+                error = EOFError("serial port closed")
+                break
+            chunks.append(chunk)
+            if len(chunk) < READ_CHUNK:
+                break
+
+        if chunks:
+            self._deliver(registration, b"".join(chunks))
+        if error is not None:
+            try:
+                self._selector.unregister(fd)
+            except (KeyError, ValueError, OSError):
+                pass
+            self._fail(registration, error)
+
+    def _read_blocking(self, registration):
+        """Read one port on a thread of its own, for ports that cannot be selected on."""
+        connection = registration.connection
+        while not registration.stop.is_set():
+            try:
+                # Blocks for the first byte (up to the port timeout), then
+                # takes whatever else is buffered
+                data = connection.read(connection.in_waiting or 1)
+            except Exception as e:
+                if not registration.stop.is_set():
+                    self._fail(registration, e)
+                return
+            if data:
+                self._deliver(registration, data)
+
+    def _deliver(self, registration, data):
+        lines = registration.parser.feed(data)
+        with self._lock:
+            self.counters["wakeups"] += 1
+            self.counters["bytes"] += len(data)
+            self.counters["lines"] += len(lines)
+            self.counters["dropped_lines"] += registration.parser.dropped
+        registration.parser.dropped = 0
+        if lines:
+            rejected = 0
+            try:
+                rejected = registration.device.handle_lines(lines)
+            except Exception as e:
+                logger.error(f"Error handling data from {registration.device.device_id}: {str(e)}")
+            if rejected:
+                with self._lock:
+                    self.counters["rejected_lines"] += rejected
+
+    def _fail(self, registration, error):
+        with self._lock:
+            self.counters["read_errors"] += 1
+            if self._registrations.get(registration.device) is registration:
+                del self._registrations[registration.device]
+        registration.stop.set()
+        logger.error(f"Serial read failed for {registration.device.device_id}: {str(error)}")
+        registration.device.handle_read_error(error)
+
+    def stats(self):
+        """Return read counters and the number of ports being read."""
+        with self._lock:
+            return {**self.counters, "devices": len(self._registrations)}
+
+    def _after_fork(self):
+        # The reader thread, selector and pipe belong to the parent; read the
+        # parent's devices again in the child, which has its own copies
+        registrations = list(self._registrations.values())
+        self._lock = threading.Lock()
+        self._selector = None
+        self._wake_r = self._wake_w = None
+        self._thread = None
+        self._changes = []
+        self._registrations = {}
+        for registration in registrations:
+            if not registration.stop.is_set():
+                self.add(registration.device, registration.connection)
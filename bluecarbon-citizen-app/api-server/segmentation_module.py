@@ -1,33 +1,55 @@
-from roboflow import Roboflow
 import supervision as sv
 import cv2
 import numpy as np
 from dotenv import load_dotenv
 import os
+import tempfile
 from datetime import datetime
 import logging
+from cache_module import InferenceCache
+from client_module import InferenceUnavailableError
+from encoding_module import OutputOptions
+from metrics_module import IMAGE_MEGAPIXELS, OUTPUT_BYTES, StageTimer
+from inference_module import ImageSource, RoboflowBackend, create_backend
+from tiling_module import ImageTooLargeError, TiledPredictor
 
 logger = logging.getLogger(__name__)
 
+# Smallest long side to keep when decoding at reduced resolution for health
+# statistics in predict_only
+HEALTH_MIN_DIMENSION = int(os.getenv("HEALTH_MIN_DIMENSION", "1024"))
 
 class SegmentationModel:
     """
-    Handles image segmentation using Roboflow model.
+    Handles image segmentation using a pluggable inference backend
+    (hosted Roboflow model by default).
     Includes grass stress detection (Healthy / Stressed).
     """
 
-    def __init__(self):
-        """Initialize the segmentation model."""
+    def __init__(self, model=None, cache=None, backend=None):
+        """
+        Initialize the segmentation model.
+        `backend` is an InferenceBackend; by default it is chosen by the
+        SEGMENTATION_BACKEND environment variable (hosted Roboflow or a local
+        ONNX model). `model` may instead be any object with the Roboflow
+        `predict(image, confidence)` interface (e.g. a local stub).
+        `cache` defaults to an InferenceCache configured from the environment.
+        """
         load_dotenv()
         self.api_key = os.getenv("ROBOFLOW_API_KEY")
 
-        if not self.api_key:
-            raise ValueError("ROBOFLOW_API_KEY not found in environment variables")
+        if backend is None:
+            if model is not None:
+                backend = RoboflowBackend(api_key=self.api_key, model=model)
+            else:
+                backend = create_backend(api_key=self.api_key)
+        self.backend = backend
+
+        self.model_version = self.backend.version
+        self.cache = cache if cache is not None else InferenceCache.from_env()
 
-        # Initialize Roboflow
-        self.rf = Roboflow(api_key=self.api_key)
-        self.project = self.rf.workspace().project("segmentation-sohpz")
-        self.model = self.project.version(9).model
+        # Tiled inference for large orthomosaics (see infer(tiled=...))
+        self.tiler = TiledPredictor.from_env(self.backend)
 
         # Mask annotator (label annotator is recreated dynamically per image)
         self.mask_annotator = sv.MaskAnnotator(
@@ -42,17 +64,10 @@ class SegmentationModel:
         """
         try:
             return {
-                "status": "loaded",
-                "workspace": self.project.workspace.name
-                if hasattr(self.project, "workspace")
-                else "unknown",
-                "project": self.project.name
-                if hasattr(self.project, "name")
-                else "segmentation-sohpz",
-                "version": "9",
+                "status": "degraded" if getattr(self.backend, "degraded", False) else "loaded",
                 "model_type": "segmentation",
-                "api_key_status": "configured" if self.api_key else "missing",
-                "classes": ["grass"],  # Add your actual classes here
+                **self.backend.info(),
+                "cache": self.cache.stats(),
                 "timestamp": datetime.now().isoformat(),
             }
         except Exception as e:
@@ -63,6 +78,26 @@ class SegmentationModel:
                 "timestamp": datetime.now().isoformat(),
             }
 
+    def warm_up(self, image_path, confidence=50):
+        """
+        Run one full prediction (model call, annotation and the
+        predict_only path) on a sample image so lazily initialized code
+        paths and connections are ready before real requests arrive.
+        The annotated output is discarded. Returns the elapsed milliseconds.
+        """
+        start = datetime.now()
+        with open(image_path, "rb") as f:
+            data = f.read()
+
+        with tempfile.TemporaryDirectory() as output_folder:
+            inference = self.infer(data, confidence, os.path.basename(image_path))
+            self.annotate(inference, output_folder)
+            self.classify(inference)
+
+        elapsed = (datetime.now() - start).total_seconds() * 1000
+        logger.info(f"Warm-up on {image_path} took {elapsed:.0f} ms")
+        return round(elapsed, 1)
+
     def classify_grass_health(self, mask, img):
         """
         Classify grass health based on average green ratio.
@@ -73,113 +108,508 @@ class SegmentationModel:
             return "Unknown"
 
         avg_b, avg_g, avg_r = np.mean(grass_pixels, axis=0)
-        green_ratio = avg_g / (avg_r + 1e-6)
-
-        return "Healthy" if green_ratio > 1.2 else "Stressed"
+        return self._health_from_means(avg_g, avg_r)
 
-    def predict_and_annotate(self, image_path, confidence=50, output_folder="outputs"):
+    def classify_polygon_health(self, points, img):
         """
-        Run prediction, annotate image, and classify grass health.
-        Ensures labels are dynamically scaled and stay inside image.
+        Classify grass health for a single polygon without a full-size mask.
+        The polygon is rasterized only inside its bounding box (clamped to
+        the image) and the channel means are taken from a view of that crop.
         """
-        try:
-            # Run prediction
-            result = self.model.predict(image_path, confidence=confidence).json()
-            detections = sv.Detections.from_inference(result)
-
-            # Load original image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise Exception("Failed to load image")
-
-            h, w = image.shape[:2]
-
-            # Dynamic scaling based on image size
-            scale_factor = max(h, w) / 1000
-            text_scale = 1.0 * scale_factor
-            text_thickness = max(1, int(2 * scale_factor))
-            text_padding = max(4, int(6 * scale_factor))
-
-            # Reinitialize label annotator dynamically
-            label_annotator = sv.LabelAnnotator(
-                text_scale=text_scale,
-                text_thickness=text_thickness,
-                text_padding=text_padding,
-            )
+        if len(points) == 0:
+            return "Unknown"
 
-            # Build labels (add stress detection for grass)
-            labels = []
-            safe_boxes = []
+        h, w = img.shape[:2]
+        x0, y0 = (max(int(v), 0) for v in points.min(axis=0))
+        x1, y1 = (int(v) + 1 for v in points.max(axis=0))
+        x1, y1 = min(x1, w), min(y1, h)
 
-            # Estimate label height (adjust multiplier if needed)
-            label_height = int(
-                (text_scale * 20) + text_padding * 2 + text_thickness * 2
-            )
+        if x0 >= x1 or y0 >= y1:
+            return "Unknown"
+
+        roi = img[y0:y1, x0:x1]
+        mask = np.zeros(roi.shape[:2], dtype=np.uint8)
+        cv2.fillPoly(mask, [points], 255, offset=(-x0, -y0))
+
+        if cv2.countNonZero(mask) == 0:
+            return "Unknown"
 
-            for i, pred in enumerate(result["predictions"]):
-                class_name = pred["class"]
-                label = f"{class_name}"
+        avg_b, avg_g, avg_r = cv2.mean(roi, mask=mask)[:3]
+        return self._health_from_means(avg_g, avg_r)
 
-                if class_name.lower() == "grass" and "points" in pred:
-                    points = np.array(
-                        [[p["x"], p["y"]] for p in pred["points"]], dtype=np.int32
+    def classify_grass_health_batch(self, polygons, img, strip_rows=512):
+        """
+        Classify grass health for many polygons in one pass over the image.
+        All polygons are drawn into a single int32 label map and per-instance
+        channel sums and pixel counts come from np.bincount, processed in
+        row strips to bound the temporary buffers.
+        A label map holds one label per pixel, so polygons whose bounding
+        boxes overlap another polygon fall back to classify_polygon_health.
+        """
+        labels = ["Unknown"] * len(polygons)
+        h, w = img.shape[:2]
+
+        boxes = np.zeros((len(polygons), 4), dtype=np.int64)
+        valid = np.zeros(len(polygons), dtype=bool)
+        for i, points in enumerate(polygons):
+            if len(points) == 0:
+                continue
+            x0, y0 = np.maximum(points.min(axis=0), 0)
+            x1, y1 = np.minimum(points.max(axis=0) + 1, (w, h))
+            if x0 < x1 and y0 < y1:
+                boxes[i] = (x0, y0, x1, y1)
+                valid[i] = True
+
+        # Pairwise bounding-box intersection between valid polygons
+        x0, y0, x1, y1 = boxes.T
+        intersects = (
+            (x0[:, None] < x1[None, :])
+            & (x0[None, :] < x1[:, None])
+            & (y0[:, None] < y1[None, :])
+            & (y0[None, :] < y1[:, None])
+            & valid[:, None]
+            & valid[None, :]
+        )
+        np.fill_diagonal(intersects, False)
+        overlapping = intersects.any(axis=1)
+
+        batch = np.flatnonzero(valid & ~overlapping)
+        if len(batch):
+            ux0, uy0 = boxes[batch, 0].min(), boxes[batch, 1].min()
+            ux1, uy1 = boxes[batch, 2].max(), boxes[batch, 3].max()
+
+            label_map = np.zeros((uy1 - uy0, ux1 - ux0), dtype=np.int32)
+            for label_id, i in enumerate(batch, start=1):
+                cv2.fillPoly(
+                    label_map, [polygons[i]], label_id,
+                    offset=(-int(ux0), -int(uy0)),
+                )
+
+            n = len(batch) + 1
+            counts = np.zeros(n, dtype=np.float64)
+            sums = np.zeros((n, 3), dtype=np.float64)
+            for row in range(uy0, uy1, strip_rows):
+                strip_labels = label_map[row - uy0:row - uy0 + strip_rows].ravel()
+                covered = np.flatnonzero(strip_labels)
+                if len(covered) == 0:
+                    continue
+                strip_labels = strip_labels[covered]
+                strip_pixels = img[row:min(row + strip_rows, uy1), ux0:ux1].reshape(-1, 3)[covered]
+                counts += np.bincount(strip_labels, minlength=n)
+                for channel in range(3):
+                    sums[:, channel] += np.bincount(
+                        strip_labels, weights=strip_pixels[:, channel], minlength=n
                     )
-                    mask = np.zeros(image.shape[:2], dtype=np.uint8)
-                    cv2.fillPoly(mask, [points], 255)
 
-                    health_status = self.classify_grass_health(mask, image)
-                    label = f"{class_name} ({health_status})"
+            for label_id, i in enumerate(batch, start=1):
+                if counts[label_id] > 0:
+                    avg_b, avg_g, avg_r = sums[label_id] / counts[label_id]
+                    labels[i] = self._health_from_means(avg_g, avg_r)
 
-                labels.append(label)
+        for i in np.flatnonzero(valid & overlapping):
+            labels[i] = self.classify_polygon_health(polygons[i], img)
 
-                # Clamp xyxy bounding boxes instead of xywh
-                x1, y1, x2, y2 = detections.xyxy[i]
+        return labels
 
-                # Clamp inside image and ensure enough space for label
-                x1 = max(0, min(int(x1), w - 1))
-                y1 = max(
-                    label_height, min(int(y1), h - 1)
-                )  # Ensure enough space for label
-                x2 = max(0, min(int(x2), w - 1))
-                y2 = max(0, min(int(y2), h - 1))
+    def _infer(self, source, confidence, tiled, timer):
+        """
+        Run the model on an ImageSource, consulting the inference cache first.
+        Returns the raw prediction JSON, the cache key (None when caching is
+        disabled) and the cache entry on a hit.
+        """
+        if not self.cache.enabled:
+            with timer.stage("inference"):
+                return self._predict(source, confidence, tiled), None, None
+
+        model_version = self.model_version
+        if tiled:
+            model_version = f"{model_version}|{self.tiler.signature}"
+        with timer.stage("cache_lookup"):
+            key = InferenceCache.make_key(source.image, confidence, model_version)
+            entry = self.cache.get(key)
+        if entry is not None:
+            return entry["result"], key, entry
+
+        with timer.stage("inference"):
+            result = self._predict(source, confidence, tiled)
+        self.cache.put(key, result)
+        return result, key, None
+
+    def _predict(self, source, confidence, tiled=False):
+        if tiled:
+            return self.tiler.predict(source, confidence)
+        return self.backend.predict(source, confidence)
+
+    def _health_labels(self, predictions, image, scale=1.0):
+        """
+        Build one label per prediction, adding health status for grass.
+        `scale` maps prediction coordinates onto `image` when it was decoded
+        at reduced resolution.
+        """
+        labels = []
+        for pred in predictions:
+            class_name = pred["class"]
+            label = f"{class_name}"
+
+            if class_name.lower() == "grass" and "points" in pred:
+                points = (
+                    np.array([[p["x"], p["y"]] for p in pred["points"]]) * scale
+                ).astype(np.int32).reshape(-1, 2)
+                health_status = self.classify_polygon_health(points, image)
+                label = f"{class_name} ({health_status})"
+
+            labels.append(label)
+        return labels
+
+    def _load_reduced(self, source, result):
+        """
+        Decode the image at the coarsest JPEG-DCT reduction that keeps it at
+        least HEALTH_MIN_DIMENSION pixels on its long side, unless it has
+        already been decoded (in full, or reduced for the model upload).
+        Returns the image and the scale from prediction to image coordinates.
+        """
+        image_info = result.get("image") or {}
+        try:
+            width = float(image_info["width"])
+        except (KeyError, TypeError, ValueError):
+            width = 0
 
-                safe_boxes.append([x1, y1, x2, y2])
+        image = source.decode_reduced(HEALTH_MIN_DIMENSION)
+        scale = image.shape[1] / width if width else 1.0
+        return image, scale
 
-            # Build a new detections object with corrected boxes
-            detections = sv.Detections(
-                xyxy=np.array(safe_boxes, dtype=np.float32),
-                confidence=detections.confidence,
-                class_id=detections.class_id,
-                mask=detections.mask,
-            )
+    def _health_from_means(self, avg_g, avg_r):
+        """Map average green/red channel values to a health label."""
+        green_ratio = avg_g / (avg_r + 1e-6)
+        return "Healthy" if green_ratio > 1.2 else "Stressed"
 
-            # Apply annotations
-            annotated_image = self.mask_annotator.annotate(
-                scene=image, detections=detections
-            )
-            annotated_image = label_annotator.annotate(
-                scene=annotated_image, detections=detections, labels=labels
+    def predict_and_annotate(self, image, confidence=50, output_folder="outputs",
+                             image_name=None, tiled=False, output_options=None,
+                             timer=None):
+        """
+        Run prediction, annotate image, and classify grass health.
+        Ensures labels are dynamically scaled and stay inside image.
+        `image` may be a file path, encoded image bytes or a BGR array; it is
+        decoded once and shared by the model call and the annotation step.
+        `output_options` (OutputOptions) controls how the annotated image is
+        encoded. `timer` (StageTimer) collects the time spent in each stage.
+        """
+        try:
+            return self.annotate(
+                self.infer(image, confidence, image_name, tiled, timer), output_folder,
+                output_options,
             )
 
-            # Generate output filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_name = os.path.splitext(os.path.basename(image_path))[0]
-            output_filename = f"{base_name}_annotated_{timestamp}.jpg"
-            output_path = os.path.join(output_folder, output_filename)
+        except (InferenceUnavailableError, ImageTooLargeError):
+            raise
+        except Exception as e:
+            logger.error(f"Prediction and annotation failed: {str(e)}")
+            raise Exception(f"Prediction and annotation failed: {str(e)}")
 
-            # Save annotated image
-            os.makedirs(output_folder, exist_ok=True)
-            cv2.imwrite(output_path, annotated_image)
+    def predict_and_render(self, image, confidence=50, image_name=None, tiled=False,
+                           output_options=None, timer=None):
+        """
+        Like predict_and_annotate, but keep the annotated image in memory.
+        Returns (response, images) as render() does.
+        """
+        try:
+            return self.render(
+                self.infer(image, confidence, image_name, tiled, timer), output_options
+            )
 
-            return {
+        except (InferenceUnavailableError, ImageTooLargeError):
+            raise
+        except Exception as e:
+            logger.error(f"Prediction and rendering failed: {str(e)}")
+            raise Exception(f"Prediction and rendering failed: {str(e)}")
+
+    def infer(self, image, confidence=50, image_name=None, tiled=False, timer=None,
+              reduced=False):
+        """
+        Run only the model call, the network-bound stage of a prediction.
+        `tiled` splits the image into overlapping tiles run concurrently and
+        merged across seams (True, False or "auto" to tile images whose long
+        side is at least TILE_AUTO_MIN_SIDE).
+        `timer` is a StageTimer carried on to the later stages (a new one by
+        default).
+        `reduced` promises that only classify() follows, so the image is
+        never decoded finer than the health statistics need.
+        Returns an inference context to pass to annotate() or classify().
+        """
+        timer = timer or StageTimer()
+        source = ImageSource(image, image_name, HEALTH_MIN_DIMENSION if reduced else None)
+        if tiled == "auto":
+            tiled = self.tiler.should_tile(source)
+        result, cache_key, cached = self._infer(source, confidence, bool(tiled), timer)
+        return {
+            "source": source,
+            "result": result,
+            "confidence": confidence,
+            "cache_key": cache_key,
+            "cached": cached,
+            "timer": timer,
+        }
+
+    def annotate(self, inference, output_folder="outputs", output_options=None):
+        """
+        Annotate the image of an inference context (the CPU-bound stage),
+        write it to `output_folder` and return the prediction response.
+        The image is encoded from memory as set by `output_options`
+        (default: full-resolution JPEG), with an optional thumbnail encoded
+        from the same annotated buffer.
+        """
+        options = output_options or OutputOptions()
+        response, images = self.render(inference, options)
+        timer = inference["timer"]
+
+        # Generate output filename
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_name = os.path.splitext(inference["source"].name)[0]
+        output_filename = f"{base_name}_annotated_{timestamp}{options.extension}"
+        output_path = os.path.join(output_folder, output_filename)
+        os.makedirs(output_folder, exist_ok=True)
+
+        with timer.stage("write"):
+            with open(output_path, "wb") as f:
+                f.write(images["annotated"])
+            response["annotated_image_path"] = output_path
+
+            if "thumbnail" in images:
+                thumbnail_path = os.path.join(
+                    output_folder, f"{base_name}_annotated_{timestamp}_thumb{options.extension}"
+                )
+                with open(thumbnail_path, "wb") as f:
+                    f.write(images["thumbnail"])
+                response["thumbnail"]["path"] = thumbnail_path
+
+        return response
+
+    def render(self, inference, output_options=None):
+        """
+        Annotate and encode the image of an inference context in memory,
+        without writing anything to disk.
+        Returns (response, images): the prediction response without file
+        paths, and a dict with the encoded "annotated" image and, if
+        requested, its "thumbnail".
+        """
+        source = inference["source"]
+        result = inference["result"]
+        confidence = inference["confidence"]
+        cache_key = inference["cache_key"]
+        cached = inference["cached"]
+        timer = inference["timer"]
+        options = output_options or OutputOptions()
+
+        # Reuse a cached annotated image for the same content (only the
+        # default encoding is cached)
+        if cached is not None and "annotated" in cached and options.is_default:
+            return self._with_tiling(result, {
                 "success": True,
-                "labels": labels,
-                "annotated_image_path": output_path,
+                "labels": cached["labels"],
                 "raw_predictions": result["predictions"],
                 "confidence_threshold": confidence,
+                "cached": True,
+                "output": {
+                    "format": options.format,
+                    "quality": options.quality,
+                    "progressive": options.progressive,
+                    "bytes": len(cached["annotated"]),
+                },
                 "timestamp": datetime.now().isoformat(),
-            }
+            }), {"annotated": cached["annotated"]}
+
+        # Load original image (annotation draws in place, so never on the
+        # caller's own array or the source's decode, which classify() and
+        # the tiler may still read)
+        with timer.stage("decode"):
+            image = source.decode().copy()
+
+        h, w = image.shape[:2]
+        IMAGE_MEGAPIXELS.observe(h * w / 1e6)
+
+        # Dynamic scaling based on image size
+        scale_factor = max(h, w) / 1000
+        text_scale = 1.0 * scale_factor
+        text_thickness = max(1, int(2 * scale_factor))
+        text_padding = max(4, int(6 * scale_factor))
+
+        # Reinitialize label annotator dynamically
+        label_annotator = sv.LabelAnnotator(
+            text_scale=text_scale,
+            text_thickness=text_thickness,
+            text_padding=text_padding,
+        )
+
+        # Build labels (add stress detection for grass)
+        safe_boxes = []
 
+        # Estimate label height (adjust multiplier if needed)
+        label_height = int(
+            (text_scale * 20) + text_padding * 2 + text_thickness * 2
+        )
+
+        predictions = result["predictions"]
+        with timer.stage("health"):
+            labels = self._health_labels(predictions, image)
+
+        for pred in predictions:
+            # Clamp xyxy bounding boxes instead of xywh
+            x1 = pred["x"] - pred["width"] / 2
+            y1 = pred["y"] - pred["height"] / 2
+            x2 = x1 + pred["width"]
+            y2 = y1 + pred["height"]
+
+            # Clamp inside image and ensure enough space for label
+            x1 = max(0, min(int(x1), w - 1))
+            y1 = max(
+                label_height, min(int(y1), h - 1)
+            )  # Ensure enough space for label
+            x2 = max(0, min(int(x2), w - 1))
+            y2 = max(0, min(int(y2), h - 1))
+
+            safe_boxes.append([x1, y1, x2, y2])
+
+        # Build the detections for the label annotator from the corrected
+        # boxes; masks are composited separately and never stacked
+        detections = sv.Detections(
+            xyxy=np.array(safe_boxes, dtype=np.float32).reshape(-1, 4),
+            confidence=np.array([pred["confidence"] for pred in predictions], dtype=np.float32),
+            class_id=np.array([pred.get("class_id", 0) for pred in predictions], dtype=int),
+        )
+
+        # Apply annotations
+        with timer.stage("masks"):
+            annotated_image = self.composite_masks(image, predictions)
+        with timer.stage("labels"):
+            annotated_image = label_annotator.annotate(
+                scene=annotated_image, detections=detections, labels=labels
+            )
+
+        # Encode the annotated image (and thumbnail) from memory
+        with timer.stage("encode"):
+            encoded, output_info = options.encode(annotated_image, options.max_dimension)
+        OUTPUT_BYTES.observe(len(encoded))
+        output_info["original_width"] = w
+        output_info["original_height"] = h
+        images = {"annotated": encoded}
+
+        response = {
+            "success": True,
+            "labels": labels,
+            "raw_predictions": result["predictions"],
+            "confidence_threshold": confidence,
+            "cached": cached is not None,
+            "output": output_info,
+            "timestamp": datetime.now().isoformat(),
+        }
+
+        if options.thumbnail_size:
+            with timer.stage("encode"):
+                images["thumbnail"], response["thumbnail"] = options.encode(
+                    annotated_image, options.thumbnail_size
+                )
+
+        if cache_key and self.cache.store_annotated and options.is_default:
+            self.cache.put(cache_key, result, labels, encoded)
+
+        return self._with_tiling(result, response), images
+
+    def composite_masks(self, image, predictions, strip_rows=1024):
+        """
+        Blend the instance polygons onto `image` in place, with the colours,
+        opacity and draw order (largest first) of self.mask_annotator.
+        Polygons are filled one at a time into an overlay of one row strip,
+        clipped to the instances' horizontal extent, so memory grows with
+        the strip size rather than with instances x image size.
+        """
+        h, w = image.shape[:2]
+        palette = self.mask_annotator.color
+        opacity = self.mask_annotator.opacity
+
+        instances = []
+        for pred in predictions:
+            if len(pred.get("points") or []) < 3:
+                continue
+            points = np.array(
+                [[p["x"], p["y"]] for p in pred["points"]]
+            ).astype(np.int32)
+            class_id = pred.get("class_id", 0)
+            color = palette.by_idx(class_id) if isinstance(palette, sv.ColorPalette) else palette
+            instances.append((cv2.contourArea(points), points, color.as_bgr()))
+        instances.sort(key=lambda instance: instance[0], reverse=True)
+
+        extents = [
+            (points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max())
+            for _, points, _ in instances
+        ]
+        for top in range(0, h, strip_rows):
+            bottom = min(top + strip_rows, h)
+            in_strip = [
+                i for i, (_, y0, _, y1) in enumerate(extents)
+                if y0 < bottom and y1 >= top
+            ]
+            if not in_strip:
+                continue
+
+            left = max(0, min(extents[i][0] for i in in_strip))
+            right = min(w, max(extents[i][2] for i in in_strip) + 1)
+            if left >= right:
+                continue
+
+            scene = image[top:bottom, left:right]
+            overlay = scene.copy()
+            for i in in_strip:
+                _, points, color = instances[i]
+                cv2.fillPoly(overlay, [points], color, offset=(-left, -top))
+            cv2.addWeighted(overlay, opacity, scene, 1 - opacity, 0, dst=scene)
+
+        return image
+
+    def predict_only(self, image, confidence=50, image_name=None, tiled=False, timer=None):
+        """
+        Run prediction and classify grass health without annotating.
+        Skips the label/mask annotators and image encoding, and decodes the
+        image at reduced resolution just for the green-ratio statistics.
+        """
+        try:
+            return self.classify(
+                self.infer(image, confidence, image_name, tiled, timer, reduced=True)
+            )
+
+        except (InferenceUnavailableError, ImageTooLargeError):
+            raise
         except Exception as e:
-            logger.error(f"Prediction and annotation failed: {str(e)}")
-            raise Exception(f"Prediction and annotation failed: {str(e)}")
+            logger.error(f"Prediction failed: {str(e)}")
+            raise Exception(f"Prediction failed: {str(e)}")
+
+    def classify(self, inference):
+        """
+        Classify grass health for an inference context without annotating,
+        decoding at reduced resolution where possible.
+        """
+        result = inference["result"]
+        timer = inference["timer"]
+        with timer.stage("decode"):
+            image, scale = self._load_reduced(inference["source"], result)
+        IMAGE_MEGAPIXELS.observe(image.shape[0] * image.shape[1] / scale ** 2 / 1e6)
+        with timer.stage("health"):
+            labels = self._health_labels(result["predictions"], image, scale)
+
+        return self._with_tiling(result, {
+            "success": True,
+            "labels": labels,
+            "raw_predictions": result["predictions"],
+            "confidence_threshold": inference["confidence"],
+            "analysis_resolution": {
+                "width": image.shape[1],
+                "height": image.shape[0],
+            },
+            "cached": inference["cached"] is not None,
+            "timestamp": datetime.now().isoformat(),
+        })
+
+    def _with_tiling(self, result, response):
+        """Add the tiling summary of a tiled inference to a response."""
+        if "tiling" in result:
+            response["tiling"] = result["tiling"]
+        return response
@@ -0,0 +1,222 @@
+import copy
+import os
+import pickle
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within the process only
+    fcntl = None
+
+
+class _Call:
+    """One in-flight execution and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it runs wait and receive a copy of its result, or its
+    exception. Nothing is kept once the call finishes: this is not a cache.
+    With `lock_dir`, leaders in different processes (e.g. gunicorn workers)
+    also coalesce: they take an exclusive file lock per key, and a leader
+    that had to wait for another process reuses the result that process
+    left in `lock_dir`, if it finished while this one was waiting.
+    `lock_dir` must be private to the server, as results are pickled.
+    """
+
+    def __init__(self, enabled=True, lock_dir=None, lock_timeout=60, file_ttl=300):
+        """Initialize the call table and, if given, the lock directory."""
+        self.enabled = enabled
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.lock_timeout = lock_timeout
+        self.file_ttl = file_ttl
+
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+        self.counters = {
+            "executions": 0,
+            "coalesced": 0,
+            "cross_process_waits": 0,
+            "cross_process_shared": 0,
+            "lock_timeouts": 0,
+        }
+
+        if lock_dir and fcntl is None:
+            logger.warning("File locks are not available; coalescing within each process only")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, mode=0o700, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_env(cls):
+        """Build from SINGLEFLIGHT_* environment variables."""
+        return cls(
+            enabled=os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true",
+            lock_dir=os.getenv("SINGLEFLIGHT_LOCK_DIR") or None,
+            lock_timeout=float(os.getenv("SINGLEFLIGHT_LOCK_TIMEOUT", "60")),
+        )
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)`, or wait for the identical call in flight.
+        Returns (result, shared): `shared` is True when the result came from
+        another caller's execution.
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.counters["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        try:
+            result, shared = self._run(key, fn, args, kwargs)
+        except Exception as e:
+            call.error = e
+            self._retire(key, call)
+            call.done.set()
+            raise
+        # Followers get copies of a pristine result: the leader's caller
+        # may modify its own (e.g. add URLs)
+        if self._retire(key, call):
+            call.result = copy.deepcopy(result)
+        call.done.set()
+        return result, shared
+
+    def _retire(self, key, call):
+        """Remove a finished call so later callers start anew. Returns its waiter count."""
+        with self._lock:
+            del self._calls[key]
+            return call.waiters
+
+    def _run(self, key, fn, args, kwargs):
+        """Execute as this process's leader, under the file lock if enabled."""
+        if not self.lock_dir:
+            self._count("executions")
+            return fn(*args, **kwargs), False
+
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        result_path = os.path.join(self.lock_dir, f"{key}.result")
+        wait_start = time.time()
+        with open(lock_path, "a+b") as lock_file:
+            locked, waited = self._acquire(lock_file)
+            try:
+                shared = None
+                if waited:
+                    self._count("cross_process_waits")
+                    shared = self._read_result(result_path, wait_start)
+                if shared is not None:
+                    self._count("cross_process_shared")
+                    return shared, True
+
+                self._count("executions")
+                result = fn(*args, **kwargs)
+                self._write_result(result_path, result)
+                return result, False
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._maybe_sweep()
+
+    def _acquire(self, lock_file):
+        """
+        Take the exclusive file lock, giving up after lock_timeout.
+        Returns (locked, waited): whether the lock is held and whether
+        another process held it first.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.utime(lock_file.name)
+                return True, waited
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self._count("lock_timeouts")
+                    logger.warning(f"Timed out waiting for in-flight prediction {lock_file.name}")
+                    return False, waited
+                waited = True
+                time.sleep(0.02)
+
+    def _read_result(self, path, since):
+        """Load a result another process finished after `since`, if any."""
+        try:
+            if os.path.getmtime(path) < since:
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write_result(self, path, result):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.error(f"Failed to share prediction result: {str(e)}")
+
+    def _maybe_sweep(self):
+        """Delete lock and result files unused for file_ttl, at most once a minute."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < 60:
+                return
+            self._last_sweep = now
+
+        cutoff = time.time() - self.file_ttl
+        for name in os.listdir(self.lock_dir):
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        """Return execution and coalescing counters."""
+        with self._lock:
+            return {
+                **self.counters,
+                "enabled": self.enabled,
+                "cross_process": bool(self.lock_dir),
+                "in_flight": len(self._calls),
+            }
+
+    def _after_fork(self):
+        # Calls in flight in the parent never finish in the child
+        self._lock = threading.Lock()
+        self._calls = {}
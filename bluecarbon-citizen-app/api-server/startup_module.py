@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReadyError(Exception):
+    """Raised when the model is requested before it has finished loading."""
+
+    def __init__(self, message, state):
+        super().__init__(message)
+        self.state = state
+
+
+class StartupReport:
+    """Records how long each startup phase took, in milliseconds."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as the phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.phases[name] = round(elapsed, 1)
+
+    def mark(self, name):
+        """Record the time since startup began as the phase `name`."""
+        elapsed = self.elapsed_ms()
+        with self._lock:
+            self.phases[name] = elapsed
+        return elapsed
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self._start) * 1000, 1)
+
+    def to_dict(self):
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "uptime_ms": self.elapsed_ms(),
+            "phases_ms": phases,
+        }
+
+
+class ModelLoader:
+    """
+    Loads the segmentation model off the request path.
+    `factory(report)` builds the model and may time its own sub-phases with
+    `report.phase(...)`. In "background" mode loading starts on a daemon
+    thread as soon as `start()` is called, in "lazy" mode on the first
+    `get()`, and in "eager" mode `start()` blocks until it is done.
+    A failed load is retried on a later `get()` after `retry_interval`.
+    In a forked worker (e.g. gunicorn with preload_app) a loaded model is
+    inherited from the parent; a load that was still running in the parent
+    is restarted in the child, since its thread does not survive the fork.
+    """
+
+    def __init__(self, factory, report=None, mode="background", wait_timeout=30,
+                 retry_interval=30):
+        """Initialize the loader. Nothing is loaded until start() or get()."""
+        if mode not in ("background", "lazy", "eager"):
+            raise ValueError(f"Unknown model loading mode: {mode}")
+
+        self.factory = factory
+        self.report = report or StartupReport()
+        self.mode = mode
+        self.wait_timeout = wait_timeout
+        self.retry_interval = retry_interval
+
+        self.state = "not_started"
+        self.error = None
+        self.loaded_at = None
+        self.load_ms = None
+        self._model = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_env(cls, factory, report=None):
+        """Build a loader from MODEL_* environment variables."""
+        return cls(
+            factory,
+            report=report,
+            mode=os.getenv("MODEL_LOADING", "background").lower(),
+            wait_timeout=float(os.getenv("MODEL_READY_WAIT_SECONDS", "30")),
+            retry_interval=float(os.getenv("MODEL_RETRY_SECONDS", "30")),
+        )
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def start(self):
+        """Begin loading according to the configured mode."""
+        if self.mode == "lazy" or not self._begin():
+            return
+        if self.mode == "eager":
+            self._load()
+        else:
+            threading.Thread(target=self._load, name="model-loader", daemon=True).start()
+
+    def get(self, timeout=None):
+        """
+        Return the loaded model, starting or retrying the load if needed and
+        waiting up to `timeout` (default wait_timeout) seconds for it.
+        Raises ModelNotReadyError if it is still loading or has failed.
+        """
+        if self.state == "ready":
+            return self._model
+
+        if self._begin():
+            threading.Thread(target=self._load, name="model-loader", daemon=True).start()
+
+        self._done.wait(self.wait_timeout if timeout is None else timeout)
+
+        with self._lock:
+            if self.state == "ready":
+                return self._model
+            if self.state == "failed":
+                raise ModelNotReadyError(f"Model failed to load: {self.error}", self.state)
+            raise ModelNotReadyError("Model is still loading", self.state)
+
+    def status(self):
+        """Return the readiness state for health and info endpoints."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self.state == "ready",
+                "mode": self.mode,
+                "error": self.error,
+                "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat()
+                if self.loaded_at else None,
+                "load_ms": self.load_ms,
+            }
+
+    def _after_fork(self):
+        # Locks may have been held by threads that do not exist in the child
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if self.state in ("ready", "failed"):
+            self._done.set()
+        elif self.state == "loading":
+            self.state = "not_started"
+            self.start()
+
+    def _begin(self):
+        """
+        Move to "loading" if a load should start now: not started yet, or
+        failed longer than retry_interval ago. Returns True if so.
+        """
+        with self._lock:
+            if self.state == "failed" and time.time() - self._failed_at < self.retry_interval:
+                return False
+            if self.state not in ("not_started", "failed"):
+                return False
+            self.state = "loading"
+            self.error = None
+            self._done.clear()
+            return True
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            with self.report.phase("model_load"):
+                model = self.factory(self.report)
+        except Exception as e:
+            logger.error(f"Failed to load segmentation model: {str(e)}")
+            with self._lock:
+                self.state = "failed"
+                self.error = str(e)
+                self._failed_at = time.time()
+            self._done.set()
+            return
+
+        with self._lock:
+            self._model = model
+            self.state = "ready"
+            self.loaded_at = time.time()
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+        self._done.set()
+        logger.info(f"Segmentation model ready in {self.load_ms} ms")
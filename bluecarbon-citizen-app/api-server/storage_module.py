@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+import logging
+
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+
+class OutputStore:
+    """
+    Bounded store for annotated images in the output folder.
+    Files expire `ttl` seconds after they are written and the folder is kept
+    under `max_bytes` by deleting the oldest files first. Eviction runs on a
+    background thread every `sweep_interval` seconds, or sooner when a new
+    file takes the store over its size cap; requests only record new files.
+    Several processes (e.g. gunicorn workers) may share the folder: each
+    sweep rescans it, so the byte count is corrected against the files
+    actually on disk.
+    """
+
+    def __init__(self, directory, ttl=86400, max_bytes=1024 * 1024 * 1024,
+                 sweep_interval=300):
+        """Initialize the store. Call start() to begin background eviction."""
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._bytes = 0
+        self._files = 0
+
+        self.counters = {
+            "files_added": 0,
+            "bytes_added": 0,
+            "expired_evictions": 0,
+            "size_evictions": 0,
+            "bytes_evicted": 0,
+            "sweeps": 0,
+            "downloads": 0,
+            "not_modified": 0,
+            "partial": 0,
+        }
+        self.last_sweep = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_env(cls, directory):
+        """Build a store from OUTPUT_* environment variables."""
+        return cls(
+            directory,
+            ttl=float(os.getenv("OUTPUT_TTL_SECONDS", "86400")),
+            max_bytes=int(os.getenv("OUTPUT_MAX_MB", "1024")) * 1024 * 1024,
+            sweep_interval=float(os.getenv("OUTPUT_SWEEP_SECONDS", "300")),
+        )
+
+    def start(self):
+        """Run a first sweep and start the background eviction thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="output-store", daemon=True
+            )
+        self._thread.start()
+
+    def add(self, path):
+        """
+        Record a file written to the store. Wakes the eviction thread if
+        the store is now over its size cap.
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            self._bytes += size
+            self._files += 1
+            self.counters["files_added"] += 1
+            self.counters["bytes_added"] += size
+            over_limit = self._bytes > self.max_bytes
+        if over_limit:
+            self._wake.set()
+
+    def path(self, filename):
+        """
+        Return the path of a stored file, or None if the name is not a file
+        of the store or the file has expired.
+        """
+        path = safe_join(self.directory, filename)
+        if path is None:
+            return None
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if self.ttl > 0 and time.time() - mtime > self.ttl:
+            return None
+        return path
+
+    def remaining_ttl(self, path):
+        """Seconds until a stored file expires (None without a TTL)."""
+        if self.ttl <= 0:
+            return None
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return 0
+        return max(0, int(self.ttl - age))
+
+    def record_download(self, status_code):
+        """Count a download response by status (200, 206 or 304)."""
+        with self._lock:
+            self.counters["downloads"] += 1
+            if status_code == 304:
+                self.counters["not_modified"] += 1
+            elif status_code == 206:
+                self.counters["partial"] += 1
+
+    def sweep(self):
+        """
+        Delete expired files, then the oldest files until the store fits
+        its size cap. Returns the number of files deleted.
+        """
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        expired = evicted = freed = 0
+        kept = len(files)
+        for mtime, size, path in files:
+            is_expired = self.ttl > 0 and now - mtime > self.ttl
+            if not is_expired and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            freed += size
+            kept -= 1
+            if is_expired:
+                expired += 1
+            else:
+                evicted += 1
+
+        with self._lock:
+            self._bytes = total
+            self._files = kept
+            self.counters["expired_evictions"] += expired
+            self.counters["size_evictions"] += evicted
+            self.counters["bytes_evicted"] += freed
+            self.counters["sweeps"] += 1
+            self.last_sweep = now
+
+        if expired or evicted:
+            logger.info(
+                f"Output store: removed {expired} expired and {evicted} files over "
+                f"the size cap ({freed} bytes), {kept} files / {total} bytes kept"
+            )
+        return expired + evicted
+
+    def stats(self):
+        """Return store size, limits and eviction/download counters."""
+        with self._lock:
+            return {
+                "files": self._files,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "sweep_interval_seconds": self.sweep_interval,
+                "last_sweep": self.last_sweep,
+                **self.counters,
+            }
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Output store sweep failed: {str(e)}")
+            self._wake.wait(self.sweep_interval)
+            self._wake.clear()
+
+    def _after_fork(self):
+        # The eviction thread does not survive a fork; restart it in the
+        # child if the parent had started it
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        started = self._thread is not None
+        self._thread = None
+        if started:
+            self.start()
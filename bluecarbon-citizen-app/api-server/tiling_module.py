@@ -0,0 +1,298 @@
+import os
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+
+import cv2
+import numpy as np
+
+from inference_module import ImageSource, image_size
+
+logger = logging.getLogger(__name__)
+
+
+class ImageTooLargeError(ValueError):
+    """Raised for an image with more pixels than tiled inference accepts."""
+
+
+class TiledPredictor:
+    """
+    Runs inference on overlapping tiles of a large image and merges the
+    instances found on either side of a tile seam.
+    Tiles are views into the decoded image, cut only when a worker is free,
+    so at most `2 * concurrency` tiles are being converted or uploaded at a
+    time. No full-resolution masks are built: instances are merged across a
+    seam when, inside the overlap of their two tiles, the smaller mask lies
+    mostly within the other (intersection over smaller). This also joins an
+    instance one tile sees whole with the fragments the other tile sees of
+    it when their connection lies outside the overlap.
+    Neither OpenCV nor Pillow can decode just a region of a JPEG, PNG or
+    TIFF, so the image is decoded whole; images of more than `max_pixels`
+    are rejected from their header before anything is decoded.
+    """
+
+    def __init__(self, backend, tile_size=1024, overlap=128, concurrency=4,
+                 merge_threshold=0.5, auto_min_side=4096, max_pixels=None):
+        """Initialize the predictor. The tile pool is created on first use."""
+        if overlap >= tile_size:
+            raise ValueError("Tile overlap must be smaller than the tile size")
+
+        self.backend = backend
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.concurrency = concurrency
+        self.merge_threshold = merge_threshold
+        self.auto_min_side = auto_min_side
+        self.max_pixels = max_pixels
+
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, backend):
+        """
+        Build a tiled predictor from TILE_* environment variables. TILE_SIZE
+        defaults to the backend's upload size, as larger tiles would only be
+        shrunk to it before inference.
+        """
+        upload_size = getattr(backend, "upload_size", None)
+        tile_size = int(os.getenv("TILE_SIZE") or upload_size or 1024)
+        if upload_size and tile_size > upload_size:
+            logger.warning(
+                f"TILE_SIZE {tile_size} is larger than the upload size {upload_size}; "
+                f"tiles will be shrunk before inference"
+            )
+        return cls(
+            backend,
+            tile_size=tile_size,
+            overlap=int(os.getenv("TILE_OVERLAP", "128")),
+            concurrency=int(os.getenv("TILE_CONCURRENCY", "4")),
+            merge_threshold=float(os.getenv("TILE_MERGE_THRESHOLD", "0.5")),
+            auto_min_side=int(os.getenv("TILE_AUTO_MIN_SIDE", "4096")),
+            max_pixels=int(float(os.getenv("TILE_MAX_MEGAPIXELS", "250")) * 1e6),
+        )
+
+    @property
+    def signature(self):
+        """Tiling parameters that change the result, for cache keys."""
+        return f"tiled:{self.tile_size}:{self.overlap}:{self.merge_threshold}"
+
+    def should_tile(self, source):
+        """Decide "auto" tiling from the image size."""
+        return max(image_size(source)) >= self.auto_min_side
+
+    def windows(self, width, height):
+        """Return (x0, y0, x1, y1) tile windows covering the image."""
+        step = self.tile_size - self.overlap
+
+        def starts(length):
+            if length <= self.tile_size:
+                return [0]
+            positions = list(range(0, length - self.tile_size, step))
+            # Align the last tile with the image edge
+            positions.append(length - self.tile_size)
+            return positions
+
+        return [
+            (x0, y0, min(x0 + self.tile_size, width), min(y0 + self.tile_size, height))
+            for y0 in starts(height)
+            for x0 in starts(width)
+        ]
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="tile-inference"
+                )
+            return self._pool
+
+    def predict(self, source, confidence):
+        """
+        Run the backend on every tile of an ImageSource and return a
+        Roboflow-style response in full-image coordinates, with a "tiling"
+        summary. Raises ImageTooLargeError for images over `max_pixels`.
+        """
+        width, height = image_size(source)
+        if self.max_pixels and width * height > self.max_pixels:
+            raise ImageTooLargeError(
+                f"Image is {width * height / 1e6:.0f} MP; tiled inference accepts at "
+                f"most {self.max_pixels / 1e6:.0f} MP"
+            )
+        image = source.decode()
+        h, w = image.shape[:2]
+        windows = self.windows(w, h)
+        pool = self._executor()
+
+        def run_tile(index, window):
+            x0, y0, x1, y1 = window
+            tile = ImageSource(image[y0:y1, x0:x1], f"{source.name}_tile{index}")
+            result = self.backend.predict(tile, confidence)
+            return index, window, result.get("predictions", [])
+
+        instances = []
+        pending = set()
+        remaining = iter(enumerate(windows))
+        try:
+            while True:
+                # Keep a bounded number of tiles in flight
+                while len(pending) < 2 * self.concurrency:
+                    item = next(remaining, None)
+                    if item is None:
+                        break
+                    pending.add(pool.submit(run_tile, *item))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, window, predictions = future.result()
+                    instances.extend(self._to_instances(index, window, predictions))
+        finally:
+            for future in pending:
+                future.cancel()
+
+        merged = self._merge(instances)
+        logger.info(
+            f"Tiled inference on {w}x{h}: {len(windows)} tiles, "
+            f"{len(instances)} tile instances merged into {len(merged)}"
+        )
+        return {
+            "image": {"width": w, "height": h},
+            "predictions": merged,
+            "tiling": {
+                "tile_size": self.tile_size,
+                "overlap": self.overlap,
+                "tiles": len(windows),
+                "tile_instances": len(instances),
+                "instances": len(merged),
+            },
+        }
+
+    def _to_instances(self, index, window, predictions):
+        """Shift one tile's predictions into full-image coordinates."""
+        x0, y0 = window[:2]
+        instances = []
+        for pred in predictions:
+            points = pred.get("points") or []
+            if len(points) < 3:
+                continue
+            pts = np.array([[p["x"] + x0, p["y"] + y0] for p in points])
+            instances.append({
+                "tile": index,
+                "window": window,
+                "points": np.round(pts).astype(np.int32),
+                "box": np.concatenate([pts.min(axis=0), pts.max(axis=0)]),
+                "class": pred["class"],
+                "class_id": pred.get("class_id", 0),
+                "confidence": pred.get("confidence", 0.0),
+            })
+        return instances
+
+    def _seam_overlap(self, a, b):
+        """
+        Intersection over the smaller mask of two instances from different
+        tiles, measured only inside the region both tiles saw.
+        """
+        wx0 = max(a["window"][0], b["window"][0])
+        wy0 = max(a["window"][1], b["window"][1])
+        wx1 = min(a["window"][2], b["window"][2])
+        wy1 = min(a["window"][3], b["window"][3])
+
+        # Clip to the union of the two boxes as well
+        x0 = int(max(wx0, min(a["box"][0], b["box"][0])))
+        y0 = int(max(wy0, min(a["box"][1], b["box"][1])))
+        x1 = int(min(wx1, max(a["box"][2], b["box"][2]) + 1))
+        y1 = int(min(wy1, max(a["box"][3], b["box"][3]) + 1))
+        if x0 >= x1 or y0 >= y1:
+            return 0.0
+
+        mask_a = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        mask_b = np.zeros_like(mask_a)
+        cv2.fillPoly(mask_a, [a["points"]], 1, offset=(-x0, -y0))
+        cv2.fillPoly(mask_b, [b["points"]], 1, offset=(-x0, -y0))
+
+        smaller = min(cv2.countNonZero(mask_a), cv2.countNonZero(mask_b))
+        if smaller == 0:
+            return 0.0
+        return cv2.countNonZero(mask_a & mask_b) / smaller
+
+    def _merge(self, instances):
+        """
+        Group instances of the same class from different tiles whose masks
+        agree across the seam (union-find), and trace one polygon per group.
+        """
+        n = len(instances)
+        if n == 0:
+            return []
+
+        parent = list(range(n))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        boxes = np.array([inst["box"] for inst in instances])
+        tiles = np.array([inst["tile"] for inst in instances])
+        classes = np.array([inst["class"] for inst in instances])
+
+        for i in range(n - 1):
+            others = np.arange(i + 1, n)
+            candidates = others[
+                (tiles[others] != tiles[i])
+                & (classes[others] == classes[i])
+                & (boxes[others, 0] <= boxes[i, 2])
+                & (boxes[i, 0] <= boxes[others, 2])
+                & (boxes[others, 1] <= boxes[i, 3])
+                & (boxes[i, 1] <= boxes[others, 3])
+            ]
+            for j in candidates:
+                if find(i) != find(j) and \
+                        self._seam_overlap(instances[i], instances[j]) >= self.merge_threshold:
+                    parent[find(j)] = find(i)
+
+        groups = {}
+        for i in range(n):
+            groups.setdefault(find(i), []).append(instances[i])
+
+        merged = []
+        for members in groups.values():
+            prediction = self._union(members)
+            if prediction is not None:
+                merged.append(prediction)
+        return merged
+
+    def _union(self, members):
+        """Trace the union of a group's polygons into one prediction."""
+        best = max(members, key=lambda inst: inst["confidence"])
+        if len(members) == 1:
+            points = best["points"]
+        else:
+            x0, y0 = (int(v) for v in np.min([m["box"][:2] for m in members], axis=0))
+            x1, y1 = (int(v) + 1 for v in np.max([m["box"][2:] for m in members], axis=0))
+            mask = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.uint8)
+            for m in members:
+                cv2.fillPoly(mask, [m["points"]], 1, offset=(-x0, -y0))
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if not contours:
+                return None
+            points = max(contours, key=cv2.contourArea).reshape(-1, 2) + (x0, y0)
+            if len(points) < 3:
+                return None
+
+        px0, py0 = points.min(axis=0)
+        px1, py1 = points.max(axis=0)
+        return {
+            "x": float(px0 + px1) / 2,
+            "y": float(py0 + py1) / 2,
+            "width": float(px1 - px0),
+            "height": float(py1 - py0),
+            "confidence": best["confidence"],
+            "class": best["class"],
+            "class_id": best["class_id"],
+            "detection_id": str(uuid.uuid4()),
+            "points": [{"x": float(x), "y": float(y)} for x, y in points],
+            "tiles": sorted({m["tile"] for m in members}),
+        }
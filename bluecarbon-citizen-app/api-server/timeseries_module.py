@@ -0,0 +1,455 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import logging
+
+from history_module import to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Rollup tiers: name and bucket width in seconds. Buckets are aligned to
+# UTC (days start at 00:00 UTC).
+TIERS = (("1m", 60), ("1h", 3600), ("1d", 86400))
+RESOLUTIONS = ("raw",) + tuple(name for name, _ in TIERS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    device TEXT NOT NULL,
+    ts REAL NOT NULL,
+    h2_conc NUMERIC,
+    h2_alert INTEGER,
+    water_cm NUMERIC,
+    servo_pos INTEGER,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS readings_device_ts ON readings (device, ts);
+CREATE TABLE IF NOT EXISTS device_settings (
+    device TEXT PRIMARY KEY,
+    settings TEXT NOT NULL
+) WITHOUT ROWID;
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS rollup_{name} (
+    device TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    alerts INTEGER NOT NULL,
+    h2_count INTEGER NOT NULL,
+    h2_sum NUMERIC NOT NULL,
+    h2_min NUMERIC,
+    h2_max NUMERIC,
+    water_count INTEGER NOT NULL,
+    water_sum NUMERIC NOT NULL,
+    water_min NUMERIC,
+    water_max NUMERIC,
+    PRIMARY KEY (device, bucket)
+) WITHOUT ROWID;
+""" for name, _ in TIERS)
+
+# Merge a batch's partial aggregate for a bucket into the stored one
+UPSERT = """
+INSERT INTO rollup_{name} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (device, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    alerts = alerts + excluded.alerts,
+    h2_count = h2_count + excluded.h2_count,
+    h2_sum = h2_sum + excluded.h2_sum,
+    h2_min = min(coalesce(h2_min, excluded.h2_min), coalesce(excluded.h2_min, h2_min)),
+    h2_max = max(coalesce(h2_max, excluded.h2_max), coalesce(excluded.h2_max, h2_max)),
+    water_count = water_count + excluded.water_count,
+    water_sum = water_sum + excluded.water_sum,
+    water_min = min(coalesce(water_min, excluded.water_min), coalesce(excluded.water_min, water_min)),
+    water_max = max(coalesce(water_max, excluded.water_max), coalesce(excluded.water_max, water_max))
+"""
+
+
+class InvalidRangeQuery(ValueError):
+    """Raised for a range query with bad bounds or resolution."""
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch).isoformat()
+
+
+def _merge(aggregate, value, prefix_index):
+    """Add one value to the (count, sum, min, max) slice of an aggregate row."""
+    if value is None:
+        return
+    count, total, low, high = aggregate[prefix_index:prefix_index + 4]
+    aggregate[prefix_index:prefix_index + 4] = [
+        count + 1,
+        total + value,
+        value if low is None else min(low, value),
+        value if high is None else max(high, value),
+    ]
+
+
+class TimeSeriesStore:
+    """
+    Persistent store for IoT readings in SQLite (WAL mode).
+    append() only buffers a reading; a background thread writes buffered
+    readings every `flush_interval` seconds, or as soon as `batch_size` are
+    waiting, in one transaction. The same transaction merges them into
+    1-minute, 1-hour and 1-day rollups (count, alert count, min/max/sum of
+    h2_conc and water_cm), so rollups are maintained incrementally and
+    range queries over long periods read only the coarse tier.
+    Raw readings and the finer tiers are pruned after their retention.
+    Readers use their own connections, which WAL lets run alongside the
+    writer.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, retention_days=None,
+                 max_points=1500, max_rows=100000):
+        """
+        Open (or create) the database. Call start() to begin writing.
+        `retention_days` maps "raw", "1m", "1h" and "1d" to days kept (None
+        keeps forever); `max_points` bounds the points an automatic-
+        resolution query returns and `max_rows` any query.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = {"raw": 7, "1m": 90, "1h": 730, "1d": None}
+        self.retention_days.update(retention_days or {})
+        self.max_points = max_points
+        self.max_rows = max_rows
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+        self.counters = {
+            "appended": 0,
+            "written": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "pruned": 0,
+        }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_env(cls, default_path):
+        """
+        Build a store from IOT_DB_* environment variables, or return None if
+        IOT_DB_ENABLED is false.
+        """
+        if os.getenv("IOT_DB_ENABLED", "true").lower() != "true":
+            return None
+
+        def days(name, default):
+            value = os.getenv(name, default)
+            return float(value) if value else None
+
+        return cls(
+            os.getenv("IOT_DB_PATH") or default_path,
+            batch_size=int(os.getenv("IOT_DB_BATCH_SIZE", "500")),
+            flush_interval=float(os.getenv("IOT_DB_FLUSH_SECONDS", "1")),
+            retention_days={
+                "raw": days("IOT_DB_RAW_RETENTION_DAYS", "7"),
+                "1m": days("IOT_DB_MINUTE_RETENTION_DAYS", "90"),
+                "1h": days("IOT_DB_HOUR_RETENTION_DAYS", "730"),
+            },
+            max_points=int(os.getenv("IOT_RANGE_MAX_POINTS", "1500")),
+        )
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self):
+        """Connection of the calling thread, for queries."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def start(self):
+        """Start the background writer thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="iot-store", daemon=True)
+        self._thread.start()
+
+    def append(self, device, reading):
+        """Buffer one reading dict of `device` for the next batch write."""
+        row = (
+            device,
+            to_epoch(reading.get("timestamp")),
+            reading.get("h2_conc"),
+            reading.get("h2_alert"),
+            reading.get("water_cm"),
+            reading.get("servo_pos"),
+            reading.get("status"),
+        )
+        with self._lock:
+            self._pending.append(row)
+            self.counters["appended"] += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        connection = self._connect()
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush(connection)
+        connection.close()
+
+    def flush(self, connection=None):
+        """Write the buffered readings and update the rollups in one transaction."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        own_connection = connection is None
+        connection = connection or self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                for name, seconds in TIERS:
+                    connection.executemany(UPSERT.format(name=name), self._rollup(rows, seconds))
+            with self._lock:
+                self.counters["written"] += len(rows)
+                self.counters["flushes"] += 1
+            self._maybe_prune(connection)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(rows)} IoT readings: {str(e)}")
+            with self._lock:
+                self.counters["flush_errors"] += 1
+                # Keep them for the next attempt, up to ten batches
+                self._pending = (rows + self._pending)[-10 * self.batch_size:]
+            return 0
+        finally:
+            if own_connection:
+                connection.close()
+        return len(rows)
+
+    @staticmethod
+    def _rollup(rows, seconds):
+        """Aggregate a batch of rows into one partial row per (device, bucket)."""
+        aggregates = {}
+        for device, ts, h2_conc, h2_alert, water_cm, _, _ in rows:
+            key = (device, int(ts // seconds) * seconds)
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                aggregate = aggregates[key] = [*key, 0, 0, 0, 0.0, None, None, 0, 0.0, None, None]
+            aggregate[2] += 1
+            aggregate[3] += 1 if h2_alert == 1 else 0
+            _merge(aggregate, h2_conc, 4)
+            _merge(aggregate, water_cm, 8)
+        return aggregates.values()
+
+    def _maybe_prune(self, connection):
+        """Delete rows past their tier's retention, at most once an hour."""
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+
+        pruned = 0
+        with connection:
+            for tier, days in self.retention_days.items():
+                if days is None:
+                    continue
+                cutoff = now - days * 86400
+                if tier == "raw":
+                    cursor = connection.execute("DELETE FROM readings WHERE ts < ?", (cutoff,))
+                else:
+                    cursor = connection.execute(
+                        f"DELETE FROM rollup_{tier} WHERE bucket < ?", (cutoff,)
+                    )
+                pruned += cursor.rowcount
+        with self._lock:
+            self.counters["pruned"] += pruned
+
+    def choose_resolution(self, device, start, end):
+        """
+        Pick the finest resolution whose data covers `start` and returns at
+        most `max_points` points: raw readings or the first rollup tier with
+        few enough buckets. The raw count is estimated from the hourly
+        rollup (rounded out to whole hours) rather than counted.
+        """
+        now = time.time()
+        retention = self.retention_days
+        if retention["raw"] is None or start >= now - retention["raw"] * 86400:
+            (count,) = self._reader().execute(
+                "SELECT coalesce(sum(count), 0) FROM rollup_1h "
+                "WHERE device = ? AND bucket >= ? AND bucket < ?",
+                (device, int(start // 3600) * 3600, end),
+            ).fetchone()
+            if count <= self.max_points:
+                return "raw"
+        for name, seconds in TIERS:
+            days = retention.get(name)
+            covered = days is None or start >= now - days * 86400
+            if covered and (end - start) / seconds <= self.max_points:
+                return name
+        return TIERS[-1][0]
+
+    def query_range(self, device, start, end, resolution="auto"):
+        """
+        Return the readings of `device` in [start, end) (epoch seconds) at
+        `resolution` ("raw", "1m", "1h", "1d" or "auto") as a dict with the
+        resolution used and its points: reading dicts for raw data, per-
+        bucket count, alerts and min/max/mean of each field for rollups.
+        """
+        if end <= start:
+            raise InvalidRangeQuery("end must be after start")
+        if resolution == "auto":
+            resolution = self.choose_resolution(device, start, end)
+        if resolution not in RESOLUTIONS:
+            raise InvalidRangeQuery(
+                f"Unsupported resolution: {resolution}. "
+                f"Supported: auto, {', '.join(RESOLUTIONS)}"
+            )
+
+        connection = self._reader()
+        if resolution == "raw":
+            rows = connection.execute(
+                "SELECT ts, h2_conc, h2_alert, water_cm, servo_pos, status FROM readings "
+                "WHERE device = ? AND ts >= ? AND ts < ? ORDER BY ts LIMIT ?",
+                (device, start, end, self.max_rows + 1),
+            ).fetchall()
+            points = [self._raw_point(row) for row in rows[:self.max_rows]]
+        else:
+            seconds = dict(TIERS)[resolution]
+            rows = connection.execute(
+                f"SELECT bucket, count, alerts, h2_count, h2_sum, h2_min, h2_max, "
+                f"water_count, water_sum, water_min, water_max FROM rollup_{resolution} "
+                f"WHERE device = ? AND bucket >= ? AND bucket < ? ORDER BY bucket LIMIT ?",
+                (device, int(start // seconds) * seconds, end, self.max_rows + 1),
+            ).fetchall()
+            points = [self._rollup_point(row) for row in rows[:self.max_rows]]
+
+        return {
+            "resolution": resolution,
+            "points": points,
+            "truncated": len(rows) > self.max_rows,
+        }
+
+    def readings_since(self, device, after=0, limit=1000):
+        """
+        Return the newest `limit` readings of `device` written after row id
+        `after`, oldest first, and the id of the last one (`after` if none),
+        so another process can follow what is being recorded.
+        """
+        rows = self._reader().execute(
+            "SELECT rowid, ts, h2_conc, h2_alert, water_cm, servo_pos, status FROM readings "
+            "WHERE device = ? AND rowid > ? ORDER BY rowid DESC LIMIT ?",
+            (device, after, limit),
+        ).fetchall()
+        if not rows:
+            return [], after
+        rows.reverse()
+        return [self._raw_point(row[1:]) for row in rows], rows[-1][0]
+
+    def get_settings(self, device):
+        """Return the settings stored for `device` (a dict, empty if none)."""
+        row = self._reader().execute(
+            "SELECT settings FROM device_settings WHERE device = ?", (device,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def put_settings(self, device, **settings):
+        """Merge `settings` into those stored for `device`, for every process to see."""
+        connection = self._reader()
+        with connection:
+            connection.execute(
+                "INSERT INTO device_settings VALUES (?, ?) ON CONFLICT (device) "
+                "DO UPDATE SET settings = json_patch(settings, excluded.settings)",
+                (device, json.dumps(settings)),
+            )
+
+    @staticmethod
+    def _raw_point(row):
+        ts, h2_conc, h2_alert, water_cm, servo_pos, status = row
+        point = {
+            "h2_conc": h2_conc,
+            "h2_alert": h2_alert,
+            "water_cm": water_cm,
+            "servo_pos": servo_pos,
+            "status": status,
+        }
+        point = {name: value for name, value in point.items() if value is not None}
+        point["timestamp"] = _iso(ts)
+        return point
+
+    @staticmethod
+    def _rollup_point(row):
+        (bucket, count, alerts, h2_count, h2_sum, h2_min, h2_max,
+         water_count, water_sum, water_min, water_max) = row
+        return {
+            "timestamp": _iso(bucket),
+            "count": count,
+            "alerts": alerts,
+            "h2_conc": {
+                "min": h2_min,
+                "max": h2_max,
+                "mean": round(h2_sum / h2_count, 2) if h2_count else None,
+            },
+            "water_cm": {
+                "min": water_min,
+                "max": water_max,
+                "mean": round(water_sum / water_count, 2) if water_count else None,
+            },
+        }
+
+    def stats(self):
+        """Return write counters, the pending batch size and the database size."""
+        with self._lock:
+            counters = dict(self.counters)
+            pending = len(self._pending)
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        return {
+            **counters,
+            "pending": pending,
+            "db_bytes": size,
+            "path": self.path,
+            "retention_days": self.retention_days,
+        }
+
+    def close(self):
+        """Stop the writer thread and write what is still buffered."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _after_fork(self):
+        # The writer thread and connections belong to the parent; readings
+        # buffered there are the parent's to write. Restart the writer in
+        # the child if the parent had started it
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._local = threading.local()
+        self._pending = []
+        started = self._thread is not None
+        self._thread = None
+        if started:
+            self.start()
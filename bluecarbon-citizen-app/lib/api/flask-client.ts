@@ -7,6 +7,21 @@ export const flaskAPI = {
     return res.json();
   },
 
+  // Same as uploadImage, but the annotated image comes back in the same
+  // response (response_format=multipart) instead of needing a /download request
+  uploadImageInline: async (formData: FormData) => {
+    formData.set("response_format", "multipart");
+    const res = await fetch(`${API_BASE}/predict`, { method: "POST", body: formData });
+    const contentType = res.headers.get("Content-Type") || "";
+    if (!contentType.startsWith("multipart/form-data")) {
+      return { result: await res.json(), imageUrl: null };
+    }
+    const parts = await res.formData();
+    const result = JSON.parse(parts.get("result") as string);
+    const image = parts.get("annotated_image") as Blob | null;
+    return { result, imageUrl: image ? URL.createObjectURL(image) : null };
+  },
+
   connectIoT: async (port?: string) => {
     const res = await fetch(`${API_BASE}/iot/connect`, {
       method: "POST",